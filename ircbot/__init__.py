@@ -17,18 +17,24 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
 __author__ = 'Fenix'
-__version__ = '1.8'
+__version__ = '1.9'
 
 import b3
 import b3.plugin
 import b3.events
+import os
+import socket
 
 from b3.functions import getCmd
 from b3.functions import minutesStr
+from ConfigParser import NoOptionError
 from ConfigParser import NoSectionError
 from threading import Thread
+from time import time
 from xml.dom import minidom
 from .bot import IRCBot
+from .exporter import IRCMetricsExporter
+from .perform import IRCPerformCommand
 from .colors import *
 
 
@@ -39,6 +45,7 @@ class IrcbotPlugin(b3.plugin.Plugin):
     adminPlugin = None  # Admin Plugin object instance
     pthread = None      # separate thread executing the IRC BOT main loop
     ircbot = None       # IRC BOT object instance
+    exporter = None     # metrics endpoint (if enabled)
 
     serverinfo = {
         'ip': '',
@@ -48,14 +55,32 @@ class IrcbotPlugin(b3.plugin.Plugin):
     settings = {
         'dev': False,
         'nickname': '',
-        'interval': 1,
         'listen_global': True,
+        'coordinate': False,
         'showbans': True,
         'showkicks': True,
         'showgame': True,
+        'lag_degraded': 2.0,
+        'lag_critical': 5.0,
+        'outage_size': 100,
+        'outage_file': '',
+        'metrics_listen': '',
+        'trace_rate': 0.1,
+        'trace_interval': 300,
+        'capture_file': '',
+        'profile_dir': '',
+        'profile_top': 30,
+        'slow_command': 1.0,
         'address': '',
         'port': 6667,
-        'maxrate': 1,
+        'servers': [],
+        'maxrate': 1.0,
+        'burst': 5,
+        'senders': 0,
+        'senders_mode': 'channel',
+        'relay': '',
+        'timeout': 10,
+        'keepalive': 15,
         'channel': '',
         'perform': [],
     }
@@ -85,14 +110,46 @@ class IrcbotPlugin(b3.plugin.Plugin):
             self.settings['dev'] = self.getSetting('settings', 'dev', b3.BOOL, self.settings['dev'])
 
         self.settings['nickname'] = self.getSetting('settings', 'nickname', b3.STR, self.settings['nickname'])
-        self.settings['interval'] = self.getSetting('settings', 'interval', b3.INT, self.settings['interval'])
         self.settings['listen_global'] = self.getSetting('settings', 'listen_global', b3.BOOL, self.settings['listen_global'])
+        self.settings['coordinate'] = self.getSetting('settings', 'coordinate', b3.BOOL, self.settings['coordinate'])
         self.settings['showbans'] = self.getSetting('settings', 'showbans', b3.BOOL, self.settings['showbans'])
         self.settings['showkicks'] = self.getSetting('settings', 'showkicks', b3.BOOL, self.settings['showkicks'])
         self.settings['showgame'] = self.getSetting('settings', 'showgame', b3.BOOL, self.settings['showgame'])
+        self.settings['lag_degraded'] = self.getSetting('settings', 'lag_degraded', b3.FLOAT, self.settings['lag_degraded'])
+        self.settings['lag_critical'] = self.getSetting('settings', 'lag_critical', b3.FLOAT, self.settings['lag_critical'])
+        self.settings['outage_size'] = self.getSetting('settings', 'outage_size', b3.INT, self.settings['outage_size'])
+        self.settings['outage_file'] = self.getSetting('settings', 'outage_file', b3.STR, self.settings['outage_file'])
+        if self.settings['outage_file']:
+            self.settings['outage_file'] = b3.getAbsolutePath(self.settings['outage_file'])
+        self.settings['metrics_listen'] = self.getSetting('settings', 'metrics_listen', b3.STR, self.settings['metrics_listen'])
+        if self.settings['metrics_listen'] and '/' in self.settings['metrics_listen']:
+            self.settings['metrics_listen'] = b3.getAbsolutePath(self.settings['metrics_listen'])
+        self.settings['trace_rate'] = self.getSetting('settings', 'trace_rate', b3.FLOAT, self.settings['trace_rate'])
+        self.settings['trace_interval'] = self.getSetting('settings', 'trace_interval', b3.INT, self.settings['trace_interval'])
+        self.settings['capture_file'] = self.getSetting('settings', 'capture_file', b3.STR, self.settings['capture_file'])
+        if self.settings['capture_file']:
+            self.settings['capture_file'] = b3.getAbsolutePath(self.settings['capture_file'])
+        self.settings['profile_dir'] = self.getSetting('settings', 'profile_dir', b3.STR, self.settings['profile_dir'])
+        if self.settings['profile_dir']:
+            self.settings['profile_dir'] = b3.getAbsolutePath(self.settings['profile_dir'])
+        else:
+            # write the profiles next to the B3 log file
+            self.settings['profile_dir'] = os.path.dirname(self.get_logfile())
+        self.settings['profile_top'] = self.getSetting('settings', 'profile_top', b3.INT, self.settings['profile_top'])
+        self.settings['slow_command'] = self.getSetting('settings', 'slow_command', b3.FLOAT, self.settings['slow_command'])
         self.settings['address'] = self.getSetting('connection', 'address', b3.STR)
         self.settings['port'] = self.getSetting('connection', 'port', b3.INT, self.settings['port'])
-        self.settings['maxrate'] = self.getSetting('connection', 'maxrate', b3.INT, self.settings['maxrate'])
+        self.settings['servers'] = self.parse_server_list(self.settings['address'], self.settings['port'])
+        self.settings['maxrate'] = self.getSetting('connection', 'maxrate', b3.FLOAT, self.settings['maxrate'])
+        self.settings['burst'] = self.getSetting('connection', 'burst', b3.INT, self.settings['burst'])
+        self.settings['relay'] = self.getSetting('connection', 'relay', b3.STR, self.settings['relay'])
+        self.settings['senders'] = self.getSetting('connection', 'senders', b3.INT, self.settings['senders'])
+        self.settings['senders_mode'] = self.getSetting('connection', 'senders_mode', b3.STR, self.settings['senders_mode'])
+        if self.settings['senders_mode'] not in ('channel', 'roundrobin'):
+            self.warning('invalid value for connection::senders_mode (%s): using default' % self.settings['senders_mode'])
+            self.settings['senders_mode'] = 'channel'
+        self.settings['timeout'] = self.getSetting('connection', 'timeout', b3.INT, self.settings['timeout'])
+        self.settings['keepalive'] = self.getSetting('connection', 'keepalive', b3.INT, self.settings['keepalive'])
         self.settings['channel'] = self.getSetting('connection', 'channel', b3.STR, self.settings['channel'])
 
         try:
@@ -110,16 +167,67 @@ class IrcbotPlugin(b3.plugin.Plugin):
                     self.warning('could not parse auto perform command: empty node found')
                     continue
 
-                self.debug('adding command to auto perform: %s' % command)
+                try:
+                    # optional attributes used to sequence the auto perform pipeline
+                    command = IRCPerformCommand(command=command,
+                                                wait=node.getAttribute('wait') or None,
+                                                source=node.getAttribute('source') or None,
+                                                timeout=float(node.getAttribute('timeout') or 10),
+                                                delay=float(node.getAttribute('delay') or 0))
+                except ValueError, e:
+                    self.warning('could not parse auto perform command (%s): %s' % (command, e))
+                    continue
+
+                self.debug('adding command to auto perform: %r' % command)
                 self.settings['perform'].append(command)
         except NoSectionError:
             pass
 
         # if the configuration is not valid, disable the plugin since it won't work anyway
-        if not self.settings['nickname'] or not self.settings['address'] or not self.settings['channel']:
+        if not self.settings['nickname'] or not (self.settings['servers'] or self.settings['relay']) \
+                or not self.settings['channel']:
             self.warning('plugin configuration incomplete: disabling the plugin')
             self.disable()
 
+    def get_logfile(self):
+        """
+        Return the absolute path of the B3 log file.
+        """
+        try:
+            if hasattr(self.console.config, 'getpath'):
+                return self.console.config.getpath('b3', 'logfile')
+            return b3.getAbsolutePath(self.console.config.get('b3', 'logfile'))
+        except (NoSectionError, NoOptionError):
+            return b3.getAbsolutePath('@b3/b3.log')
+
+    def parse_server_list(self, address, port):
+        """
+        Parse the list of IRC servers the BOT should connect to.
+        :param address: A comma separated list of host[:port] entries (IPv6 addresses must be written as [host]:port).
+        :param port: The port to be used for entries which do not specify one.
+        :return: A list of (host, port) tuples.
+        """
+        servers = []
+        for entry in (address or '').split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+
+            host, port_ = entry, port
+            if entry.startswith('['):
+                host, _, rest = entry[1:].partition(']')
+                if rest.startswith(':'):
+                    port_ = rest[1:]
+            elif entry.count(':') == 1:
+                host, port_ = entry.split(':')
+
+            try:
+                servers.append((host, int(port_)))
+            except ValueError:
+                self.warning('could not parse IRC server address: %s' % entry)
+
+        return servers
+
     def onStartup(self):
         """
         Initialize plugin settings.
@@ -156,6 +264,15 @@ class IrcbotPlugin(b3.plugin.Plugin):
         self.pthread.setDaemon(True)
         self.pthread.start()
 
+        if self.settings['metrics_listen']:
+            # serve the BOT metrics in the Prometheus text format from a separate thread
+            try:
+                self.exporter = IRCMetricsExporter(ircbot=self.ircbot, listen=self.settings['metrics_listen'])
+                self.exporter.start()
+            except (ValueError, socket.error), e:
+                self.error('could not start metrics endpoint on %s: %s' % (self.settings['metrics_listen'], e))
+                self.exporter = None
+
         # notice plugin started
         self.debug('plugin started')
 
@@ -170,6 +287,16 @@ class IrcbotPlugin(b3.plugin.Plugin):
         Perform operations when EVT_STOP is received
         :param event: An EVT_STOP event
         """
+        if self.exporter:
+            self.exporter.stop()
+            self.exporter = None
+
+        if self.ircbot.profiler.active():
+            self.ircbot.profiler.stop()
+
+        # put back the storage and RCON methods wrapped to time the commands
+        self.ircbot.timer.uninstall()
+
         self.debug('shutting down irc connection...')
         self.ircbot.disconnect('B3 is going offline')
 
@@ -188,10 +315,28 @@ class IrcbotPlugin(b3.plugin.Plugin):
         client = event.client
         message = event.data.strip()
         if message:
-            for name, channel in self.ircbot.channels.iteritems():
-                if channel.livechat:
+            channels = [channel for channel in self.ircbot.channels.itervalues() if channel.livechat]
+            if not channels:
+                return
+
+            # when the IRC server is lagging behind shed the livechat so ban/kick notices get through
+            drop, suppressed = self.ircbot.lag.shed()
+            if drop:
+                return
+
+            self.ircbot.tracer.begin('livechat', event.time)
+            self.ircbot.tracer.mark('format')
+            try:
+                for channel in channels:
+                    if suppressed:
+                        channel.message('[%sCHAT%s] %s%s%s lines skipped due to lag' % (RED, RESET, ORANGE,
+                                                                                         suppressed, RESET))
                     # if live chat is enabled on this channel, broadcast the message
                     channel.message('[%sCHAT%s] %s%s%s: %s' % (RED, RESET, ORANGE, client.name, RESET, message))
+            finally:
+                self.ircbot.tracer.end()
+            # the rate limit is waited for in this thread: the lines have left the throttler by now
+            self.ircbot.metrics.delivery.labels('livechat').observe(max(0.0, time() - event.time))
 
     def onBan(self, event):
         """
@@ -206,6 +351,9 @@ class IrcbotPlugin(b3.plugin.Plugin):
             # be G-Lined.
             return
 
+        # notices are always traced
+        self.ircbot.tracer.begin('showbans', event.time, sample=False)
+
         client = event.client
         reason = event.data['reason']
 
@@ -223,10 +371,9 @@ class IrcbotPlugin(b3.plugin.Plugin):
         # append the duration to the ban notice
         message += ' [duration : %s%s%s]' % (RED, duration, RESET)
 
-        for name, channel in self.ircbot.channels.iteritems():
-            if channel.showbans:
-                # if showbans is enabled, broadcast the notice
-                channel.message(message)
+        # broadcast the notice on channels having showbans enabled
+        self.ircbot.tracer.mark('format')
+        self.ircbot.notify(message, 'showbans', event.time)
 
     def onKick(self, event):
         """
@@ -241,6 +388,8 @@ class IrcbotPlugin(b3.plugin.Plugin):
             # be G-Lined.
             return
 
+        self.ircbot.tracer.begin('showkicks', event.time, sample=False)
+
         client = event.client
         reason = event.data['reason']
 
@@ -249,9 +398,8 @@ class IrcbotPlugin(b3.plugin.Plugin):
         if reason:
             message += ' [reason : %s%s%s]' % (RED, self.console.stripColors(reason), RESET)
 
-        for name, channel in self.ircbot.channels.iteritems():
-            if channel.showkicks:
-                channel.message(message)
+        self.ircbot.tracer.mark('format')
+        self.ircbot.notify(message, 'showkicks', event.time)
 
     def onMapChange(self, event):
         """
@@ -263,15 +411,17 @@ class IrcbotPlugin(b3.plugin.Plugin):
             # will join an empty server anyway so don't bother
             return
 
+        self.ircbot.tracer.begin('showgame', event.time, sample=False)
+
         num = len(self.console.clients.getList())
         maxnum = self.console.getCvar('sv_maxclients').getInt()
         address = self.serverinfo['ip'] + ':' + self.serverinfo['port']
         mapname = event.data['new']
 
-        for name, channel in self.ircbot.channels.iteritems():
-            if channel.showgame:
-                channel.message('[%sGAME%s] mapname: %s%s%s - players: %s%s%s/%s - join: %s/connect %s' % (BLUE,
-                                RESET, GREEN, mapname, RESET, GREEN, num, RESET, maxnum, BLUE, address))
+        message = '[%sGAME%s] mapname: %s%s%s - players: %s%s%s/%s - join: %s/connect %s' % (BLUE, RESET, GREEN,
+                  mapname, RESET, GREEN, num, RESET, maxnum, BLUE, address)
+        self.ircbot.tracer.mark('format')
+        self.ircbot.notify(message, 'showgame', event.time)
 
     ####################################################################################################################
     #                                                                                                                  #
@@ -402,3 +552,90 @@ class IrcbotPlugin(b3.plugin.Plugin):
                     channel.showgame = False
                     channel.message('showgame: %sOFF' % RED)
             cmd.sayLoudOrPM(client, '^7showgame: ^1OFF')
+
+    def cmd_ircstats(self, data, client, cmd=None):
+        """
+        [<filter>] - display the IRC BOT runtime metrics.
+        """
+        # labelled series are created by the reactor thread: read them from there
+        lines = self.ircbot.call(self.ircbot.metrics.report, (data.strip() if data else None,))
+        if lines is None:
+            client.message('^7the IRC BOT is busy, try again later')
+            return
+
+        if not lines:
+            client.message('^7no metric found matching ^3%s' % data)
+            return
+
+        for name, text in lines:
+            cmd.sayLoudOrPM(client, '^3%s^7: %s' % (name, text))
+
+    def cmd_ircprofile(self, data, client, cmd=None):
+        """
+        [<start [<seconds>] [cprofile|sampling]|stop>] - profile the IRC BOT for a limited amount of time.
+        """
+        profiler = self.ircbot.profiler
+        try:
+            action, seconds, mode = profiler.parse(data)
+        except ValueError:
+            client.message('^7invalid data, try ^3!^7help ircprofile')
+            return
+
+        session = profiler.session
+        if action is None:
+            if session:
+                cmd.sayLoudOrPM(client, '^7profiling: ^2%s ^7- remaining: ^3%ds' % (session.mode, session.remaining()))
+            elif profiler.last:
+                cmd.sayLoudOrPM(client, '^7last profile: ^3%s' % os.path.basename(profiler.last))
+            else:
+                cmd.sayLoudOrPM(client, '^7profiling: ^1OFF')
+        elif action == 'start':
+            try:
+                session = profiler.start(seconds=seconds, mode=mode, owner=client.name)
+            except ValueError, e:
+                client.message('^1%s' % e)
+                return
+            cmd.sayLoudOrPM(client, '^7profiling: ^2%s ^7for ^3%ss' % (session.mode, session.seconds))
+        elif not session:
+            client.message('^7no profiling session is running')
+        else:
+            # the profile is written by the IRC BOT thread
+            path = profiler.stop(wait=5)
+            if path:
+                cmd.sayLoudOrPM(client, '^7profile written in ^3%s' % os.path.basename(path))
+            else:
+                cmd.sayLoudOrPM(client, '^7profiling: ^1OFF')
+
+    def cmd_ircmemory(self, data, client, cmd=None):
+        """
+        [<snapshot|diff>] - display the memory usage of the IRC BOT structures.
+        """
+        memory = self.ircbot.memory
+        data = data.strip().lower() if data else ''
+        if data not in ('', 'snapshot', 'diff'):
+            client.message('^7invalid data, try ^3!^7help ircmemory')
+            return
+
+        # the structures are walked by the reactor thread: they can't change while being measured
+        if data == 'diff':
+            if memory.baseline is None:
+                client.message('^7no snapshot taken yet, try ^3!^7ircmemory snapshot')
+                return
+            result = self.ircbot.call(memory.diff)
+            if not result:
+                client.message('^7the IRC BOT is busy, try again later')
+                return
+            baseline, current, entries, grown = result
+            cmd.sayLoudOrPM(client, '^7changes in the last ^3%s^7: %s' % (minutesStr((current.taken - baseline.taken) / 60.0),
+                                                                          ' - '.join(memory.changes(entries)) or 'none'))
+            if grown:
+                cmd.sayLoudOrPM(client, '^7growing types: %s' % ', '.join('%s ^1+%d^7' % x for x in grown))
+            return
+
+        snapshot = self.ircbot.call(memory.save if data == 'snapshot' else memory.snapshot)
+        if snapshot is None:
+            client.message('^7the IRC BOT is busy, try again later')
+            return
+
+        for line in memory.report(snapshot):
+            cmd.sayLoudOrPM(client, '^7%s' % line)
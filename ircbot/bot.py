@@ -17,10 +17,12 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
 import b3
-import b3.cron
+import os
 import re
 import sys
 import socket
+import thread
+import threading
 import traceback
 import irc
 import irc.bot
@@ -28,10 +30,9 @@ import irc.buffer
 import irc.client
 import irc.connection
 import irc.modes
+import irc.relay
 
-from copy import copy
 from textwrap import TextWrapper
-from time import sleep
 from time import time
 from b3.clients import Client
 from b3.clients import Group
@@ -45,15 +46,36 @@ from irc.client import ServerNotConnectedError
 from irc.client import NickMask
 from irc.client import _rfc_1459_command_regexp
 from irc.client import is_channel
+from irc.dict import IRCDict
 from irc.events import numeric
 from irc.ctcp import dequote
 from ircbot import __version__ as p_version
 from ircbot import __author__ as p_author
+from ircbot.capture import IRCCapture
 from ircbot.colors import *
 from ircbot.channel import IRCChannel
 from ircbot.command import IRCCommand
+from ircbot.command import IRCCommandContext
+from ircbot.coordinator import IRCCoordinator
 from ircbot.command import LEVEL_USER
 from ircbot.command import LEVEL_OPERATOR
+from ircbot.lag import BUCKETS
+from ircbot.lag import IRCLagMonitor
+from ircbot.memory import IRCMemory
+from ircbot.metrics import IRCMetrics
+from ircbot.outage import IRCOutageBuffer
+from ircbot.perform import IRCPerform
+from ircbot.profiler import IRCProfiler
+from ircbot.reconnect import IRCReconnector
+from ircbot.reconnect import STATE_CONNECTED
+from ircbot.reconnect import STATE_CONNECTING
+from ircbot.reconnect import STATE_DISCONNECTED
+from ircbot.reconnect import STATE_STOPPED
+from ircbot.reconnect import STATE_WAITING
+from ircbot.sender import IRCSenderPool
+from ircbot.throttle import IRCThrottler
+from ircbot.timing import IRCCommandTimer
+from ircbot.tracing import IRCTracer
 
 P_ALL = 'all'
 
@@ -67,7 +89,19 @@ class IRCBot(irc.bot.SingleServerIRCBot):
     cmdPrefixLoud = '@'
 
     commands = {}
-    crontab = None
+    perform = None
+    reconnector = None
+    lag = None
+    throttler = None
+    senders = None
+    coordinator = None
+    outage = None
+    metrics = None
+    tracer = None
+    profiler = None
+    timer = None
+    memory = None
+    ident = None        # identifier of the reactor thread (once started)
 
     ####################################################################################################################
     #                                                                                                                  #
@@ -82,10 +116,16 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         """
         self.plugin = plugin
         self.settings = plugin.settings
+        self.commands = {}      # not shared with previous instances: their commands would run against stale objects
         self.adminPlugin = plugin.adminPlugin
         self.cmdPrefix = plugin.adminPlugin.cmdPrefix
         self.cmdPrefixLoud = plugin.adminPlugin.cmdPrefixLoud
 
+        # runtime metrics and tracing: must be available before the library gets patched
+        self.metrics = IRCMetrics()
+        self.tracer = IRCTracer(ircbot=self, rate=self.settings['trace_rate'],
+                                collect=self.settings['trace_interval'] > 0)
+
         # patch the library
         patch_lib(self)
 
@@ -93,14 +133,84 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         # messages set to the IRC network bigger than 512 bytes (which will raise MessageTooLong exception)
         self.wrapper = TextWrapper(width=400, drop_whitespace=True, break_long_words=True, break_on_hyphens=False)
 
-        self.debug('connecting to network %s:%s...' % (self.settings['address'], self.settings['port']))
-        super(IRCBot, self).__init__(server_list=[(self.settings['address'], self.settings['port'])],
+        if self.settings['relay']:
+            # share the IRC session held by a relay daemon (see irc/relay.py): the
+            # server address is the path of the unix socket the relay listens on
+            self.debug('attaching to IRC relay %s...', self.settings['relay'])
+            factory = irc.relay.RelayFactory(name=self.settings['nickname'])
+            servers = [(self.settings['relay'], 0)]
+        else:
+            self.debug('connecting to network %s:%s...' % (self.settings['address'], self.settings['port']))
+            # connect without blocking: the reactor will complete the connection (or give up
+            # after the configured timeout) and the failure will be reported as a disconnection
+            # all the configured servers (and the IPv4/IPv6 addresses they resolve to) are raced with
+            # staggered attempts: the first one answering is used
+            factory = irc.connection.Factory(timeout=self.settings['timeout'], nonblocking=True, dualstack=True)
+            servers = self.settings['servers']
+
+        super(IRCBot, self).__init__(server_list=servers,
                                      nickname=self.settings['nickname'],
-                                     realname=self.settings['nickname'])
+                                     realname=self.settings['nickname'],
+                                     connect_factory=factory)
 
-        if self.settings['maxrate'] > 0:
-            # limit commands frequency as specified in the config file
-            self.connection.set_rate_limit(self.settings['maxrate'])
+        if self.settings['capture_file']:
+            # record the raw traffic received from the IRC server so it can be replayed offline
+            try:
+                self.connection.capture = IRCCapture(ircbot=self, path=self.settings['capture_file'],
+                                                     nickname=self.settings['nickname'])
+                self.debug('recording IRC traffic in %s', self.settings['capture_file'])
+            except IOError, e:
+                self.error('could not open capture file %s: %s', self.settings['capture_file'], e)
+
+        # compute the rate of the counters
+        self.connection.execute_every(10, self.metrics.tick)
+        if self.settings['trace_interval'] > 0:
+            # log the latency percentiles of the traced messages
+            self.connection.execute_every(self.settings['trace_interval'], self.tracer.summary)
+
+        # time the storage and RCON calls made by the commands so that slow executions can be explained
+        self.timer = IRCCommandTimer(ircbot=self, threshold=self.settings['slow_command'])
+        if self.settings['slow_command'] > 0 and self.plugin.console:
+            self.timer.install(self.plugin.console)
+
+        # memory introspection of the BOT structures (!memory)
+        self.memory = IRCMemory(ircbot=self)
+
+        # on demand profiling of the reactor thread (!profile)
+        self.profiler = IRCProfiler(ircbot=self, path=self.settings['profile_dir'], top=self.settings['profile_top'])
+
+        self.lag = IRCLagMonitor(ircbot=self, degraded=self.settings['lag_degraded'],
+                                 critical=self.settings['lag_critical'])
+
+        # notices generated while the BOT is not in the channel are delivered once it's joined again
+        self.outage = IRCOutageBuffer(ircbot=self, size=self.settings['outage_size'], path=self.settings['outage_file'])
+
+        if self.settings['maxrate'] > 0 and not self.settings['relay']:
+            # limit commands frequency as specified in the config file: the rate is
+            # lowered when the server complains about flooding and slowly raised again
+            self.throttler = IRCThrottler(ircbot=self, func=self.connection.send_raw, rate=self.settings['maxrate'],
+                                          burst=self.settings['burst'])
+            self.connection.send_raw = self.throttler
+
+        if self.settings['senders'] > 0 and not self.settings['relay']:
+            self.senders = IRCSenderPool(ircbot=self, count=self.settings['senders'], mode=self.settings['senders_mode'])
+
+        if self.settings['coordinate'] and not self.settings['relay']:
+            # elect a single responder for commands addressed to all the BOTs in the channel
+            self.coordinator = IRCCoordinator(ircbot=self)
+
+        # every failure (connection refused or timed out, EOF, send error, keepalive timeout) ends up
+        # in a disconnect event: reconnections are scheduled by this single state machine
+        self.reconnector = IRCReconnector(ircbot=self, keepalive=self.settings['keepalive'], probe=self.lag.probe)
+
+        # expose the state of the BOT components in the metrics registry
+        self.metrics.gauge('irc_lag_seconds', 'Round-trip time to the IRC server', function=self.lag.lag)
+        self.metrics.gauge('irc_notices_pending', 'Notices queued while not in the channel', function=self.outage.__len__)
+        self.metrics.counter('irc_reconnects_total', 'Successful connections after the first one',
+                             function=lambda: self.reconnector.reconnects)
+        state = self.metrics.gauge('irc_connection_state', 'State of the connection with the IRC server', 'state')
+        for name in (STATE_DISCONNECTED, STATE_CONNECTING, STATE_CONNECTED, STATE_WAITING, STATE_STOPPED):
+            state.labels(name).function = lambda name=name: int(self.reconnector.state == name)
 
         # register IRC commands
         if 'commands-irc' in self.plugin.config.sections():
@@ -110,19 +220,51 @@ class IRCBot(irc.bot.SingleServerIRCBot):
                 if func:
                     self.register_command(name=cmd, minlevel=minlevel, func=func)
 
-        # initialize crontabs
-        self.install_crontab()
-
     ####################################################################################################################
     #                                                                                                                  #
     #   OVERRIDDEN METHODS                                                                                             #
     #                                                                                                                  #
     ####################################################################################################################
 
+    def start(self):
+        """
+        Start the BOT: the calling thread becomes the reactor thread.
+        """
+        self.ident = thread.get_ident()
+        try:
+            super(IRCBot, self).start()
+        finally:
+            self.ident = None
+
+    def _connect(self):
+        """
+        Establish a connection to the IRC network.
+        """
+        self.reconnector.on_connecting()
+        super(IRCBot, self)._connect()
+        if self.reconnector.state == STATE_CONNECTING and not self.connection.is_connected() \
+                and not self.connection.is_connecting():
+            # blocking factories (i.e: the relay one) fail without a disconnect event
+            self.reconnector.on_disconnect('could not connect to %s' % self.connection.server)
+
+    def disconnect(self, msg="I'll be back!"):
+        """
+        Disconnect the BOT without reconnecting.
+        :param msg: The quit message.
+        """
+        self.reconnector.stop()
+        if self.senders:
+            self.senders.stop(msg)
+        super(IRCBot, self).disconnect(msg)
+        if self.connection.capture:
+            self.connection.capture.close()
+
     def _dispatcher(self, connection, event):
         """
         Dispatch events to on_<event.type> method, if available.
         """
+        self.metrics.events.labels(event.type).inc()
+
         # if there is a handler defined for this type of event, execute it
         if hasattr(self, 'on_%s' % event.type):
             try:
@@ -139,6 +281,21 @@ class IRCBot(irc.bot.SingleServerIRCBot):
     #                                                                                                                  #
     ####################################################################################################################
 
+    def _on_disconnect(self, connection, event):
+        """
+        Triggered when a connection attempt fails or the connection with the server is lost.
+        :param connection: The current server connection object instance.
+        :param event: The event to be handled.
+        """
+        self.channels = IRCDict()
+        if self.perform:
+            self.perform.cancel()
+
+        self.lag.reset()
+        reason = event.arguments[0] if event.arguments else None
+        self.debug('disconnected from IRC network: %s', reason)
+        self.reconnector.on_disconnect(reason)
+
     def _on_join(self, connection, event):
         """
         Triggered when a user joins a channel.
@@ -196,17 +353,24 @@ class IRCBot(irc.bot.SingleServerIRCBot):
             # http://tools.ietf.org/html/rfc2812#section-3.2.5
             return
 
+        if channel not in self.channels:
+            # NAMES reply for a channel we are not in
+            return
+
+        # parse the whole batch before touching the channel: with multi-prefix
+        # enabled a nick may carry more than one prefix (i.e: @+nick)
+        prefix = self.connection.features.prefix
+        names = []
         for nick in nick_list.split():
-            nick_modes = []
-            if nick[0] in self.connection.features.prefix:
-                nick_modes.append(self.connection.features.prefix[nick[0]])
+            modes = []
+            while nick and nick[0] in prefix:
+                modes.append(prefix[nick[0]])
                 nick = nick[1:]
+            if nick:
+                names.append((nick, modes))
 
-            # add the user to the channel
-            self.channels[channel].add_user(nick)
-            for mode in nick_modes:
-                # set the user modes for this channel
-                self.channels[channel].set_usermode('+%s' % mode, nick)
+        # insert in a single pass: a summary is logged upon RPL_ENDOFNAMES
+        self.channels[channel].add_users(names)
 
     def _on_mode(self, connection, event):
         """
@@ -214,21 +378,19 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         :param connection: The current server connection object instance
         :param event: The event to be handled
         """
-        modes = irc.modes.parse_channel_modes(' '.join(event.arguments))
         channel = event.target
-        if channel in self.channels:
-            if len(event.arguments) == 2:
-                # if this is a user mode
-                nick = event.arguments[1]
-                if self.channels[channel].has_user(nick):
-                    for m in modes:
-                        mode = '%s%s' % (m[0], m[1])
-                        self.channels[channel].set_usermode(mode, nick)
-            else:
-                # if this is a channel mode
-                for m in modes:
-                    mode = '%s%s' % (m[0], m[1])
-                    self.channels[channel].set_mode(mode)
+        if channel not in self.channels:
+            return
+
+        # parse the whole line according to the server features so that multi-target
+        # (i.e: +ooo a b c) and mixed (i.e: +ov-b a b mask) mode changes are handled properly
+        features = self.connection.features
+        chanmodes = getattr(features, 'chanmodes', irc.modes.DEFAULT_CHANMODES)
+        prefixes = ''.join(features.prefix.values())
+        modes = irc.modes.parse_feature_modes(' '.join(event.arguments), chanmodes, prefixes)
+
+        self.debug('applying modes on channel %s: %s', channel, ' '.join(event.arguments))
+        self.channels[channel].apply_modes(modes, prefixes, chanmodes[0])
 
     ####################################################################################################################
     ##                                                                                                                ##
@@ -246,6 +408,29 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         # irc network may think we timed out and drop us
         self.connection.pong(event.target)
 
+    def on_pong(self, connection, event):
+        """
+        Triggered when the server replies to a PING sent by the BOT.
+        :param connection: The current server connection object instance.
+        :param event: The event to be handled.
+        """
+        self.lag.on_pong(event)
+
+    def on_endofnames(self, connection, event):
+        """
+        Triggered when the server is done sending the list of users of a channel.
+        :param connection: The current server connection object instance.
+        :param event: The event to be handled.
+        """
+        channel = event.arguments[0]
+        if channel in self.channels:
+            channel = self.channels[channel]
+            self.debug('received %s names on channel %s: users<%s> : opers<%s> : voiced<%s>', channel.namescount,
+                       channel.name, len(channel.userdict), len(channel.operdict), len(channel.voiceddict))
+            channel.namescount = 0
+            # the channel has been (re)joined: deliver what has been queued meanwhile
+            self.outage.flush()
+
     def on_nicknameinuse(self, connection, event):
         """
         Triggered when the BOT nickname is already in use.
@@ -257,23 +442,52 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         self.warning('nickname already in use (%s): renaming to %s...', nick1, nick2)
         self.connection.nick(nick2)
 
+    def on_tryagain(self, connection, event):
+        """
+        Triggered when the server refuses to process a command because we are sending too fast.
+        :param connection: The current server connection object instance.
+        :param event: The event to be handled.
+        """
+        if self.throttler:
+            self.throttler.decrease('server asked to try again (%s)' % ' '.join(event.arguments))
+
+    def on_error(self, connection, event):
+        """
+        Triggered when the server closes the link.
+        :param connection: The current server connection object instance.
+        :param event: The event to be handled.
+        """
+        reason = event.target or ''
+        self.warning('server closed the link: %s', reason)
+        if self.throttler and 'excess flood' in reason.lower():
+            self.throttler.decrease(reason)
+
     def on_welcome(self, connection, event):
         """
         Triggered when the server welcome the BOT.
         :param connection: The current server connection object instance.
         :param event: The event to be handled.
         """
-        self.debug('received welcome from server %s:%s', self.settings['address'], self.settings['port'])
+        self.debug('received welcome from server %s:%s', connection.server, connection.port)
+        self.reconnector.on_connected()
 
-        # send the auto perform commands
-        for command in self.settings['perform']:
-            self.debug('sending auto perform command: %s' % command)
-            self.connection.send_raw(command)
-            sleep(2) # sleep so the server can process the command
+        # send the auto perform commands (if any) without blocking the reactor thread:
+        # the channel will be joined as soon as the perform pipeline is done
+        if self.perform:
+            self.perform.cancel()
 
-        # join the preconfingured channel
+        self.perform = IRCPerform(ircbot=self, commands=self.settings['perform'], callback=self.join_channel)
+        self.perform.start()
+
+    def join_channel(self):
+        """
+        Join the preconfigured channel.
+        """
         self.debug('joining channel: %s...', self.settings['channel'])
         self.connection.join(self.settings['channel'])
+        if self.senders:
+            # connect the secondary connections used to spread outbound channel traffic
+            self.senders.start()
 
     def on_pubmsg(self, connection, event):
         """
@@ -281,62 +495,103 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         :param connection: The current server connection object instance.
         :param event: The event to be handled.
         """
+        message = event.arguments[0]                # The said message
+        if message[:1].isspace():
+            # leading whitespaces must be stripped before looking for the command prefix
+            message = message.lstrip()
+
+        # pre-dispatch filter: discard plain chatter as soon as possible when the livechat is disabled
+        # (this is by far the most common case in busy channels) without touching the membership state
+        iscommand = message[:1] in (self.cmdPrefix, self.cmdPrefixLoud)
         channel = self.channels[event.target]       # IRCChannel object instance
-        nickmask = NickMask(event.source)           # NickMask object instance
-        if not channel.has_user(nickmask.nick):
+        if not iscommand and not channel.livechat:
+            return
+
+        nick = event.source.nick
+        message = message.rstrip()
+        iscommand = iscommand and len(message) > 2
+
+        if not iscommand:
+            if not channel.livechat:
+                return
+
+            botname = self.connection.get_nickname()
+            if nick not in ('Q', 'S', 'D', botname) and not 'warbot' in nick and message and \
+                    not (self.senders and self.senders.owns(nick)):
+                # messages posted by our own senders must not be echoed back in game
+                self.verbose('broadcasting chat message on game server: %s: %s', nick, message)
+                self.plugin.console.say('^7[^1IRC^7] %s: ^3%s' % (nick, message))
+            return
+
+        if not channel.has_user(nick):
             # patch which prevent AttributeError to be raised when it's not possible to find
             # the user who send a pub message in a channel in the user dict. Look that the most of the
             # times the user would need to join again the channel to issue commands if he's voiced
             # or an operator of the channel since this will not update user flags
-            self.warning('could not retrieve client %s on channel %s', nickmask.nick, channel.name)
-            self.debug('creating new entry for client %s in channel %s', nickmask.nick, channel.name)
-            channel.add_user(nick=nickmask.nick)
+            self.warning('could not retrieve client %s on channel %s', nick, channel.name)
+            self.debug('creating new entry for client %s in channel %s', nick, channel.name)
+            channel.add_user(nick=nick)
 
-        client = channel.get_user(nickmask.nick)    # IRCClient object instance
-        message = event.arguments[0].strip()        # The said message
-
-        if len(message) > 2 and message[:1] in (self.cmdPrefix, self.cmdPrefixLoud):
-            prefix, command, data = self.parse_command(message)
-            loud = prefix == self.cmdPrefixLoud
-            self.on_command(client=client, command=command, data=data, loud=loud)
-        else:
-            if channel.livechat:
-                botname = self.connection.get_nickname()
-                if client.nick not in ('Q', 'S', 'D', botname) and not 'warbot' in client.nick:
-                    self.verbose('broadcasting chat message on game server: %s: %s', client.nick, message)
-                    self.plugin.console.say('^7[^1IRC^7] %s: ^3%s' % (client.nick, message))
+        client = channel.get_user(nick)             # IRCClient object instance
+        prefix, command, data = self.parse_command(message)
+        loud = prefix == self.cmdPrefixLoud
+        self.on_command(client=client, command=command, data=data, loud=loud)
 
     ####################################################################################################################
     ##                                                                                                                ##
-    ##   CRON EXECUTION                                                                                               ##
+    ##   OTHER METHODS                                                                                                ##
     ##                                                                                                                ##
     ####################################################################################################################
 
-    def install_crontab(self):
+    def call(self, function, arguments=(), wait=5):
         """
-        Cleanup and create the crontabs.
+        Execute a function in the reactor thread and return its result: used by the B3 thread to read the
+        structures (channels, handlers, queues, metrics) the reactor thread keeps changing.
+        :param function: The function to execute.
+        :param arguments: The arguments to be passed to the function.
+        :param wait: Maximum amount of seconds to wait for the reactor thread.
+        :return: The value returned by the function (None if the reactor thread did not execute it in time).
         """
-        self.debug('installing crontab...')
-        self.plugin.console.cron - self.crontab
-        self.crontab = b3.cron.PluginCronTab(self.plugin, self.cron, 0, '*/%s' % self.settings['interval'])
-        self.plugin.console.cron + self.crontab
+        if self.ident is None or thread.get_ident() == self.ident:
+            return function(*arguments)
+        done = threading.Event()
+        result = []
+        self.connection.execute_delayed(0, self._call, (function, arguments, result, done))
+        done.wait(wait)
+        return result[0] if result else None
 
-    def cron(self):
+    @staticmethod
+    def _call(function, arguments, result, done):
         """
-        Scheduled execution.
+        Execute a function scheduled by call (in the reactor thread).
         """
-        self.debug('executing cron...')
-        # check that the socket has been actually created: it may happen that the first
-        # connection will be delayed and thus this will raise a ServerNotConnectedError
-        if self.connection.socket and not self.connection.is_connected():
-            self.debug('connection with the server lost: reconnecting...')
-            self.connection.reconnect()
+        try:
+            result.append(function(*arguments))
+        finally:
+            done.set()
 
-    ####################################################################################################################
-    ##                                                                                                                ##
-    ##   OTHER METHODS                                                                                                ##
-    ##                                                                                                                ##
-    ####################################################################################################################
+    def get_botname(self):
+        """
+        Return the name used to address this BOT in IRC commands.
+        When attached to a relay the IRC nickname is shared by many BOTs so the configured nickname is used.
+        """
+        if self.settings['relay']:
+            return self.settings['nickname']
+        return self.connection.get_nickname()
+
+    def notify(self, message, flag, origin=None):
+        """
+        Send a notice to the channels having the given flag enabled.
+        The notice is queued if the BOT is not in the channel and delivered once it joins again.
+        :param message: The notice to be sent.
+        :param flag: The name of the channel attribute enabling this kind of notices (i.e: showbans).
+        :param origin: The time of the B3 event originating the notice.
+        """
+        try:
+            self.outage.notify(message, flag, origin)
+        finally:
+            # the notice has been either sent or queued: complete the trace started by the event handler
+            self.tracer.end()
 
     def lookup_client(self, data, client=None):
         """
@@ -418,6 +673,19 @@ class IRCBot(irc.bot.SingleServerIRCBot):
             return pfx, cmd[0], ''
         return pfx, cmd[0], cmd[1]
 
+    def strip_colors_sink(self, cmd, client, message):
+        """
+        Command reply sink which strips game color codes before delivering the message.
+        :param cmd: The IRCCommandContext of the command being executed
+        :param client: The client who executed the command
+        :param message: The message to be delivered
+        """
+        message = self.plugin.console.stripColors(message)
+        if cmd.parent is not None:
+            cmd.parent.sayLoudOrPM(client, message)
+        else:
+            cmd.route(client, message)
+
     @staticmethod
     def get_reason(reason):
         """
@@ -487,7 +755,7 @@ class IRCBot(irc.bot.SingleServerIRCBot):
             # 08/12/2014: added 'listen_global' configuration variable which let bots to interact
             # with commands forwarded using the 'all' placeholder as bot name (all the bots will intercept the command)
             split = data.split(' ', 1)
-            botname = self.connection.get_nickname().lower()
+            botname = self.get_botname().lower()
             placeholder = split[0].lower()
             if self.settings['listen_global']:
                 if placeholder != botname and placeholder != P_ALL:
@@ -496,6 +764,10 @@ class IRCBot(irc.bot.SingleServerIRCBot):
                 if placeholder != botname:
                     return
 
+            # when coordinating with other BOTs only the responder replies to commands addressed to all of them
+            coordinated = placeholder == P_ALL and self.coordinator is not None and self.coordinator.active()
+            silent = coordinated and not self.coordinator.is_responder()
+
             data = ''
             if len(split) > 1:
                 data = split[1]
@@ -503,7 +775,8 @@ class IRCBot(irc.bot.SingleServerIRCBot):
             command = command.lower()
             if not command in self.commands:
                 # actually inform the client that the command is not a valid one
-                client.message('invalid command: %s%s%s%s' % (ORANGE, self.cmdPrefix, RED, command))
+                if not silent:
+                    client.message('invalid command: %s%s%s%s' % (ORANGE, self.cmdPrefix, RED, command))
                 return
 
             # get the command object
@@ -511,11 +784,15 @@ class IRCBot(irc.bot.SingleServerIRCBot):
 
             # check for sufficient level
             if not cmd.canUse(client):
-                client.message('no sufficient access to command %s%s%s%s' % (ORANGE, cmd.prefix, RED, cmd.name))
+                if not silent:
+                    client.message('no sufficient access to command %s%s%s%s' % (ORANGE, cmd.prefix, RED, cmd.name))
                 return
 
             # execute the command
-            cmd.execute(client=client, data=data, loud=loud)
+            if coordinated:
+                self.coordinator.execute(cmd=cmd, client=client, data=data, loud=loud)
+            else:
+                cmd.execute(client=client, data=data, loud=loud)
 
         except Exception:
             # send a visual notice to the client
@@ -603,7 +880,8 @@ class IRCBot(irc.bot.SingleServerIRCBot):
             # since not all the games support cvars we need
             # to handle the case where the parser has no getCvar
             # or setCvar method implemented
-            cmd.sayLoudOrPM('%s%s%s parser does not support cvar get/set' % (RED, self.plugin.console.game.gameName, RESET))
+            cmd.sayLoudOrPM(client, '%s%s%s parser does not support cvar get/set' % (RED, self.plugin.console.game.gameName,
+                                                                                     RESET))
 
     def cmd_exec(self, client, data, cmd=None):
         """
@@ -643,9 +921,9 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         self.plugin.console.say = new_say
         self.plugin.console.saybig = new_saybig
         self.plugin.console.message = new_message
-        new_cmd = copy(cmd)
-        new_cmd.sayLoudOrPM_original = new_cmd.sayLoudOrPM
-        new_cmd.sayLoudOrPM = lambda x, y: new_cmd.sayLoudOrPM_original(x, self.plugin.console.stripColors(y))
+        # strip game color codes from the replies: they keep going through the outer context
+        # so that replies of coordinated executions are collected as well
+        new_cmd = IRCCommandContext(cmd.command, client, cmd.loud, sink=self.strip_colors_sink, parent=cmd)
 
         setattr(client, 'name', client.nick)
         setattr(client, 'exactName', client.nick)
@@ -739,6 +1017,24 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         # print globally
         client.channel.message(message)
 
+    def cmd_lag(self, client, data, cmd=None):
+        """
+        - display the lag with the IRC server
+        """
+        def ms(value):
+            return '%s%s%s' % (GREEN, 'n/a' if value is None else '%dms' % (value * 1000), RESET)
+
+        p50, p90, p99 = self.lag.percentiles(50, 90, 99)
+        count, age = self.lag.backlog()
+        cmd.sayLoudOrPM(client, 'lag: %s - p50: %s - p90: %s - p99: %s - queue: %s%s%s (%s) - livechat: %s%s%s' % (
+                        ms(self.lag.lag()), ms(p50), ms(p90), ms(p99), GREEN, count, RESET, ms(age),
+                        ORANGE, self.lag.level(), RESET))
+
+        histogram = ['%s: %s' % ('>%dms' % (BUCKETS[-2] * 1000) if bound == BUCKETS[-1] else '<%dms' % (bound * 1000),
+                                 count) for bound, count in self.lag.histogram() if count]
+        if histogram:
+            cmd.sayLoudOrPM(client, 'rtt: %s' % ' - '.join(histogram))
+
     def cmd_list(self, client, data, cmd=None):
         """
         - display the list of online clients
@@ -834,6 +1130,32 @@ class IRCBot(irc.bot.SingleServerIRCBot):
                         GREEN, bclient.ip, RESET, GREEN, bclient.guid, RESET, GREEN, bclient.connections, RESET, GREEN,
                         bclient.numWarnings, RESET, GREEN, bclient.numBans))
 
+    def cmd_memory(self, client, data, cmd=None):
+        """
+        [<snapshot|diff>] - display the memory usage of the BOT structures
+        """
+        data = data.strip().lower() if data else ''
+        if data not in ('', 'snapshot', 'diff'):
+            client.message('invalid data, try %s!%shelp memory' % (ORANGE, RESET))
+            return
+
+        if data == 'diff':
+            result = self.memory.diff()
+            if not result:
+                client.message('no snapshot taken yet, try %s!%smemory snapshot' % (ORANGE, RESET))
+                return
+            baseline, current, entries, grown = result
+            cmd.sayLoudOrPM(client, 'changes in the last %s%s%s: %s' % (ORANGE,
+                            minutesStr((current.taken - baseline.taken) / 60.0), RESET,
+                            ' - '.join(self.memory.changes(entries)) or 'none'))
+            if grown:
+                cmd.sayLoudOrPM(client, 'growing types: %s' % ', '.join('%s %s+%d%s' % (name, RED, count, RESET)
+                                                                        for name, count in grown))
+            return
+
+        snapshot = self.memory.save() if data == 'snapshot' else self.memory.snapshot()
+        cmd.sayLoudOrPM(client, '%s: %s' % ('snapshot saved' if data else 'memory', ' - '.join(self.memory.report(snapshot))))
+
     def cmd_permban(self, client, data, cmd=None):
         """
         <client> [reason] - permanently ban a client from the server
@@ -870,31 +1192,51 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         # print the list of plugins
         cmd.sayLoudOrPM(client, 'plugins: %s' % ', '.join(collection))
 
-    def cmd_reconnect(self, client, data, cmd=None):
+    def cmd_profile(self, client, data, cmd=None):
         """
-        - reconnect the BOT to the IRC network
+        [<start [<seconds>] [cprofile|sampling]|stop>] - profile the BOT for a limited amount of time
         """
-        self.disconnect("rebooting...")
-        self.debug('disconnected from IRC network %s' % self.settings['address'])
-
-        # remove everything we stored
-        # it will remove the entry from the dict
-        # by deleting the reference thus the garbage
-        # collector will delete it soon enough
-        for key in self.channels:
-            del self.channels[key]
-
-        self.plugin.console.cron - self.crontab     # remove the current crontab
-        sleep(2)                                    # sleep a bit so the network has time to free our nickname
+        try:
+            action, seconds, mode = self.profiler.parse(data)
+        except ValueError:
+            client.message('invalid data, try %s!%shelp profile' % (ORANGE, RESET))
+            return
 
-        # reconnect to the same network
-        self.debug('connecting to IRC network %s:%s' % (self.settings['address'], self.settings['port']))
-        self.connection.reconnect()
-        self.install_crontab()                      # reinstall the crontab
+        session = self.profiler.session
+        if action is None:
+            if session:
+                cmd.sayLoudOrPM(client, 'profiling: %s%s%s - remaining: %s%ds%s' % (GREEN, session.mode, RESET, ORANGE,
+                                                                                 session.remaining(), RESET))
+            elif self.profiler.last:
+                cmd.sayLoudOrPM(client, 'last profile: %s%s%s - hottest: %s' % (ORANGE,
+                                                                               os.path.basename(self.profiler.last),
+                                                                               RESET, ', '.join(self.profiler.hot)))
+            else:
+                cmd.sayLoudOrPM(client, 'profiling: %sOFF' % RED)
+        elif action == 'start':
+            try:
+                session = self.profiler.start(seconds=seconds, mode=mode, owner=client.nick)
+            except ValueError, e:
+                client.message('%s%s' % (RED, e))
+                return
+            cmd.sayLoudOrPM(client, 'profiling: %s%s%s for %s%ss%s' % (GREEN, session.mode, RESET, ORANGE, session.seconds,
+                                                                           RESET))
+        elif not session:
+            client.message('no profiling session is running')
+        else:
+            path = self.profiler.stop()
+            if path:
+                cmd.sayLoudOrPM(client, 'profile written in %s%s%s - hottest: %s' % (ORANGE, os.path.basename(path), RESET,
+                                                                                    ', '.join(self.profiler.hot)))
+            else:
+                cmd.sayLoudOrPM(client, 'profiling: %sOFF' % RED)
 
-        if self.settings['maxrate'] > 0:
-            # limit commands frequency as specified in the config file
-            self.connection.set_rate_limit(self.settings['maxrate'])
+    def cmd_reconnect(self, client, data, cmd=None):
+        """
+        - reconnect the BOT to the IRC network
+        """
+        # wait a bit so the network has time to free our nickname
+        self.reconnector.restart('rebooting...')
 
     def cmd_showbans(self, client, data, cmd=None):
         """
@@ -959,6 +1301,14 @@ class IRCBot(irc.bot.SingleServerIRCBot):
             client.channel.showgame = False
             cmd.sayLoudOrPM(client, 'showgame: %sOFF' % RED)
 
+    def cmd_stats(self, client, data, cmd=None):
+        """
+        [<filter>] - display the BOT runtime metrics
+        """
+        cmd.sayLoudOrPM(client, 'uptime: %s%s%s' % (GREEN, minutesStr((time() - self.metrics.started) / 60.0), RESET))
+        for name, text in self.metrics.report(match=data.strip() if data else None):
+            cmd.sayLoudOrPM(client, '%s%s%s: %s' % (ORANGE, name, RESET, text))
+
     def cmd_status(self, client, data, cmd=None):
         """
         - display server status information
@@ -998,6 +1348,28 @@ class IRCBot(irc.bot.SingleServerIRCBot):
 
         self.ban(bclient=bclient, client=client, reason=reason, keyword=keyword, duration=duration)
 
+    def cmd_trace(self, client, data, cmd=None):
+        """
+        [<count>] - display the latency of the most recent traced messages
+        """
+        try:
+            count = min(20, max(1, int(data))) if data else 5
+        except ValueError:
+            client.message('invalid data, try %s!%shelp trace' % (ORANGE, RESET))
+            return
+
+        traces = self.tracer.recent(count)
+        if not traces:
+            cmd.sayLoudOrPM(client, 'no message has been traced yet')
+            return
+
+        for trace in traces:
+            cmd.sayLoudOrPM(client, self.tracer.format(trace))
+
+        cmd.sayLoudOrPM(client, 'percentiles: %s' % ' - '.join('%s: %s%.1fms%s/%s%.1fms%s/%s%.1fms%s' % (
+                        name, GREEN, p50 * 1000, RESET, ORANGE, p95 * 1000, RESET, RED, top * 1000, RESET)
+                        for name, p50, p95, top in self.tracer.percentiles(self.tracer.recent(len(self.tracer.traces)))))
+
     def cmd_unban(self, client, data, cmd=None):
         """
         <client> [<reason>] - unban a client from the server
@@ -1106,12 +1478,19 @@ def send_raw(self, data):
     if self.socket is None:
         raise ServerNotConnectedError('socket is not connected')
 
+    # already marked by the rate limiter (if any)
+    self.tracer.mark('enqueue')
+    self.tracer.mark('dequeue')
+
     # get the correct sender method
     sender = getattr(self.socket, 'write', self.socket.send)
 
     try:
         # send the data
         sender(data)
+        self.tracer.mark('write')
+        self.metrics.lines_out.inc()
+        self.metrics.bytes_out.inc(len(data))
     except socket.error:
         # something went wrong, so just disconnect
         self.disconnect('connection lost')
@@ -1125,10 +1504,15 @@ def _process_line(self, line):
     command = None
     arguments = None
 
+    self.metrics.lines_in.inc()
+
     # if developer mode is enabled this gets logged
     if hasattr(self, 'dev') and callable(self.dev):
         self.dev(line)
 
+    if self.capture is not None:
+        self.capture.record(line)
+
     m = _rfc_1459_command_regexp.match(line)
     if m.group("prefix"):
         prefix = m.group("prefix")
@@ -1173,13 +1557,12 @@ def _process_line(self, line):
 
         for m in messages:
             if isinstance(m, tuple):
-                command = "ctcpreply"
-                if command in ["privmsg", "pubmsg"]:
-                    command = "ctcp"
+                # CTCP requests are sent using PRIVMSG while replies are sent using NOTICE
+                ctcp = "ctcp" if command in ["privmsg", "pubmsg"] else "ctcpreply"
                 m = list(m)
-                event = Event(command, source, target, m)
+                event = Event(ctcp, source, target, m)
                 self._handle_event(event)
-                if command == "ctcp" and m[0] == "ACTION":
+                if ctcp == "ctcp" and m[0] == "ACTION":
                     event = Event("action", source, target, m[1:])
                     self._handle_event(event)
             else:
@@ -1227,6 +1610,16 @@ def patch_lib(bot):
     bot.debug('patched method: irc.client.ServerConnection._process_line<%s> : _process_line<%s>',
               id(irc.client.ServerConnection._process_line), id(_process_line))
 
+    # the patched methods above record traffic in the BOT metrics registry and trace outbound messages
+    irc.client.ServerConnection.metrics = bot.metrics
+    bot.debug('created attribute: irc.client.ServerConnection.metrics<%s>', id(bot.metrics))
+    irc.client.ServerConnection.tracer = bot.tracer
+    bot.debug('created attribute: irc.client.ServerConnection.tracer<%s>', id(bot.tracer))
+
+    # traffic capture: enabled on the main connection only (see IRCBot constructor)
+    irc.client.ServerConnection.capture = None
+    bot.debug('created attribute: irc.client.ServerConnection.capture')
+
     if bot.settings['dev']:
 
         def dev(self, msg, *args, **kwargs):
@@ -0,0 +1,140 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from time import time
+
+MAGIC = '# ircbot capture'
+VERSION = 1
+
+
+class IRCCapture(object):
+    """
+    Record the raw lines received from the IRC server so they can be replayed offline (see tools/replay.py).
+    The capture is a text file: a header line followed by one line per received IRC line:
+
+        # ircbot capture 1 <start timestamp> <nickname>
+        <seconds since start> <raw line>
+
+    Lines are recorded by the reactor thread only and written through a buffered file which
+    is flushed at most once per second: recording stops once the file reaches the size limit.
+    """
+    path = None             # path of the capture file
+    limit = 0               # maximum size of the capture file (in bytes)
+    size = 0                # amount of bytes written so far
+    started = 0             # time the capture has been started
+    flushed = 0             # time of the last flush
+    handle = None           # the file object (None when the capture is stopped)
+
+    def __init__(self, ircbot, path, nickname, limit=64 * 1024 * 1024):
+        """
+        Create a new IRCCapture instance.
+        :param ircbot: The IRC BOT object instance.
+        :param path: The path of the capture file.
+        :param nickname: The nickname of the BOT (written in the header).
+        :param limit: The maximum size of the capture file (in bytes).
+        """
+        self.ircbot = ircbot
+        self.path = path
+        self.limit = limit
+        self.started = self.flushed = time()
+        self.handle = open(path, 'ab', 65536)
+        header = '%s %s %.3f %s\n' % (MAGIC, VERSION, self.started, nickname)
+        self.handle.write(header)
+        self.size = self.handle.tell()
+
+    def record(self, line):
+        """
+        Record a line received from the IRC server.
+        :param line: The line (without CR LF).
+        """
+        if self.handle is None:
+            return
+
+        now = time()
+        data = '%.3f %s\n' % (now - self.started, line.encode('utf-8') if isinstance(line, unicode) else line)
+        self.handle.write(data)
+        self.size += len(data)
+        if self.size >= self.limit:
+            self.ircbot.warning('capture file %s reached %s bytes: recording stopped', self.path, self.size)
+            self.close()
+        elif now - self.flushed >= 1:
+            self.flushed = now
+            self.handle.flush()
+
+    def close(self):
+        """
+        Stop recording.
+        """
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class IRCCaptureReader(object):
+    """
+    Read a capture file written by IRCCapture: iterating yields (seconds since start, raw line) tuples.
+    A file may contain multiple captures (one per BOT start): their offsets are made consecutive.
+    """
+    path = None             # path of the capture file
+    started = None          # start time of the first capture in the file
+    nickname = None         # nickname of the BOT found in the first header
+
+    def __init__(self, path):
+        """
+        Create a new IRCCaptureReader instance.
+        :param path: The path of the capture file.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.readline()
+        if not header.startswith(MAGIC):
+            raise ValueError('%s is not an ircbot capture file' % path)
+        self.started, self.nickname = self.parse_header(header)
+
+    @staticmethod
+    def parse_header(line):
+        """
+        Parse a capture header.
+        :param line: The header line.
+        :return: A (start timestamp, nickname) tuple.
+        """
+        fields = line[len(MAGIC):].split()
+        if int(fields[0]) > VERSION:
+            raise ValueError('unsupported capture version: %s' % fields[0])
+        return float(fields[1]), fields[2] if len(fields) > 2 else None
+
+    def __iter__(self):
+        """
+        Iterate over the recorded lines.
+        """
+        base = 0.0          # offset of the current capture
+        last = 0.0          # offset of the last line read
+        with open(self.path, 'rb') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line.startswith(MAGIC):
+                    # a new capture has been appended: keep offsets increasing
+                    base = last
+                    continue
+                offset, _, data = line.partition(' ')
+                try:
+                    last = base + float(offset)
+                except ValueError:
+                    # truncated line
+                    continue
+                yield last, data
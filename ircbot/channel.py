@@ -21,6 +21,19 @@ from .colors import RESET
 from .client import IRCClient
 from .colors import convert_colors
 
+
+def mode_bit(mode):
+    """
+    Return the bit representing the given channel mode letter in the channel mode bitset.
+    Servers may advertise mode characters outside A-Z and a-z: these are not tracked.
+    :param mode: The mode letter (A-Z, a-z)
+    :return: An integer with the bit corresponding to the given mode set (0 for unknown characters)
+    """
+    if len(mode) != 1 or not mode.isalpha() or ord(mode) > 122:
+        return 0
+    return 1 << (ord(mode) - 65)
+
+
 class IRCChannel(Channel):
     """
     A class for keeping information about an IRC channel.
@@ -32,6 +45,8 @@ class IRCChannel(Channel):
     name = None         # channel name
 
     modedict = {}       # will hold dict references according the channel modes
+    modeparams = {}     # will hold channel modes parameters (key, limit)
+    namescount = 0      # amount of users received in the current RPL_NAMREPLY burst
 
     livechat = False    # live chat streaming
     showbans = True     # display admin bans whenever the event is raised
@@ -53,8 +68,10 @@ class IRCChannel(Channel):
 
         # this will overwrite the modes attribute set
         # in the Channel constructor: was a dict but we
-        # don't need to associate keys to values
-        self.modes = []
+        # keep channel flags in a bitset (see mode_bit)
+        # and their parameters in a separate dict
+        self.modes = 0
+        self.modeparams = {}
 
         self.modedict = {
             'o': self.operdict,
@@ -165,9 +182,36 @@ class IRCChannel(Channel):
 
         # create a new IRCClient instance and store it in the user dict
         client = IRCClient(ircbot=self.ircbot, channel=self, nick=nick)
-        self.ircbot.debug('adding client %s on channel %s: %r' % (nick, self.name, client))
+        self.ircbot.debug('adding client %s on channel %s: %r', nick, self.name, client)
         self.userdict[nick] = client
 
+    def add_users(self, names):
+        """
+        Add a batch of users to the channel (used to process RPL_NAMREPLY bursts).
+        No logging is performed here: a single summary is produced upon RPL_ENDOFNAMES.
+        :param names: An iterable of (nick, modes) tuples where modes is a sequence of mode letters.
+        :return: The number of users processed.
+        """
+        ircbot = self.ircbot
+        userdict = self.userdict
+        modedict = self.modedict
+        count = 0
+        for nick, modes in names:
+            if nick in userdict:
+                client = userdict[nick]
+                client.level = None
+            else:
+                client = IRCClient(ircbot=ircbot, channel=self, nick=nick)
+                userdict[nick] = client
+            for mode in modes:
+                # skip modes we do not keep track of
+                if mode in modedict:
+                    modedict[mode][nick] = client
+            count += 1
+
+        self.namescount += count
+        return count
+
     def get_user(self, client):
         """
         Return an IRCClient object matching the given parameter.
@@ -193,8 +237,12 @@ class IRCChannel(Channel):
         if isinstance(client, IRCClient):
             nick = client.nick
 
-        self.ircbot.debug('removing client %s from channel %s: %r' % (nick, self.name, client))
-        for d in self.userdict, self.operdict, self.voiceddict:
+        self.ircbot.debug('removing client %s from channel %s: %r', nick, self.name, client)
+        if nick in self.userdict:
+            self.userdict[nick].level = None
+            del self.userdict[nick]
+
+        for d in self.modedict.values():
             if nick in d:
                 del d[nick]
 
@@ -205,19 +253,16 @@ class IRCChannel(Channel):
         :param after: The new nickname.
         """
         # update in the channel users dict
-        self.ircbot.debug('updating nick for client %s on channel %s: %s' % (before, self.name, after))
-        self.userdict[after] = self.userdict.pop(before)
-        self.userdict[after].nick = after
+        self.ircbot.debug('updating nick for client %s on channel %s: %s', before, self.name, after)
+        client = self.userdict.pop(before)
+        client.nick = after
+        client.level = None
+        self.userdict[after] = client
 
-        # update in the operators dict
-        if before in self.operdict:
-            self.operdict[after] = self.operdict.pop(before)
-            self.operdict[after].nick = after
-
-        # update in the voiced dict
-        if before in self.voiceddict:
-            self.voiceddict[after] = self.voiceddict.pop(before)
-            self.voiceddict[after].nick = after
+        # update in the mode dicts
+        for d in self.modedict.values():
+            if before in d:
+                d[after] = d.pop(before)
 
     def set_userdetails(self, nick, client):
         """
@@ -229,7 +274,7 @@ class IRCChannel(Channel):
         if not isinstance(client, IRCClient):
             raise AttributeError('client parameter must be instance of IRCClient')
 
-        self.ircbot.debug('updating client %s data on channel %s: %r' % (nick, self.name, client))
+        self.ircbot.debug('updating client %s data on channel %s: %r', nick, self.name, client)
         self.userdict[nick] = client
 
         # update in operators dict
@@ -253,7 +298,8 @@ class IRCChannel(Channel):
         if not isinstance(client, IRCClient):
             client = self.userdict[client]
 
-        self.ircbot.debug('setting mode %s on channel %s for client %s' % (mode, self.name, client.nick))
+        self.ircbot.debug('setting mode %s on channel %s for client %s', mode, self.name, client.nick)
+        client.level = None
         d = self.modedict[mode[1]]
         if mode[0] == '+' and not client.nick in d:
             d[client.nick] = client
@@ -266,19 +312,47 @@ class IRCChannel(Channel):
     #                                                                                                                  #
     ####################################################################################################################
 
-    def set_mode(self, mode, *args, **kwargs):
+    def apply_modes(self, modes, prefixes, listmodes):
+        """
+        Apply a whole MODE line to the channel in a single pass.
+        :param modes: A list of [sign, mode, argument] triples (see irc.modes.parse_feature_modes)
+        :param prefixes: The mode letters which apply to channel members (PREFIX feature)
+        :param listmodes: The mode letters of list modes (type A of the CHANMODES feature)
+        """
+        userdict = self.userdict
+        modedict = self.modedict
+        for sign, mode, arg in modes:
+            if mode in prefixes:
+                # channel member mode: skip the ones we do not keep track of
+                if arg is None or mode not in modedict or arg not in userdict:
+                    continue
+                d = modedict[mode]
+                client = userdict[arg]
+                client.level = None
+                if sign == '+':
+                    d[arg] = client
+                elif arg in d:
+                    del d[arg]
+            elif mode not in listmodes:
+                # channel flag: bans, exceptions and invites are not tracked
+                self.set_mode(sign + mode, arg)
+
+    def set_mode(self, mode, value=None):
         """
         Set mode on the channel.
         :param mode: The channel mode
+        :param value: The mode parameter (if any)
         """
         if mode[0] not in ('-', '+'):
             raise AttributeError('unsupported channel mode given: %s' % mode)
 
-        self.ircbot.debug('setting mode %s on channel %s' % (mode, self.name))
-        if mode[0] == '+' and mode[1] not in self.modes:
-            self.modes.append(mode[1])
-        elif mode[0] == '-' and mode[1] in self.modes:
-            del self.modes[mode[1]]
+        if mode[0] == '+':
+            self.modes |= mode_bit(mode[1])
+            if value is not None:
+                self.modeparams[mode[1]] = value
+        else:
+            self.modes &= ~mode_bit(mode[1])
+            self.modeparams.pop(mode[1], None)
 
     def clear_mode(self, mode, *args, **kwargs):
         """
@@ -292,7 +366,7 @@ class IRCChannel(Channel):
         :param mode: The mode to be matched
         :return: True if the channel has the given mode set, False otherwise
         """
-        return mode in self.modes
+        return (self.modes & mode_bit(mode)) != 0
 
     def is_moderated(self):
         """
@@ -352,9 +426,10 @@ class IRCChannel(Channel):
 
     def limit(self):
         """
-        We do not use this one
+        Return the channel user limit.
+        :return: The user limit if the channel has it set, None otherwise
         """
-        pass
+        return self.modeparams.get('l')
 
     ####################################################################################################################
     #                                                                                                                  #
@@ -368,5 +443,12 @@ class IRCChannel(Channel):
         :param message: The message to be sent.
         """
         message = '%s%s' % (RESET, message)
-        for msg in self.ircbot.wrapper.wrap(message):
-            self.connection.privmsg(self.name, convert_colors(msg))
\ No newline at end of file
+        connection = self.ircbot.senders.pick(self.name) if self.ircbot.senders else self.connection
+        ticket = self.ircbot.lag.begin_send()
+        try:
+            for msg in self.ircbot.wrapper.wrap(message):
+                msg = convert_colors(msg)
+                self.ircbot.timer.reply(msg)
+                connection.privmsg(self.name, msg)
+        finally:
+            self.ircbot.lag.end_send(ticket)
\ No newline at end of file
@@ -18,6 +18,9 @@
 
 from .colors import RESET
 from .colors import convert_colors
+from .command import LEVEL_USER
+from .command import LEVEL_VOICED
+from .command import LEVEL_OPERATOR
 
 class IRCClient(object):
     """
@@ -30,6 +33,7 @@ class IRCClient(object):
     connection = None   # server connection instance
     channel = None      # the channel the client is in
     nick = None         # the client nickname
+    level = None        # cached permission level (None when it needs to be computed)
 
     ####################################################################################################################
     #                                                                                                                  #
@@ -56,6 +60,21 @@ class IRCClient(object):
     #                                                                                                                  #
     ####################################################################################################################
 
+    def get_level(self):
+        """
+        Return the permission level of this client in the channel he's in.
+        The value is cached and invalidated by the channel upon MODE/NICK/PART/KICK/QUIT.
+        :return: LEVEL_OPERATOR, LEVEL_VOICED or LEVEL_USER.
+        """
+        if self.level is None:
+            if self.nick in self.channel.operdict:
+                self.level = LEVEL_OPERATOR
+            elif self.nick in self.channel.voiceddict:
+                self.level = LEVEL_VOICED
+            else:
+                self.level = LEVEL_USER
+        return self.level
+
     def is_oper(self):
         """
         Check whether this client has operator status in the channel he's in.
@@ -83,8 +102,14 @@ class IRCClient(object):
         :param message: The message to be forwarded.
         """
         message = '%s%s' % (RESET, message)
-        for msg in self.ircbot.wrapper.wrap(message):
-            self.connection.notice(self.nick, convert_colors(msg))
+        ticket = self.ircbot.lag.begin_send()
+        try:
+            for msg in self.ircbot.wrapper.wrap(message):
+                msg = convert_colors(msg)
+                self.ircbot.timer.reply(msg)
+                self.connection.notice(self.nick, msg)
+        finally:
+            self.ircbot.lag.end_send(ticket)
 
     ####################################################################################################################
     #                                                                                                                  #
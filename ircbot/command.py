@@ -16,8 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
-
-from copy import copy
+from time import time
 
 LEVEL_USER = 0
 LEVEL_VOICED = 1
@@ -37,8 +36,6 @@ class IRCCommand(object):
     prefix = '!'            # prefix for normal command execution
     prefixLoud = '@'        # prefix for loud command execution
 
-    loud = False
-
     def __init__(self, ircbot, name, minlevel, func):
         """
         Create a new IRCCommand instance.
@@ -62,34 +59,91 @@ class IRCCommand(object):
         :param client: The client who executed the command.
         :return: True if the given client can use the command, False otherwise.
         """
-        if self.minlevel == LEVEL_USER:
-            # everyone can use the command
-            return True
+        # the client level is cached on the client record
+        return client.get_level() >= self.minlevel
+
+    def execute(self, client, data, loud=False, sink=None):
+        """
+        Execute a command.
+        :param client: The client who executed the command.
+        :param data: Extra data to be passed to the command.
+        :param loud: Whether the command output should be sent publicly in the channel.
+        :param sink: An optional callable(context, client, message) which will receive the command replies.
+        """
+        error = None
+        record = self.ircbot.timer.begin()
+        start = time()
+        try:
+            self.func(client=client, data=data, cmd=IRCCommandContext(self, client, loud, sink))
+        except Exception, e:
+            error = e
+            self.ircbot.metrics.command_errors.labels(self.name).inc()
+            raise
+        finally:
+            elapsed = time() - start
+            self.ircbot.timer.end(record)
+            self.ircbot.metrics.commands.labels(self.name).observe(elapsed)
+            if self.ircbot.timer.check(self, data, elapsed, record, error):
+                self.ircbot.metrics.slow_commands.labels(self.name).inc()
+
+    def __repr__(self):
+        """
+        String object representation.
+        :return: A string representing this object.
+        """
+        return '%s<%s> : minlevel<%d> : func<%s>' % (self.__class__.__name__, self.name, self.minlevel, self.func.__name__)
 
-        if self.minlevel == LEVEL_VOICED:
-            # only voiced clients and operators can use it
-            if client.is_voiced() or client.is_oper():
-                return True
 
-        if self.minlevel == LEVEL_OPERATOR:
-            # only operators can use it
-            if client.is_oper():
-                return True
+class IRCCommandContext(object):
+    """
+    Represent a single execution of an IRCCommand.
+    Command handlers receive this object (instead of the command itself) as cmd parameter.
+    """
+    __slots__ = ('command', 'client', 'loud', 'sink', 'parent')
 
-        return False
+    def __init__(self, command, client, loud=False, sink=None, parent=None):
+        """
+        Create a new IRCCommandContext instance.
+        :param command: The IRCCommand being executed.
+        :param client: The client who executed the command.
+        :param loud: Whether the command output should be sent publicly in the channel.
+        :param sink: An optional callable(context, client, message) which will receive the command replies.
+        :param parent: The IRCCommandContext this execution is nested in (i.e: the one of !exec).
+        """
+        self.command = command
+        self.client = client
+        self.loud = loud
+        self.sink = sink
+        self.parent = parent
 
-    def execute(self, client, data, loud=False):
+    @property
+    def name(self):
         """
-        Execute a command.
+        Return the name of the command being executed.
         """
-        cmd = copy(self)
-        cmd.loud = loud
-        self.func(client=client, data=data, cmd=cmd)
+        return self.command.name
+
+    @property
+    def prefix(self):
+        """
+        Return the prefix of the command being executed.
+        """
+        return self.command.prefix
 
     def sayLoudOrPM(self, client, message):
         """
         Send a message to a client or to the channel he is in.
         """
+        if self.sink is not None:
+            # let the sink handle the reply
+            self.sink(self, client, message)
+        else:
+            self.route(client, message)
+
+    def route(self, client, message):
+        """
+        Deliver a message according to the loud flag.
+        """
         if not self.loud:
             # send the message privately
             client.message(message)
@@ -102,4 +156,5 @@ class IRCCommand(object):
         String object representation.
         :return: A string representing this object.
         """
-        return '%s<%s> : minlevel<%d> : func<%s>' % (self.__class__.__name__, self.name, self.minlevel, self.func.__name__)
\ No newline at end of file
+        return '%s<%s> : client<%s> : loud<%s>' % (self.__class__.__name__, self.command.name,
+                                                  self.client.nick, self.loud)
\ No newline at end of file
@@ -0,0 +1,325 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import base64
+import json
+import zlib
+
+from time import time
+
+from irc.client import is_channel
+from irc.dict import IRCDict
+from irc.strings import lower
+from ircbot.colors import ORANGE
+from ircbot.colors import RESET
+from ircbot.command import IRCCommandContext
+
+CTCP_ANNOUNCE = 'B3BOT'     # CTCP used by the BOTs to announce themselves in the channel
+CTCP_RESULT = 'B3RESULT'    # CTCP used to send command results to the responder
+CHUNK_SIZE = 300            # maximum size of a result chunk (the IRC line must stay below 512 bytes)
+
+
+class IRCCoordinatedReply(object):
+    """
+    Results of a coordinated command execution collected by the responder.
+    """
+    context = None          # the IRCCommandContext used to deliver the aggregated reply
+    flushed = False         # whether the aggregated reply has been sent
+
+    def __init__(self, expected):
+        """
+        Create a new IRCCoordinatedReply instance.
+        :param expected: The set of BOT names which are expected to send results.
+        """
+        self.expected = set(expected)
+        self.results = {}
+
+    def add(self, botname, lines):
+        """
+        Store the results of a BOT.
+        :param botname: The name of the BOT.
+        :param lines: The list of lines produced by the command.
+        """
+        self.results[botname] = lines
+
+    def complete(self):
+        """
+        Return True if all the expected BOTs have sent their results.
+        """
+        return self.context is not None and self.expected.issubset(self.results)
+
+    def merge(self):
+        """
+        Merge the results: identical lines are sent once tagged with the names of the BOTs which produced them.
+        :return: A list of lines.
+        """
+        groups = []
+        index = {}
+        for botname in sorted(self.results):
+            for line in self.results[botname]:
+                if line not in index:
+                    index[line] = len(groups)
+                    groups.append((line, []))
+                groups[index[line]][1].append(botname)
+
+        if len(self.results) == 1:
+            return [line for line, bots in groups]
+
+        return ['%s[%s]%s %s' % (ORANGE, 'all' if len(bots) == len(self.results) else ', '.join(bots), RESET, line)
+                for line, bots in groups]
+
+
+class IRCCoordinator(object):
+    """
+    Let the BOTs sharing a channel elect a single responder for commands addressed to all of them.
+    BOTs announce themselves using CTCP: the responder is the one with the lowest nickname. Every
+    BOT executes the command, but instead of replying the others send their results (zlib compressed
+    JSON, base64 encoded and split in chunks) to the responder which merges them into a single reply.
+    """
+    ircbot = None           # IRC BOT object instance
+    connection = None       # server connection instance
+    window = 2.0            # amount of seconds the responder waits for the results of the other BOTs
+
+    def __init__(self, ircbot, window=2.0):
+        """
+        Create a new IRCCoordinator instance.
+        :param ircbot: The IRC BOT object instance.
+        :param window: Amount of seconds the responder waits for the results of the other BOTs.
+        """
+        self.ircbot = ircbot
+        self.connection = ircbot.connection
+        self.window = window
+        self.peers = IRCDict()      # nickname -> BOT name of the other BOTs in the channel
+        self.replies = {}           # command id -> IRCCoordinatedReply (responder side)
+        self.chunks = {}            # (nickname, command id) -> list of received chunks
+        self.sequence = {}          # command hash -> (executions, time of the last execution)
+        for event in ('join', 'part', 'kick', 'quit', 'nick', 'disconnect', 'ctcp', 'ctcpreply'):
+            self.connection.add_global_handler(event, getattr(self, 'on_%s' % event), -15)
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   ELECTION                                                                                                       #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def active(self):
+        """
+        Return True if there are other BOTs to coordinate with.
+        """
+        return len(self.peers) > 0
+
+    def responder(self):
+        """
+        Return the nickname of the elected responder.
+        """
+        return min([self.connection.get_nickname()] + self.peers.keys(), key=lower)
+
+    def is_responder(self):
+        """
+        Return True if this BOT is the elected responder.
+        """
+        return lower(self.responder()) == lower(self.connection.get_nickname())
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   COMMAND EXECUTION                                                                                              #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def command_id(self, nick, command, data):
+        """
+        Build the identifier of a command execution: all the BOTs compute the same one since they see the same
+        messages. Repeated executions of the same command are told apart by a sequence number, which is reset once
+        the command has not been seen for a while so that BOTs joining the channel later get back in sync.
+        """
+        now = time()
+        expiry = self.window * 5
+        for key, (count, last) in self.sequence.items():
+            if now - last >= expiry:
+                del self.sequence[key]
+
+        text = '%s %s %s' % (lower(nick), command, data)
+        count = self.sequence.get(text, (0, 0))[0] + 1
+        self.sequence[text] = (count, now)
+        return '%08x' % (zlib.crc32(('%s %s' % (text, count)).encode('utf-8')) & 0xffffffff)
+
+    def execute(self, cmd, client, data, loud=False):
+        """
+        Execute a command addressed to all the BOTs.
+        :param cmd: The IRCCommand to execute.
+        :param client: The client who executed the command.
+        :param data: Extra data to be passed to the command.
+        :param loud: Whether the command output should be sent publicly in the channel.
+        """
+        lines = []
+        cmd.execute(client=client, data=data, loud=loud, sink=lambda context, target, message: lines.append(message))
+        uid = self.command_id(client.nick, cmd.name, data)
+
+        if not self.is_responder():
+            self.send_result(self.responder(), uid, lines)
+            return
+
+        reply = self.get_reply(uid)
+        reply.context = IRCCommandContext(cmd, client, loud)
+        reply.add(self.ircbot.get_botname(), lines)
+        if reply.complete():
+            self.flush(uid)
+        else:
+            self.connection.execute_delayed(self.window, self.flush, (uid,))
+
+    def get_reply(self, uid):
+        """
+        Return the IRCCoordinatedReply collecting the results of the given command.
+        """
+        if uid not in self.replies:
+            self.replies[uid] = IRCCoordinatedReply(expected=self.peers.values())
+            # results of commands the responder never executes must not pile up
+            self.connection.execute_delayed(self.window * 5, self.expire, (uid, self.replies[uid]))
+        return self.replies[uid]
+
+    def expire(self, uid, reply):
+        """
+        Discard a reply which has not been flushed in time.
+        :param uid: The command identifier.
+        :param reply: The IRCCoordinatedReply to discard (a newer one stored with the same identifier is kept).
+        """
+        if self.replies.get(uid) is reply:
+            del self.replies[uid]
+
+    def flush(self, uid):
+        """
+        Send the aggregated reply of a command.
+        :param uid: The command identifier.
+        """
+        reply = self.replies.get(uid)
+        if not reply or reply.flushed or not reply.context:
+            return
+
+        reply.flushed = True
+        del self.replies[uid]
+        for line in reply.merge():
+            reply.context.route(reply.context.client, line)
+
+    def send_result(self, nick, uid, lines):
+        """
+        Send the results of a command to the responder.
+        :param nick: The nickname of the responder.
+        :param uid: The command identifier.
+        :param lines: The lines produced by the command.
+        """
+        payload = json.dumps({'bot': self.ircbot.get_botname(), 'lines': lines}, separators=(',', ':'))
+        payload = base64.b64encode(zlib.compress(payload.encode('utf-8')))
+        chunks = [payload[i:i + CHUNK_SIZE] for i in xrange(0, len(payload), CHUNK_SIZE)] or ['']
+        for seq, chunk in enumerate(chunks, 1):
+            self.connection.ctcp(CTCP_RESULT, nick, '%s %s/%s %s' % (uid, seq, len(chunks), chunk))
+
+    def on_result(self, nick, parameter):
+        """
+        Handle a result chunk sent by another BOT.
+        :param nick: The nickname of the BOT which sent the chunk.
+        :param parameter: The CTCP parameter: <id> <seq>/<total> <chunk>.
+        """
+        try:
+            uid, counter, chunk = parameter.split(' ', 2)
+            seq, total = [int(x) for x in counter.split('/')]
+        except ValueError:
+            self.ircbot.debug('invalid coordination result received from %s: %s', nick, parameter)
+            return
+
+        key = (lower(nick), uid)
+        chunks = self.chunks.setdefault(key, [None] * total)
+        if len(chunks) != total or not 1 <= seq <= total:
+            del self.chunks[key]
+            return
+
+        chunks[seq - 1] = chunk
+        if None in chunks:
+            return
+
+        del self.chunks[key]
+        try:
+            result = json.loads(zlib.decompress(base64.b64decode(''.join(chunks))).decode('utf-8'))
+        except (TypeError, ValueError, zlib.error), e:
+            self.ircbot.debug('could not decode coordination result received from %s: %s', nick, e)
+            return
+
+        reply = self.get_reply(uid)
+        reply.add(result.get('bot', nick), result.get('lines', []))
+        if reply.complete():
+            self.flush(uid)
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   EVENTS                                                                                                         #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def on_join(self, connection, event):
+        if event.source.nick == connection.get_nickname():
+            # announce ourselves: the other BOTs will reply with a CTCP reply
+            self.connection.ctcp(CTCP_ANNOUNCE, event.target, self.ircbot.get_botname())
+
+    def on_part(self, connection, event):
+        if event.source.nick == connection.get_nickname():
+            self.peers.clear()
+        elif event.source.nick in self.peers:
+            del self.peers[event.source.nick]
+
+    def on_kick(self, connection, event):
+        nick = event.arguments[0]
+        if nick == connection.get_nickname():
+            self.peers.clear()
+        elif nick in self.peers:
+            del self.peers[nick]
+
+    def on_quit(self, connection, event):
+        if event.source.nick in self.peers:
+            del self.peers[event.source.nick]
+
+    def on_nick(self, connection, event):
+        if event.source.nick in self.peers:
+            self.peers[event.target] = self.peers.pop(event.source.nick)
+
+    def on_disconnect(self, connection, event):
+        self.peers.clear()
+        self.replies.clear()
+        self.chunks.clear()
+
+    def is_own(self, nick):
+        """
+        Return True if the given nickname belongs to this BOT (the primary connection or one of its senders).
+        """
+        return nick == self.connection.get_nickname() or bool(self.ircbot.senders and self.ircbot.senders.owns(nick))
+
+    def on_ctcp(self, connection, event):
+        nick = event.source.nick
+        if self.is_own(nick) or len(event.arguments) < 2:
+            return
+
+        if event.arguments[0] == CTCP_ANNOUNCE:
+            self.peers[nick] = event.arguments[1]
+            if is_channel(event.target):
+                self.connection.ctcp_reply(nick, '%s %s' % (CTCP_ANNOUNCE, self.ircbot.get_botname()))
+        elif event.arguments[0] == CTCP_RESULT:
+            self.on_result(nick, event.arguments[1])
+
+    def on_ctcpreply(self, connection, event):
+        if self.is_own(event.source.nick):
+            return
+        if event.arguments[0] == CTCP_ANNOUNCE and len(event.arguments) > 1:
+            self.peers[event.source.nick] = event.arguments[1]
@@ -0,0 +1,202 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import socket
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+from SocketServer import TCPServer
+from threading import Thread
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    """
+    Escape a label value according to the Prometheus text format.
+    :param value: The label value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def number(value):
+    """
+    Format a sample value according to the Prometheus text format.
+    :param value: The sample value.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+def render(metrics):
+    """
+    Render a metrics registry in the Prometheus text format.
+    :param metrics: The IRCMetrics instance.
+    :return: The text to be served.
+    """
+    lines = []
+    for metric in metrics:
+        lines.append('# HELP %s %s' % (metric.name, metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        for value, child in metric.series():
+            labels = '%s="%s"' % (metric.label, escape(value)) if metric.label else ''
+            if metric.kind == 'histogram':
+                prefix = labels + ',' if labels else ''
+                for bound, count in child.cumulative():
+                    lines.append('%s_bucket{%sle="%s"} %s' % (metric.name, prefix, number(bound), count))
+                lines.append('%s_sum%s %s' % (metric.name, '{%s}' % labels if labels else '', repr(child.sum)))
+                lines.append('%s_count%s %s' % (metric.name, '{%s}' % labels if labels else '', child.count))
+            else:
+                sample = child.get()
+                if sample is None:
+                    # not measured yet
+                    continue
+                lines.append('%s%s %s' % (metric.name, '{%s}' % labels if labels else '', number(sample)))
+    return '\n'.join(lines) + '\n'
+
+
+class IRCMetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve the metrics registry on GET /metrics.
+    """
+    def do_GET(self):
+        """
+        Handle a GET request.
+        """
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = render(self.server.metrics)
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        """
+        Return the client address (unix socket clients have none).
+        """
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        """
+        Log requests using the IRC BOT logger.
+        """
+        self.server.ircbot.verbose('metrics endpoint: %s - %s', self.address_string(), format % args)
+
+
+class IRCMetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server exposing the metrics registry on a TCP port.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class IRCMetricsServer6(IRCMetricsServer):
+    """
+    HTTP server exposing the metrics registry on an IPv6 TCP port.
+    """
+    address_family = socket.AF_INET6
+
+
+class IRCMetricsUnixServer(IRCMetricsServer):
+    """
+    HTTP server exposing the metrics registry on a unix socket.
+    """
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        """
+        Bind the unix socket (HTTPServer.server_bind expects a (host, port) address).
+        """
+        if os.path.exists(self.server_address):
+            # stale socket left by a previous run
+            os.unlink(self.server_address)
+        TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class IRCMetricsExporter(object):
+    """
+    Expose the IRC BOT metrics in the Prometheus text format from a dedicated thread.
+    """
+    ircbot = None       # IRC BOT object instance
+    address = None      # (host, port) tuple or unix socket path
+    server = None       # the HTTP server instance
+    thread = None       # the thread serving requests
+
+    def __init__(self, ircbot, listen):
+        """
+        Create a new IRCMetricsExporter instance.
+        :param ircbot: The IRC BOT object instance.
+        :param listen: A unix socket path or a [host:]port string (IPv6 hosts must be written as [host]).
+                       The host defaults to 127.0.0.1.
+        """
+        self.ircbot = ircbot
+        self.address = self.parse(listen)
+
+    @staticmethod
+    def parse(listen):
+        """
+        Parse the address the exporter should listen on.
+        :param listen: A unix socket path or a [host:]port string (IPv6 hosts must be written as [host]).
+                       The host defaults to 127.0.0.1.
+        :return: A unix socket path or a (host, port) tuple.
+        """
+        if '/' in listen:
+            return listen
+        host, _, port = listen.rpartition(':')
+        return host.strip('[]') or '127.0.0.1', int(port)
+
+    def start(self):
+        """
+        Start serving requests.
+        """
+        if isinstance(self.address, tuple):
+            server_class = IRCMetricsServer6 if ':' in self.address[0] else IRCMetricsServer
+        else:
+            server_class = IRCMetricsUnixServer
+
+        self.server = server_class(self.address, IRCMetricsRequestHandler)
+        self.server.ircbot = self.ircbot
+        self.server.metrics = self.ircbot.metrics
+        self.thread = Thread(target=self.server.serve_forever, name='ircbot-metrics')
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.ircbot.debug('serving metrics on %s', self.address)
+
+    def stop(self):
+        """
+        Stop serving requests.
+        """
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.server = None
@@ -0,0 +1,100 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import re
+
+from ircbot.fakes.storage import FakeGroup
+
+
+class FakeCommand(object):
+    """
+    B3 command stand-in.
+    """
+    def __init__(self, plugin, command, level, func):
+        self.plugin = plugin
+        self.command = command
+        self.level = level
+        self.func = func
+        self.time = 0
+
+    def __repr__(self):
+        return '%s<%s>' % (self.__class__.__name__, self.command)
+
+
+class FakeAdminConfig(object):
+    """
+    Admin plugin configuration stand-in.
+    """
+    def getDuration(self, section, option):
+        return 1440
+
+
+class FakeAdminPlugin(object):
+    """
+    Admin plugin stand-in providing the command prefixes, the user input parsing and a few B3 commands
+    reaching the RCON (list, nextmap, say) and the storage (leveltest) to be executed with !exec.
+    """
+    cmdPrefix = '!'
+    cmdPrefixLoud = '@'
+    cmdPrefixBig = '&'
+
+    def __init__(self, console):
+        """
+        Create a new FakeAdminPlugin instance.
+        :param console: The FakeConsole instance.
+        """
+        self.console = console
+        self.config = FakeAdminConfig()
+        self._commands = {}
+        for name in ('leveltest', 'list', 'nextmap', 'say'):
+            self.registerCommand(self, name, 0, getattr(self, 'cmd_%s' % name))
+        console._plugins['admin'] = self
+
+    def registerCommand(self, plugin, command, level, handler, alias=None, secretLevel=None):
+        self._commands[command] = FakeCommand(plugin, command, level, handler)
+        if alias:
+            self._commands[alias] = self._commands[command]
+
+    @staticmethod
+    def parseUserCmd(data):
+        """
+        Split the input in a (client handle, parameters) tuple.
+        """
+        m = re.match(r'^(?P<cid>\S+)\s*(?P<parms>.*)$', data or '')
+        if not m:
+            return None
+        return m.group('cid'), m.group('parms') or None
+
+    @staticmethod
+    def getReason(keyword):
+        return keyword or ''
+
+    def cmd_leveltest(self, data, client=None, cmd=None):
+        for bclient in self.console.clients.lookupByName(data or client.name)[:1]:
+            group = self.console.storage.getGroup(FakeGroup(None, None, None, bclient.maxLevel))
+            cmd.sayLoudOrPM(client, '%s is a %s' % (bclient.name, group.name))
+
+    def cmd_list(self, data, client=None, cmd=None):
+        names = ['^7[^2%s^7] %s' % (bclient.cid, bclient.name) for bclient in self.console.clients.getList()]
+        cmd.sayLoudOrPM(client, ', '.join(names) or '^7no players online')
+
+    def cmd_nextmap(self, data, client=None, cmd=None):
+        cmd.sayLoudOrPM(client, '^7next map: ^2%s' % self.console.getNextMap())
+
+    def cmd_say(self, data, client=None, cmd=None):
+        self.console.say('^7%s: ^3%s' % (client.name, data))
@@ -0,0 +1,346 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import random
+import re
+
+from collections import deque
+from threading import RLock
+from time import localtime
+from time import strftime
+from time import time
+from ircbot.fakes.latency import FakeLatency
+from ircbot.fakes.latency import delayed
+from ircbot.fakes.storage import FakePenalty
+from ircbot.fakes.storage import FakeStorage
+
+# the events the IRC BOT plugin registers
+EVENTS = ('EVT_CLIENT_SAY', 'EVT_CLIENT_BAN', 'EVT_CLIENT_BAN_TEMP', 'EVT_CLIENT_KICK', 'EVT_CLIENT_UNBAN',
+          'EVT_GAME_MAP_CHANGE')
+
+MAPS = ('ut4_turnpike', 'ut4_casa', 'ut4_abbey', 'ut4_algiers', 'ut4_uptown', 'ut4_tombs')
+
+
+class FakeAlias(object):
+    def __init__(self, alias, numUsed=1):
+        self.alias = alias
+        self.numUsed = numUsed
+
+
+class FakeClient(object):
+    """
+    B3 client stand-in: penalties are written to the fake storage and produce events on the fake console.
+    """
+    id = None
+    cid = None
+    name = ''
+    exactName = ''
+    ip = ''
+    guid = ''
+    pbid = ''
+    groupBits = 1
+    connections = 1
+    numWarnings = 0
+    numBans = 0
+    timeAdd = None
+    timeEdit = None
+
+    def __init__(self, console=None, **kwargs):
+        self.console = console
+        self.timeAdd = self.timeEdit = int(time())
+        self.aliases = []
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        self.exactName = self.exactName or self.name
+
+    def __repr__(self):
+        return '%s<@%s:%s:%s>' % (self.__class__.__name__, self.id, self.cid, self.name)
+
+    @property
+    def maxLevel(self):
+        levels = [group.level for group in self.console.storage.groups if group.id & self.groupBits]
+        return max(levels or [0])
+
+    def inGroup(self, group):
+        return bool(group.id & self.groupBits)
+
+    def save(self):
+        self.timeEdit = int(time())
+        return self.console.storage.setClient(self)
+
+    def message(self, text):
+        self.console.message(self, text)
+
+    def penalize(self, type, reason, keyword, duration=None, admin=None):
+        penalty = FakePenalty(type=type, clientId=self.id, adminId=admin.id if admin else None, reason=reason,
+                              keyword=keyword, duration=duration)
+        if duration:
+            penalty.timeExpire = int(time() + duration * 60)
+        self.console.storage.setClientPenalty(penalty)
+        return penalty
+
+    def ban(self, reason='', keyword=None, duration=None, admin=None, silent=False, data='', **kwargs):
+        self.penalize('Ban', reason, keyword, admin=admin)
+        self.numBans += 1
+        self.console.queueEvent(FakeEvent('EVT_CLIENT_BAN', {'reason': reason, 'admin': admin}, self))
+        self.console.clients.disconnect(self)
+
+    def tempban(self, reason='', keyword=None, duration=2, admin=None, silent=False, data='', **kwargs):
+        self.penalize('TempBan', reason, keyword, duration, admin)
+        self.numBans += 1
+        self.console.queueEvent(FakeEvent('EVT_CLIENT_BAN_TEMP', {'reason': reason, 'duration': duration,
+                                                                  'admin': admin}, self))
+        self.console.clients.disconnect(self)
+
+    def unban(self, reason='', admin=None, silent=False, **kwargs):
+        for penalty in self.console.storage.getClientPenalties(self, type=('Ban', 'TempBan')):
+            penalty.inactive = 1
+        self.console.queueEvent(FakeEvent('EVT_CLIENT_UNBAN', {'reason': reason, 'admin': admin}, self))
+
+    def kick(self, reason='', keyword=None, admin=None, silent=False, data='', **kwargs):
+        self.penalize('Kick', reason, keyword, admin=admin)
+        self.console.queueEvent(FakeEvent('EVT_CLIENT_KICK', {'reason': reason, 'admin': admin}, self))
+        self.console.clients.disconnect(self)
+
+
+class FakeClients(object):
+    """
+    Online clients manager stand-in: name lookups go through the fake storage like the B3 ones.
+    """
+    def __init__(self, console):
+        self.console = console
+        self.lock = RLock()
+        self.online = {}        # slot -> client
+
+    def getList(self):
+        with self.lock:
+            return sorted(self.online.values(), key=lambda x: int(x.cid))
+
+    def getByCID(self, cid):
+        return self.online.get(str(cid))
+
+    def getByDB(self, data):
+        """
+        :param data: A database id prefixed with '@'.
+        """
+        try:
+            return [self.console.storage.getClient(FakeClient(id=int(data.lstrip('@'))))]
+        except (KeyError, ValueError):
+            return []
+
+    def lookupByName(self, name):
+        name = name.lower()
+        matches = [client for client in self.getList() if name in client.name.lower()]
+        if not matches:
+            matches = self.console.storage.getClientsMatching({'%name%': name})
+        # an exact match wins over partial ones
+        exact = [client for client in matches if client.name.lower() == name]
+        return exact or matches
+
+    def connect(self, client):
+        with self.lock:
+            if client.cid is None:
+                client.cid = str(min(set(range(64)) - set(int(x) for x in self.online)))
+            client.connections += 1
+            self.online[str(client.cid)] = client
+
+    def disconnect(self, client):
+        with self.lock:
+            self.online.pop(str(client.cid), None)
+        client.cid = None
+
+
+class FakeCvar(object):
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return '%s<%s=%s>' % (self.__class__.__name__, self.name, self.value)
+
+    def getString(self):
+        return str(self.value)
+
+    def getInt(self):
+        return int(self.value)
+
+    def getFloat(self):
+        return float(self.value)
+
+    def getBoolean(self):
+        return self.getString().lower() in ('1', 'yes', 'on', 'true')
+
+
+class FakeGame(object):
+    gameName = 'iourt42'
+    mapName = MAPS[0]
+
+
+class FakeEvent(object):
+    """
+    B3 event stand-in.
+    """
+    def __init__(self, type, data=None, client=None, target=None):
+        self.type = type
+        self.data = data
+        self.client = client
+        self.target = target
+        self.time = int(time())
+
+    def __repr__(self):
+        return '%s<%s:%r>' % (self.__class__.__name__, self.type, self.data)
+
+
+class FakeConsoleConfig(object):
+    """
+    Main B3 configuration stand-in.
+    """
+    values = {
+        ('server', 'public_ip'): '127.0.0.1',
+        ('server', 'port'): '27960',
+        ('b3', 'time_format'): '%I:%M%p %Z %m/%d/%y',
+    }
+
+    def get(self, section, option):
+        return self.values[(section, option)]
+
+
+class FakeConsole(object):
+    """
+    In process B3 console (parser) stand-in: every RCON operation waits for the configured latency to simulate
+    a slow or distant game server while storage queries wait for the storage latency.
+    """
+    def __init__(self, rcon=None, storage=None):
+        """
+        Create a new FakeConsole instance.
+        :param rcon: A FakeLatency instance simulating the RCON round trip.
+        :param storage: A FakeStorage instance (an empty one without latency is created if not given).
+        """
+        self.latency = rcon or FakeLatency()
+        self.storage = storage or FakeStorage()
+        self.clients = FakeClients(self)
+        self.game = FakeGame()
+        self.config = FakeConsoleConfig()
+        self.cvars = {'sv_maxclients': FakeCvar('sv_maxclients', 32), 'g_gametype': FakeCvar('g_gametype', 4)}
+        self.events = deque(maxlen=1000)        # the events queued by the fake clients
+        self.said = deque(maxlen=1000)          # the messages sent to the game server
+        self.started = time()
+        self._plugins = {}
+
+    def populate(self, players=12, stored=0, bans=0, seed=None):
+        """
+        Fill the console with online players and the storage with offline clients and bans.
+        :param players: The amount of online players.
+        :param stored: The amount of offline clients in the storage.
+        :param bans: The amount of ban penalties issued to stored clients.
+        :param seed: The seed of the random generator.
+        :return: This FakeConsole instance.
+        """
+        generator = random.Random(seed)
+        latency, self.storage.latency = self.storage.latency, FakeLatency()
+        try:
+            admin = FakeClient(self, name='admin', guid='ADMIN', groupBits=128)
+            admin.save()
+            for index in range(players + stored):
+                client = FakeClient(self, name='player%s' % index, guid='GUID%032d' % index,
+                                    ip='10.0.%s.%s' % (index // 250, index % 250 + 1), groupBits=1,
+                                    connections=generator.randint(1, 500))
+                client.aliases = [FakeAlias('alias%s' % x, generator.randint(1, 20)) for x in range(3)]
+                client.save()
+                if index < players:
+                    self.clients.connect(client)
+            offline = [client for client in self.storage.clients.values() if client.cid is None and client is not admin]
+            for index in range(min(bans, len(offline))):
+                client = generator.choice(offline)
+                client.penalize(generator.choice(('Ban', 'TempBan')), 'banned %s' % index, 'bench',
+                                duration=generator.randint(60, 10000), admin=admin)
+                client.numBans += 1
+        finally:
+            self.storage.latency = latency
+        return self
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   RCON                                                                                                           #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    @delayed
+    def write(self, command):
+        """
+        Send a command to the game server: every RCON operation ends up here (like in the B3 parsers).
+        """
+        return ''
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def say(self, text):
+        self.write('say %s' % text)
+        self.said.append(text)
+
+    def saybig(self, text):
+        self.write('bigtext "%s"' % text)
+        self.said.append(text)
+
+    def message(self, client, text):
+        self.write('tell %s %s' % (client.cid if client else '', text))
+        self.said.append('%s: %s' % (client.name if client else '', text))
+
+    def getCvar(self, name):
+        self.write(name)
+        return self.cvars.get(name)
+
+    def setCvar(self, name, value):
+        self.write('set %s "%s"' % (name, value))
+        self.cvars[name] = FakeCvar(name, value)
+
+    def getNextMap(self):
+        self.write('g_nextmap')
+        return MAPS[(MAPS.index(self.game.mapName) + 1) % len(MAPS)] if self.game.mapName in MAPS else MAPS[0]
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   OTHER METHODS                                                                                                  #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def getPlugin(self, name):
+        return self._plugins.get(name)
+
+    @staticmethod
+    def getEventID(name):
+        return EVENTS.index(name) if name in EVENTS else None
+
+    def queueEvent(self, event):
+        self.events.append(event)
+
+    @staticmethod
+    def stripColors(text):
+        return re.sub(r'\^[0-9a-z]', '', text)
+
+    def formatTime(self, gmttime):
+        return strftime(self.config.get('b3', 'time_format'), localtime(gmttime))
+
+    @staticmethod
+    def time():
+        return int(time())
+
+    def upTime(self):
+        return int(time() - self.started)
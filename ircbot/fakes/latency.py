@@ -0,0 +1,94 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import random
+import re
+
+from functools import wraps
+from threading import Lock
+from time import sleep
+
+
+class FakeLatency(object):
+    """
+    Simulate the latency of a slow backend (i.e: MySQL or RCON): every call waits for delay +/- jitter seconds.
+    """
+    delay = 0.0         # average amount of seconds spent in every call
+    jitter = 0.0        # maximum deviation from the average (uniformly distributed)
+    calls = 0           # amount of calls
+    slept = 0.0         # amount of seconds spent waiting
+
+    def __init__(self, delay=0.0, jitter=0.0, seed=None):
+        """
+        Create a new FakeLatency instance.
+        :param delay: The average amount of seconds spent in every call.
+        :param jitter: The maximum deviation from the average.
+        :param seed: The seed of the random generator (for reproducible runs).
+        """
+        self.delay = delay
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = Lock()
+
+    def __repr__(self):
+        return '%s<%.1fms +/- %.1fms>' % (self.__class__.__name__, self.delay * 1000, self.jitter * 1000)
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """
+        Create a FakeLatency instance from a string like '50' or '50+-10' (milliseconds).
+        :param spec: The latency specification.
+        :param seed: The seed of the random generator.
+        :raise ValueError: If the specification is not valid.
+        """
+        match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*(?:\+-\s*(\d+(?:\.\d+)?))?\s*$', spec or '0')
+        if not match:
+            raise ValueError('invalid latency: %s' % spec)
+        return cls(float(match.group(1)) / 1000, float(match.group(2) or 0) / 1000, seed)
+
+    def wait(self):
+        """
+        Wait for the configured latency.
+        """
+        seconds = 0.0
+        with self.lock:
+            self.calls += 1
+            if self.delay > 0 or self.jitter > 0:
+                seconds = max(0.0, self.delay + self.random.uniform(-self.jitter, self.jitter))
+                self.slept += seconds
+        if seconds:
+            sleep(seconds)
+
+    def reset(self):
+        """
+        Reset the counters.
+        """
+        with self.lock:
+            self.calls = 0
+            self.slept = 0.0
+
+
+def delayed(method):
+    """
+    Make the decorated method wait for the latency of its object (self.latency) before executing.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.latency.wait()
+        return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,59 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+class FakeSocket(object):
+    """
+    Socket serving the traffic fed to it in chunks and swallowing everything sent by the BOT.
+    """
+    def __init__(self, data='', chunk=16384):
+        """
+        :param data: The raw traffic to serve.
+        :param chunk: The size of the chunks returned by recv().
+        """
+        self.data = data
+        self.chunk = chunk
+        self.offset = 0
+        self.sent = 0
+        self.sent_bytes = 0
+
+    def feed(self, data):
+        """
+        Append traffic to be served (the part already served is discarded).
+        """
+        self.data = self.data[self.offset:] + data
+        self.offset = 0
+
+    def pending(self):
+        return self.offset < len(self.data)
+
+    def recv(self, size):
+        size = min(size, self.chunk)
+        data = self.data[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def send(self, data):
+        self.sent += 1
+        self.sent_bytes += len(data)
+        return len(data)
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,109 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import logging
+
+from ircbot import IrcbotPlugin
+from ircbot.fakes.admin import FakeAdminPlugin
+from ircbot.fakes.console import FakeConsole
+
+
+class FakeConfig(object):
+    """
+    Plugin configuration stand-in registering the given IRC commands.
+    """
+    fileName = None
+
+    def __init__(self, commands=None):
+        """
+        :param commands: A dict of command name -> minimum level.
+        """
+        self.commands = dict(commands or {})
+
+    def sections(self):
+        return ['commands-irc'] if self.commands else []
+
+    def options(self, section):
+        return list(self.commands)
+
+    def getint(self, section, option):
+        return self.commands[option]
+
+
+class FakePlugin(object):
+    """
+    IRC BOT plugin stand-in running on a FakeConsole: the B3 event handlers are the real ones.
+    """
+    ircbot = None
+
+    onSay = IrcbotPlugin.__dict__['onSay']
+    onBan = IrcbotPlugin.__dict__['onBan']
+    onKick = IrcbotPlugin.__dict__['onKick']
+    onMapChange = IrcbotPlugin.__dict__['onMapChange']
+
+    # settings which would make the BOT touch the filesystem, the network or spawn threads
+    defaults = {
+        'servers': [('127.0.0.1', 6667)],
+        'relay': '',
+        'coordinate': False,
+        'senders': 0,
+        'trace_interval': 0,
+        'capture_file': '',
+        'outage_file': '',
+        'metrics_listen': '',
+        'perform': [],
+    }
+
+    def __init__(self, console=None, commands=None, log=None, **settings):
+        """
+        Create a new FakePlugin instance.
+        :param console: The FakeConsole instance (one with 12 online players is created if not given).
+        :param commands: A dict of IRC command name -> minimum level.
+        :param log: The logger to be used (defaults to ircbot.fakes).
+        :param settings: Plugin settings overriding the defaults.
+        """
+        self.console = console or FakeConsole().populate()
+        self.adminPlugin = self.console.getPlugin('admin') or FakeAdminPlugin(self.console)
+        self.config = FakeConfig(commands)
+        self.log = log or logging.getLogger('ircbot.fakes')
+        self.serverinfo = {'ip': self.console.config.get('server', 'public_ip'),
+                           'port': self.console.config.get('server', 'port')}
+        self.settings = dict(IrcbotPlugin.settings)
+        self.settings.update(self.defaults)
+        self.settings.update(settings)
+
+    def critical(self, msg, *args, **kwargs):
+        self.log.critical(msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log.debug(msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log.error(msg, *args, **kwargs)
+
+    def fatal(self, msg, *args, **kwargs):
+        self.log.critical(msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log.info(msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log.warning(msg, *args, **kwargs)
+
+    def verbose(self, msg, *args, **kwargs):
+        self.log.debug(msg, *args, **kwargs)
@@ -0,0 +1,192 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from threading import RLock
+from time import time
+from ircbot.fakes.latency import FakeLatency
+from ircbot.fakes.latency import delayed
+
+
+class FakeGroup(object):
+    """
+    B3 group stand-in: the id is the group bit.
+    """
+    def __init__(self, id, name, keyword, level):
+        self.id = id
+        self.name = name
+        self.keyword = keyword
+        self.level = level
+
+    def __repr__(self):
+        return '%s<%s:%s>' % (self.__class__.__name__, self.keyword, self.level)
+
+
+class FakePenalty(object):
+    """
+    B3 penalty stand-in.
+    """
+    id = None
+    type = 'Ban'
+    clientId = None
+    adminId = None
+    reason = ''
+    keyword = ''
+    duration = None
+    timeAdd = None
+    timeExpire = -1         # -1 for permanent penalties
+    inactive = 0
+
+    def __init__(self, **kwargs):
+        self.timeAdd = int(time())
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '%s<%s@%s:%s>' % (self.__class__.__name__, self.type, self.id, self.clientId)
+
+
+# the default B3 groups
+GROUPS = (
+    FakeGroup(0, 'Guest', 'guest', 0),
+    FakeGroup(1, 'User', 'user', 1),
+    FakeGroup(2, 'Regular', 'reg', 2),
+    FakeGroup(8, 'Moderator', 'mod', 20),
+    FakeGroup(16, 'Admin', 'admin', 40),
+    FakeGroup(32, 'Full Admin', 'fulladmin', 60),
+    FakeGroup(64, 'Senior Admin', 'senioradmin', 80),
+    FakeGroup(128, 'Super Admin', 'superadmin', 100),
+)
+
+
+class FakeStorage(object):
+    """
+    In memory B3 storage stand-in: every query waits for the configured latency to simulate a slow database.
+    """
+    def __init__(self, latency=None):
+        """
+        Create a new FakeStorage instance.
+        :param latency: A FakeLatency instance simulating the database round trip.
+        """
+        self.latency = latency or FakeLatency()
+        self.lock = RLock()
+        self.clients = {}       # client id -> client
+        self.penalties = []     # list of FakePenalty objects
+        self.groups = list(GROUPS)
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   CLIENTS                                                                                                        #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    @delayed
+    def getClient(self, client):
+        """
+        Return the stored client matching the id (or the guid) of the given one.
+        :raise KeyError: If no client matches.
+        """
+        with self.lock:
+            if getattr(client, 'id', None) in self.clients:
+                return self.clients[client.id]
+            guid = getattr(client, 'guid', None)
+            for stored in self.clients.values():
+                if guid and stored.guid == guid:
+                    return stored
+        raise KeyError('no client matching id %s' % getattr(client, 'id', None))
+
+    @delayed
+    def getClientsMatching(self, match):
+        """
+        Return the stored clients whose name contains the given string.
+        :param match: A dict like {'%name%': <name>} (as used by B3 name lookups) or a string.
+        """
+        name = (match.get('%name%') or match.get('name') or '') if isinstance(match, dict) else match
+        name = name.lower()
+        with self.lock:
+            return [client for client in self.clients.values() if name in client.name.lower()]
+
+    @delayed
+    def setClient(self, client):
+        """
+        Store a client: return its id.
+        """
+        with self.lock:
+            if not client.id:
+                client.id = max(self.clients.keys() or [1]) + 1
+            self.clients[client.id] = client
+            return client.id
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   GROUPS                                                                                                         #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    @delayed
+    def getGroup(self, group):
+        """
+        Return the group matching the keyword (or the level) of the given one.
+        :raise KeyError: If no group matches.
+        """
+        keyword = getattr(group, 'keyword', None)
+        level = getattr(group, 'level', None)
+        for stored in self.groups:
+            if (keyword and stored.keyword == keyword) or (not keyword and stored.level == level):
+                return stored
+        raise KeyError('no group matching %s' % (keyword or level))
+
+    @delayed
+    def getGroups(self):
+        return list(self.groups)
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   PENALTIES                                                                                                      #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    @delayed
+    def getClientPenalties(self, client, type='Ban'):
+        """
+        Return the active penalties of the given type issued to a client.
+        """
+        now = time()
+        types = type if isinstance(type, (list, tuple)) else (type,)
+        with self.lock:
+            return [p for p in self.penalties if p.clientId == client.id and p.type in types and not p.inactive and
+                    (p.timeExpire == -1 or p.timeExpire > now)]
+
+    @delayed
+    def setClientPenalty(self, penalty):
+        """
+        Store a penalty: return its id.
+        """
+        with self.lock:
+            if not penalty.id:
+                penalty.id = len(self.penalties) + 1
+                self.penalties.append(penalty)
+            return penalty.id
+
+    @delayed
+    def getCounts(self):
+        with self.lock:
+            counts = {'clients': len(self.clients), 'Bans': 0, 'TempBans': 0, 'Kicks': 0, 'Warnings': 0}
+            for penalty in self.penalties:
+                key = penalty.type + 's'
+                counts[key] = counts.get(key, 0) + 1
+            return counts
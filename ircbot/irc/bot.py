@@ -96,7 +96,7 @@ class SingleServerIRCBot(SimpleIRCClient):
 
     def _connected_checker(self):
         """[Internal]"""
-        if not self.connection.is_connected():
+        if not self.connection.is_connected() and not self.connection.is_connecting():
             self.connection.execute_delayed(self.reconnection_interval,
                                             self._connected_checker)
             self.jump_server()
@@ -104,12 +104,15 @@ class SingleServerIRCBot(SimpleIRCClient):
     def _connect(self):
         """
         Establish a connection to the server at the front of the server_list.
+        The other servers are raced against it if the connection factory
+        supports it.
         """
         server = self.server_list[0]
+        alternates = [(s.host, s.port) for s in self.server_list[1:]]
         try:
             self.connect(server.host, server.port, self._nickname,
                 server.password, ircname=self._realname,
-                **self.__connect_params)
+                alternates=alternates, **self.__connect_params)
         except ServerConnectionError:
             pass
 
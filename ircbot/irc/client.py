@@ -80,7 +80,7 @@ from . import buffer
 from . import schedule
 from . import features
 from . import ctcp
-from ircbot.irc import message, buffer, features, events, schedule, ctcp, functools, connection
+from ircbot.irc import message, buffer, features, events, schedule, ctcp, connection
 
 log = logging.getLogger('output')
 
@@ -193,10 +193,16 @@ class Reactor(object):
 
         self.add_global_handler("ping", _ping_ponger, -42)
 
-    def server(self):
-        """Creates and returns a ServerConnection object."""
+    def server(self, connection_class=None):
+        """Creates and returns a ServerConnection object.
 
-        c = ServerConnection(self)
+        Arguments:
+
+            connection_class -- A ServerConnection subclass to be used
+                                instead of ServerConnection.
+        """
+
+        c = (connection_class or ServerConnection)(self)
         with self.mutex:
             self.connections.append(c)
         return c
@@ -215,6 +221,19 @@ class Reactor(object):
                 if s == c.socket:
                     c.process_data()
 
+    def process_connect(self, sockets):
+        """Called when connection sockets with a connection attempt in
+        progress become writable (or report an error).
+
+        Arguments:
+
+            sockets -- A list of socket objects.
+        """
+        with self.mutex:
+            for s, c in itertools.product(sockets, self.connections):
+                if c.connecting and c.connector and s in c.connector.pending:
+                    c.process_connect(s)
+
     def process_timeout(self):
         """Called when a timeout notification is due.
 
@@ -225,10 +244,14 @@ class Reactor(object):
                 command = self.delayed_commands[0]
                 if not command.due():
                     break
-                command.function()
+                del self.delayed_commands[0]
                 if isinstance(command, schedule.PeriodicCommand):
                     self._schedule_command(command.next())
-                del self.delayed_commands[0]
+                # a failing command must not take the reactor down
+                try:
+                    command.function()
+                except Exception:
+                    log.exception("[jaraco.irc] error while executing scheduled command")
 
     @property
     def sockets(self):
@@ -238,6 +261,19 @@ class Reactor(object):
                 for conn in self.connections
                 if conn is not None
                 and conn.socket is not None
+                and not conn.connecting
+            ]
+
+    @property
+    def connecting_sockets(self):
+        with self.mutex:
+            return [
+                sock
+                for conn in self.connections
+                if conn is not None
+                and conn.connecting
+                and conn.connector is not None
+                for sock in conn.connector.sockets
             ]
 
     def process_once(self, timeout=0):
@@ -253,8 +289,11 @@ class Reactor(object):
         at the process_forever method.
         """
         sockets = self.sockets
-        if sockets:
-            (i, o, e) = select.select(sockets, [], [], timeout)
+        connecting = self.connecting_sockets
+        if sockets or connecting:
+            (i, o, e) = select.select(sockets, connecting, connecting, timeout)
+            if o or e:
+                self.process_connect(set(o + e))
             self.process_data(i)
         else:
             time.sleep(timeout)
@@ -416,6 +455,8 @@ class Connection(object):
     def socket(self):
         "The socket for this connection"
 
+    connecting = False
+
     def __init__(self, reactor):
         self.reactor = reactor
 
@@ -448,6 +489,9 @@ class ServerConnection(Connection):
 
     buffer_class = buffer.DecodingLineBuffer
     socket = None
+    connector = None
+    attempt = None
+    last_read = 0
 
     def __init__(self, reactor):
         super(ServerConnection, self).__init__(reactor)
@@ -456,7 +500,7 @@ class ServerConnection(Connection):
 
     # save the method args to allow for easier reconnection.
     @irc_functools.save_method_args
-    def connect(self, server, port, nickname, password=None, username=None, ircname=None, connect_factory=connection.Factory()):
+    def connect(self, server, port, nickname, password=None, username=None, ircname=None, connect_factory=connection.Factory(), alternates=()):
         """Connect/reconnect to a server.
 
         Arguments:
@@ -470,6 +514,8 @@ class ServerConnection(Connection):
         * server_address - The remote host/port of the server
         * connect_factory - A callable that takes the server address and
           returns a connection (with a socket interface)
+        * alternates - (host, port) pairs to race against the server when
+          the factory is non-blocking: the first one to answer is used
 
         This function can be called to reconnect a closed connection.
 
@@ -479,6 +525,8 @@ class ServerConnection(Connection):
 
         if self.connected:
             self.disconnect("Changing servers")
+        elif self.connecting:
+            self._abort_connect()
 
         self.buffer = self.buffer_class()
         self.handlers = {}
@@ -492,11 +540,38 @@ class ServerConnection(Connection):
         self.ircname = ircname or nickname
         self.password = password
         self.connect_factory = connect_factory
+        if getattr(self.connect_factory, 'nonblocking', False):
+            # the connection will be completed by the reactor (see
+            # process_connect): failures are reported as disconnections
+            addresses = [self.server_address] + [tuple(a) for a in alternates]
+            attempt = self.attempt = object()
+            self.connecting = True
+            if self.connect_factory.resolved(addresses):
+                self._connect_resolved(attempt, *self._connect_resolve(addresses))
+            else:
+                # a slow resolver must not stall the reactor: the addresses
+                # are resolved in a helper thread which hands the result back
+                thread = threading.Thread(target=self._connect_lookup,
+                                          args=(attempt, addresses),
+                                          name='irc-resolver')
+                thread.daemon = True
+                thread.start()
+            timeout = self.connect_factory.timeout
+            if timeout and self.attempt is attempt:
+                self.execute_delayed(timeout, self._connect_timeout,
+                                     (attempt,))
+            return self
         try:
             self.socket = self.connect_factory(self.server_address)
         except socket.error as ex:
             raise ServerConnectionError("Couldn't connect to socket: %s" % ex)
+        self._connected()
+        return self
+
+    def _connected(self):
+        """[Internal]"""
         self.connected = True
+        self.last_read = time.time()
         self.reactor._on_connect(self.socket)
 
         # Log on...
@@ -504,7 +579,88 @@ class ServerConnection(Connection):
             self.pass_(self.password)
         self.nick(self.nickname)
         self.user(self.username, self.ircname)
-        return self
+
+    def process_connect(self, sock):
+        """Complete a non-blocking connection attempt on the given socket."""
+        connector = self.connector
+        result = connector.ready(sock)
+        if result is None:
+            if connector.exhausted:
+                # every candidate failed: drop the cached addresses too
+                # in case the servers moved somewhere else
+                self._abort_connect()
+                self.connect_factory.cache.invalidate()
+                self._connect_failed("Couldn't connect to socket: %s" % connector.error())
+            return
+        self.socket, self.server_address = result
+        self.server, self.port = self.server_address
+        self.connector = None
+        self.connecting = False
+        self.attempt = None
+        log.verbose("[jaraco.irc] connected to %s:%s", self.server, self.port)
+        self._connected()
+
+    def _connect_resolve(self, addresses):
+        """[Internal]"""
+        try:
+            return self.connect_factory.attempt(addresses), None
+        except socket.error as ex:
+            return None, ex
+
+    def _connect_lookup(self, attempt, addresses):
+        """[Internal] Executed by the resolver thread."""
+        self.execute_delayed(0, self._connect_resolved,
+                             (attempt,) + self._connect_resolve(addresses))
+
+    def _connect_resolved(self, attempt, connector, error):
+        """[Internal]"""
+        if not self.connecting or self.attempt is not attempt:
+            # aborted (or superseded by another attempt) while resolving
+            return
+        if connector is None:
+            self._abort_connect()
+            self._connect_failed("Couldn't resolve server address: %s" % error)
+            return
+        self.connector = connector
+        if not connector.next():
+            self._abort_connect()
+            self._connect_failed("Couldn't connect to socket: %s" % connector.error())
+            return
+        if connector.candidates:
+            self.execute_delayed(self.connect_factory.stagger,
+                                 self._connect_stagger, (connector,))
+
+    def _connect_stagger(self, connector):
+        """[Internal]"""
+        if self.connecting and self.connector is connector:
+            connector.next()
+            if connector.candidates:
+                self.execute_delayed(self.connect_factory.stagger,
+                                     self._connect_stagger, (connector,))
+
+    def _connect_timeout(self, attempt):
+        """[Internal]"""
+        if self.connecting and self.attempt is attempt:
+            self._abort_connect()
+            self._connect_failed("Couldn't connect to socket: timed out")
+
+    def _abort_connect(self):
+        """[Internal]"""
+        self.connecting = False
+        self.attempt = None
+        if self.connector:
+            self.connector.close()
+            self.connector = None
+        self.socket = None
+
+    def _connect_failed(self, message):
+        """[Internal]"""
+        log.verbose("[jaraco.irc] %s", message)
+        self._handle_event(Event("disconnect", self.server, "", [message]))
+
+    def is_connecting(self):
+        """Return whether a connection attempt is in progress."""
+        return self.connecting
 
     def reconnect(self):
         """
@@ -572,6 +728,7 @@ class ServerConnection(Connection):
             self.disconnect("Connection reset by peer")
             return
 
+        self.last_read = time.time()
         self.buffer.feed(new_data)
 
         # process each non-empty line after logging all lines
@@ -768,6 +925,11 @@ class ServerConnection(Connection):
 
             message -- Quit message.
         """
+        if self.connecting:
+            self._abort_connect()
+            self._connect_failed(message)
+            return
+
         if not self.connected:
             return
 
@@ -992,11 +1154,17 @@ class ServerConnection(Connection):
         """
         self.send_raw = Throttler(self.send_raw, frequency)
 
-    def set_keepalive(self, interval):
+    def set_keepalive(self, interval, function=None):
         """
-        Set a keepalive to occur every ``interval`` on this connection.
+        Set a keepalive to occur every ``interval`` on this connection
+        while it is connected. ``function`` replaces the default PING.
         """
-        pinger = functools.partial(self.ping, 'keep-alive')
+        function = function or functools.partial(self.ping, 'keep-alive')
+
+        def pinger():
+            if self.is_connected():
+                function()
+
         self.reactor.execute_every(period=interval, function=pinger)
 
 
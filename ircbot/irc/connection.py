@@ -1,8 +1,13 @@
 from __future__ import absolute_import
 
+import os
+import time
+import errno
 import socket
 import importlib
 
+import six
+
 identity = lambda x: x
 
 class Factory(object):
@@ -27,6 +32,27 @@ class Factory(object):
 
         Factory(ipv6=True)(server_address)
 
+    To give up connecting after 10 seconds:
+
+        Factory(timeout=10)(server_address)
+
+    To create a connection driven by a Reactor (the connect call doesn't
+    block: the Reactor polls the socket for writability and calls finish):
+
+        factory = Factory(timeout=10, nonblocking=True)
+        sock = factory.start(server_address)
+        ...
+        sock = factory.finish(sock)
+
+    To race several servers (and the IPv4/IPv6 addresses they resolve to)
+    starting a new attempt every 250 milliseconds until one succeeds:
+
+        factory = Factory(timeout=10, nonblocking=True, dualstack=True)
+        connector = factory.attempt([server_address, alternate_address])
+        connector.next()
+        ...
+        result = connector.ready(sock)
+
     Note that Factory doesn't save the state of the socket itself. The
     caller must do that, as necessary. As a result, the Factory may be
     re-used to create new connections with the same settings.
@@ -34,10 +60,21 @@ class Factory(object):
     """
 
     family = socket.AF_INET
+    timeout = None
+    nonblocking = False
+    dualstack = False
+    stagger = 0.25
 
-    def __init__(self, bind_address=('', 0), wrapper=identity, ipv6=False):
+    def __init__(self, bind_address=('', 0), wrapper=identity, ipv6=False,
+            timeout=None, nonblocking=False, dualstack=False, stagger=0.25,
+            cache=None):
         self.bind_address = bind_address
         self.wrapper = wrapper
+        self.timeout = timeout
+        self.nonblocking = nonblocking
+        self.dualstack = dualstack
+        self.stagger = stagger
+        self.cache = cache or AddressCache()
         if ipv6:
             self.family = socket.AF_INET6
 
@@ -53,6 +90,248 @@ class Factory(object):
     def connect(self, server_address):
         sock = self.wrapper(socket.socket(self.family, socket.SOCK_STREAM))
         sock.bind(self.bind_address)
+        sock.settimeout(self.timeout)
         sock.connect(server_address)
+        sock.settimeout(None)
         return sock
     __call__ = connect
+
+    def start(self, server_address, family=None):
+        """
+        Start a non-blocking connection to the given address and return
+        the socket. The connection is established when the socket becomes
+        writable: the caller must then invoke finish.
+        """
+        family = family or self.family
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            # a local address can only be bound to a socket of its own family
+            if family == self.family or not self.bind_address[0]:
+                sock.bind(self.bind_address)
+            sock.setblocking(0)
+            err = sock.connect_ex(server_address)
+        except socket.error:
+            sock.close()
+            raise
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                       getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)):
+            sock.close()
+            raise socket.error(err, os.strerror(err))
+        return sock
+
+    def finish(self, sock):
+        """
+        Complete a connection started with start: raise socket.error if
+        the connection failed, otherwise return the (wrapped) socket.
+        """
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            sock.close()
+            raise socket.error(err, os.strerror(err))
+        sock.settimeout(self.timeout)
+        sock = self.wrapper(sock)
+        sock.settimeout(None)
+        return sock
+
+    def resolved(self, server_addresses):
+        """
+        Return whether all the given (host, port) pairs are IP addresses or
+        in the address cache, meaning that attempt won't hit the resolver.
+        """
+        family = socket.AF_UNSPEC if self.dualstack else self.family
+        return all(numeric(server_address[0]) or
+                   self.cache.lookup(server_address[0], server_address[1], family) is not None
+                   for server_address in server_addresses)
+
+    def attempt(self, server_addresses):
+        """
+        Resolve the given (host, port) pairs and return a Connector racing
+        all the resulting addresses. Raise socket.error if none of them
+        could be resolved. Resolution blocks on a cache miss: it is safe
+        to call this from a helper thread (no socket is created before
+        Connector.next is invoked).
+        """
+        family = socket.AF_UNSPEC if self.dualstack else self.family
+        resolved = []
+        errors = []
+        for server_address in server_addresses:
+            try:
+                addresses = self.cache.resolve(server_address[0], server_address[1], family)
+            except socket.error as ex:
+                errors.append(ex)
+                continue
+            resolved.append([(af, sockaddr, server_address)
+                             for af, sockaddr in interleave(addresses)])
+        if not resolved:
+            raise errors[0] if errors else socket.error("no server address")
+        return Connector(self, roundrobin(resolved))
+
+
+class Connector(object):
+    """
+    A set of non-blocking connection attempts started by Factory.attempt.
+
+    Candidates are started one at a time by next (the caller is expected
+    to call it every Factory.stagger seconds, and again whenever an
+    attempt fails): the first socket to complete wins and the others are
+    closed.
+    """
+
+    def __init__(self, factory, candidates):
+        self.factory = factory
+        self.candidates = list(candidates)
+        self.pending = {}
+        self.errors = []
+
+    @property
+    def sockets(self):
+        return list(self.pending)
+
+    @property
+    def exhausted(self):
+        return not self.pending and not self.candidates
+
+    def next(self):
+        """
+        Start the next candidate: return False if none is left.
+        """
+        while self.candidates:
+            candidate = self.candidates.pop(0)
+            try:
+                sock = self.factory.start(candidate[1], candidate[0])
+            except socket.error as ex:
+                self.errors.append(ex)
+                continue
+            self.pending[sock] = candidate
+            return True
+        return False
+
+    def ready(self, sock):
+        """
+        Complete the attempt on the given (writable) socket. Return a
+        (socket, server_address) tuple on success, None if the attempt
+        failed: in this case the next candidate is started right away.
+        """
+        candidate = self.pending.pop(sock, None)
+        if candidate is None:
+            return None
+        try:
+            sock = self.factory.finish(sock)
+        except socket.error as ex:
+            self.errors.append(ex)
+            if not self.pending:
+                self.next()
+            return None
+        self.close()
+        return sock, candidate[2]
+
+    def close(self):
+        """
+        Abandon all the attempts in progress.
+        """
+        for sock in self.pending:
+            try:
+                sock.close()
+            except socket.error:
+                pass
+        self.pending.clear()
+        self.candidates = []
+
+    def error(self):
+        """
+        Return the last error reported by the attempts.
+        """
+        return self.errors[-1] if self.errors else socket.error("timed out")
+
+
+class AddressCache(object):
+    """
+    Remember getaddrinfo results for ttl seconds so that reconnections
+    don't hit the resolver on every attempt.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = {}
+
+    def lookup(self, host, port, family=socket.AF_UNSPEC):
+        """
+        Return the cached list of (family, sockaddr) tuples the given host
+        resolves to, None if it is not cached or expired.
+        """
+        entry = self.entries.get((host, port, family))
+        if entry and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        """
+        Return the list of (family, sockaddr) tuples the given host
+        resolves to.
+        """
+        key = (host, port, family)
+        addresses = self.lookup(host, port, family)
+        if addresses is not None:
+            return addresses
+        addresses = []
+        for af, socktype, proto, canonname, sockaddr in socket.getaddrinfo(
+                host, port, family, socket.SOCK_STREAM):
+            if (af, sockaddr) not in addresses:
+                addresses.append((af, sockaddr))
+        self.entries[key] = (time.time() + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host=None, port=None):
+        """
+        Forget the addresses of the given host (all of them by default).
+        """
+        for key in list(self.entries):
+            if host is None or key[:2] == (host, port):
+                del self.entries[key]
+
+
+def numeric(host):
+    """
+    Return whether the given host is an IP address (resolving it doesn't
+    involve the resolver).
+
+    >>> numeric('127.0.0.1'), numeric('::1'), numeric('localhost')
+    (True, True, False)
+    """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (socket.error, ValueError, TypeError):
+            continue
+    return False
+
+
+def interleave(addresses):
+    """
+    Alternate address families, keeping the resolver order within each.
+
+    >>> list(interleave([(10, 'a'), (10, 'b'), (2, 'c')]))
+    [(10, 'a'), (2, 'c'), (10, 'b')]
+    """
+    families = []
+    for address in addresses:
+        for group in families:
+            if group[0][0] == address[0]:
+                group.append(address)
+                break
+        else:
+            families.append([address])
+    return roundrobin(families)
+
+
+def roundrobin(iterables):
+    """
+    >>> list(roundrobin(['ABC', 'D', 'EF']))
+    ['A', 'D', 'E', 'B', 'F', 'C']
+    """
+    sentinel = object()
+    for items in six.moves.zip_longest(*iterables, fillvalue=sentinel):
+        for item in items:
+            if item is not sentinel:
+                yield item
@@ -0,0 +1,654 @@
+# -*- coding: utf-8 -*-
+
+"""
+irc/loadserver.py
+
+A single threaded, select based IRC server meant to put load on clients:
+unlike irc/server.py (one thread per client) it can simulate channels
+with thousands of users. Users are either real clients (sockets) or
+virtual users which only exist on the server side and generate traffic
+towards the real clients according to scripted scenarios:
+
+* massjoin <count> [<rate>]      - <count> virtual users join the channel
+* massquit <count> [<rate>]      - <count> virtual users quit
+* netsplit <count> [<delay>]     - <count> virtual users quit with a netsplit
+                                   reason and rejoin (with their modes) after
+                                   <delay> seconds
+* nickstorm <count> [<rate>]     - <count> virtual users change nickname
+* modeflood <count> [<rate>]     - <count> op/voice mode changes (4 per line)
+* chatflood <count> [<rate>]     - <count> channel messages from virtual users
+* slowread <bytes/sec>           - read at most <bytes/sec> from every real
+                                   client (0 to disable)
+* latency <ms>                   - delay the lines sent to real clients
+* sleep <seconds>                - (scripts only) wait before the next step
+
+Rates are expressed in events per second (0 for all at once). Scenarios
+can be given on the command line as a script (steps separated by ';')
+or triggered at any time by a connected client:
+
+    LOADGEN massjoin 2000 500
+
+Supported commands: NICK, USER, PASS, CAP, PING, PONG, JOIN, PART, QUIT,
+PRIVMSG, NOTICE, MODE, NAMES, TOPIC and LOADGEN. The server advertises
+PREFIX=(ov)@+ CHANMODES=b,k,l,imnpst and MODES=4. There are no
+permission checks: any client can change any mode.
+
+Usage:
+
+    python -m ircbot.irc.loadserver -p 6667 -c '#bench' -s 'sleep 5; massjoin 2000; netsplit 1000 10'
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import argparse
+import errno
+import heapq
+import itertools
+import logging
+import select
+import socket
+
+from collections import deque
+from time import time
+
+from ircbot.irc import events
+from ircbot.irc.dict import IRCDict
+
+log = logging.getLogger('output')
+
+ISUPPORT = 'PREFIX=(ov)@+ CHANMODES=b,k,l,imnpst MODES=4 CHANTYPES=# NICKLEN=30 NETWORK=LoadNet'
+PREFIXES = {'o': '@', 'v': '+'}
+NAMES_LENGTH = 400      # maximum length of the nicknames list in a single RPL_NAMREPLY
+
+
+class LoadChannel(object):
+    """
+    A channel: members are nicknames mapped to their modes (a string made of 'o' and 'v').
+    """
+    def __init__(self, name):
+        self.name = name
+        self.topic = 'load testing channel'
+        self.members = IRCDict()
+        self.clients = set()        # real clients in the channel
+
+    def names(self):
+        """
+        Return the nicknames prefixed according to their modes.
+
+        >>> channel = LoadChannel('#c')
+        >>> channel.members['a'] = 'o'; channel.members['b'] = ''
+        >>> sorted(channel.names())
+        ['@a', 'b']
+        """
+        return [(PREFIXES['o'] if 'o' in modes else PREFIXES['v'] if 'v' in modes else '') + nick
+                for nick, modes in self.members.items()]
+
+
+class LoadClient(object):
+    """
+    A real client connected to the server.
+    """
+    def __init__(self, server, sock, address):
+        self.server = server
+        self.sock = sock
+        self.address = address
+        self.nick = None
+        self.user = None
+        self.registered = False
+        self.channels = set()
+        self.inbuf = b''
+        self.outbuf = b''
+        self.delayed = deque()      # (due time, data) tuples waiting for the injected latency
+        self.allowance = 0.0        # bytes which can be read (slow reader mode)
+        self.stamp = time()
+
+    @property
+    def mask(self):
+        return '%s!%s@%s' % (self.nick, self.user or self.nick, self.address[0])
+
+    def send(self, line):
+        """
+        Queue a line to be sent to the client (honoring the injected latency).
+        """
+        data = line.encode('utf-8') if not isinstance(line, bytes) else line
+        data += b'\r\n'
+        if self.server.latency > 0 or self.delayed:
+            self.delayed.append((time() + self.server.latency, data))
+        else:
+            self.outbuf += data
+
+    def release(self, now):
+        """
+        Move the lines whose latency expired to the output buffer.
+        """
+        while self.delayed and self.delayed[0][0] <= now:
+            self.outbuf += self.delayed.popleft()[1]
+
+    def readable(self, now):
+        """
+        Tell how many bytes can be read from the client.
+        """
+        rate = self.server.slowread
+        if rate <= 0:
+            return 65536
+        self.allowance = min(rate, self.allowance + (now - self.stamp) * rate)
+        self.stamp = now
+        return int(self.allowance)
+
+
+class LoadServer(object):
+    """
+    Select based IRC server with virtual users.
+    """
+    def __init__(self, address, channel='#bench', servername='loadserver'):
+        self.listener = socket.socket(socket.AF_INET6 if ':' in address[0] else socket.AF_INET)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(64)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+        self.servername = servername
+        self.channel = channel
+        self.clients = {}           # socket -> LoadClient
+        self.nicks = IRCDict()      # nickname -> LoadClient (None for virtual users)
+        self.channels = IRCDict()   # name -> LoadChannel
+        self.timers = []            # heap of (due time, sequence, function, arguments)
+        self.sequence = itertools.count()
+        self.virtual = itertools.count()
+        self.latency = 0.0
+        self.slowread = 0
+        self.running = False
+
+    ####################################################################################################################
+    # main loop
+
+    def serve_forever(self):
+        self.running = True
+        while self.running:
+            self.process_once()
+
+    def stop(self):
+        self.running = False
+
+    def process_once(self, timeout=0.05):
+        now = time()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, function, args = heapq.heappop(self.timers)
+            try:
+                function(*args)
+            except Exception:
+                log.exception('[loadserver] scenario step failed')
+
+        readers = [self.listener] + list(self.clients)
+        writers = []
+        for sock, client in self.clients.items():
+            client.release(now)
+            if client.outbuf:
+                writers.append(sock)
+            if self.slowread > 0 and client.readable(now) <= 0:
+                readers.remove(sock)
+
+        if self.timers:
+            timeout = max(0, min(timeout, self.timers[0][0] - now))
+        if any(client.delayed for client in self.clients.values()):
+            timeout = min(timeout, 0.005)
+
+        try:
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+
+        for sock in writable:
+            client = self.clients.get(sock)
+            if client:
+                self.flush(client)
+
+        for sock in readable:
+            if sock is self.listener:
+                self.accept()
+            elif sock in self.clients:
+                self.read(self.clients[sock])
+
+    def accept(self):
+        try:
+            sock, address = self.listener.accept()
+        except socket.error:
+            return
+        sock.setblocking(False)
+        self.clients[sock] = LoadClient(self, sock, address)
+        log.debug('[loadserver] client connected: %s', address)
+
+    def flush(self, client):
+        try:
+            sent = client.sock.send(client.outbuf)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.drop(client, 'write error')
+            return
+        client.outbuf = client.outbuf[sent:]
+
+    def read(self, client):
+        size = client.readable(time())
+        try:
+            data = client.sock.recv(size)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b''
+        if not data:
+            self.drop(client, 'EOF from client')
+            return
+        if self.slowread > 0:
+            client.allowance -= len(data)
+        client.inbuf += data
+        while b'\n' in client.inbuf:
+            line, client.inbuf = client.inbuf.split(b'\n', 1)
+            line = line.rstrip(b'\r').decode('utf-8', 'replace')
+            if line:
+                self.handle(client, line)
+            if client.sock not in self.clients:
+                return
+
+    def drop(self, client, reason):
+        self.quit(client.nick, reason) if client.nick in self.nicks else None
+        self.clients.pop(client.sock, None)
+        try:
+            client.sock.close()
+        except socket.error:
+            pass
+        log.debug('[loadserver] client disconnected: %s (%s)', client.address, reason)
+
+    def schedule(self, delay, function, *args):
+        heapq.heappush(self.timers, (time() + delay, next(self.sequence), function, args))
+
+    ####################################################################################################################
+    # channel state shared by real and virtual users
+
+    def broadcast(self, channel, line, exclude=None):
+        for client in channel.clients:
+            if client is not exclude:
+                client.send(line)
+
+    def join(self, nick, mask, name, modes=''):
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = LoadChannel(name)
+        if nick in channel.members:
+            return channel
+        channel.members[nick] = modes
+        self.broadcast(channel, ':%s JOIN %s' % (mask, name))
+        client = self.nicks.get(nick)
+        if client is not None:
+            channel.clients.add(client)
+            client.channels.add(channel.name)
+            client.send(':%s JOIN %s' % (mask, name))
+        return channel
+
+    def part(self, nick, mask, name, reason=''):
+        channel = self.channels.get(name)
+        if channel is None or nick not in channel.members:
+            return
+        self.broadcast(channel, ':%s PART %s :%s' % (mask, name, reason))
+        del channel.members[nick]
+        client = self.nicks.get(nick)
+        if client is not None:
+            channel.clients.discard(client)
+            client.channels.discard(channel.name)
+
+    def quit(self, nick, reason, mask=None):
+        client = self.nicks.pop(nick, None)
+        mask = mask or (client.mask if client else virtual_mask(nick))
+        notified = set()
+        for channel in self.channels.values():
+            if nick in channel.members:
+                del channel.members[nick]
+                channel.clients.discard(client)
+                for other in channel.clients:
+                    if other not in notified:
+                        notified.add(other)
+                        other.send(':%s QUIT :%s' % (mask, reason))
+
+    def rename(self, nick, new, mask):
+        client = self.nicks.pop(nick)
+        self.nicks[new] = client
+        notified = set([client]) if client else set()
+        if client:
+            client.send(':%s NICK :%s' % (mask, new))
+        for channel in self.channels.values():
+            if nick in channel.members:
+                channel.members[new] = channel.members.pop(nick)
+                for other in channel.clients:
+                    if other not in notified:
+                        notified.add(other)
+                        other.send(':%s NICK :%s' % (mask, new))
+
+    def mode(self, source, name, changes):
+        """
+        Apply a list of (sign, mode, nick) changes to a channel and notify its members (MODES changes per line).
+        """
+        channel = self.channels.get(name)
+        if channel is None:
+            return
+        applied = []
+        for sign, mode, nick in changes:
+            if nick not in channel.members:
+                continue
+            modes = channel.members[nick]
+            if sign == '+' and mode not in modes:
+                channel.members[nick] = modes + mode
+            elif sign == '-' and mode in modes:
+                channel.members[nick] = modes.replace(mode, '')
+            else:
+                continue
+            applied.append((sign, mode, nick))
+
+        for index in range(0, len(applied), 4):
+            batch = applied[index:index + 4]
+            flags, last = '', None
+            for sign, mode, nick in batch:
+                if sign != last:
+                    flags += sign
+                    last = sign
+                flags += mode
+            self.broadcast(channel, ':%s MODE %s %s %s' % (source, name, flags, ' '.join(x[2] for x in batch)))
+
+    def send_names(self, client, channel):
+        names, length = [], 0
+        for name in channel.names():
+            if length + len(name) + 1 > NAMES_LENGTH and names:
+                client.send(':%s 353 %s = %s :%s' % (self.servername, client.nick, channel.name, ' '.join(names)))
+                names, length = [], 0
+            names.append(name)
+            length += len(name) + 1
+        if names:
+            client.send(':%s 353 %s = %s :%s' % (self.servername, client.nick, channel.name, ' '.join(names)))
+        client.send(':%s 366 %s %s :End of /NAMES list.' % (self.servername, client.nick, channel.name))
+
+    ####################################################################################################################
+    # real clients commands
+
+    def handle(self, client, line):
+        command, _, params = line.partition(' ')
+        handler = getattr(self, 'handle_%s' % command.lower(), None)
+        if handler is None:
+            client.send(':%s 421 %s %s :Unknown command' % (self.servername, client.nick or '*', command))
+            return
+        handler(client, params)
+
+    def numeric(self, client, name, text):
+        client.send(':%s %s %s %s' % (self.servername, events.codes[name], client.nick or '*', text))
+
+    def handle_pass(self, client, params):
+        pass
+
+    def handle_cap(self, client, params):
+        pass
+
+    def handle_pong(self, client, params):
+        pass
+
+    def handle_nick(self, client, params):
+        nick = params.lstrip(':').strip()
+        if not nick:
+            return
+        if nick in self.nicks and self.nicks[nick] is not client:
+            self.numeric(client, 'nicknameinuse', '%s :Nickname is already in use' % nick)
+            return
+        if client.registered:
+            self.rename(client.nick, nick, client.mask)
+            client.nick = nick
+            return
+        client.nick = nick
+        self.register(client)
+
+    def handle_user(self, client, params):
+        client.user = params.split(' ', 1)[0]
+        self.register(client)
+
+    def register(self, client):
+        if client.registered or not client.nick or not client.user:
+            return
+        client.registered = True
+        self.nicks[client.nick] = client
+        self.numeric(client, 'welcome', ':Welcome to the load testing network %s' % client.nick)
+        self.numeric(client, 'featurelist', '%s :are supported by this server' % ISUPPORT)
+        self.numeric(client, 'endofmotd', ':End of MOTD command.')
+
+    def handle_ping(self, client, params):
+        client.send(':%s PONG %s :%s' % (self.servername, self.servername, params.lstrip(':')))
+
+    def handle_join(self, client, params):
+        for name in params.split(' ', 1)[0].split(','):
+            if not name.startswith('#'):
+                self.numeric(client, 'nosuchchannel', '%s :No such channel' % name)
+                continue
+            channel = self.join(client.nick, client.mask, name)
+            client.send(':%s 332 %s %s :%s' % (self.servername, client.nick, channel.name, channel.topic))
+            self.send_names(client, channel)
+
+    def handle_part(self, client, params):
+        names, _, reason = params.partition(' ')
+        for name in names.split(','):
+            self.part(client.nick, client.mask, name, reason.lstrip(':'))
+
+    def handle_quit(self, client, params):
+        client.send('ERROR :Closing link (%s)' % params.lstrip(':'))
+        self.flush(client)
+        self.drop(client, params.lstrip(':') or 'Quit')
+
+    def handle_privmsg(self, client, params, command='PRIVMSG'):
+        target, _, text = params.partition(' ')
+        line = ':%s %s %s %s' % (client.mask, command, target, text)
+        if target.startswith('#'):
+            channel = self.channels.get(target)
+            if channel is not None:
+                self.broadcast(channel, line, exclude=client)
+        else:
+            other = self.nicks.get(target)
+            if other is not None:
+                other.send(line)
+
+    def handle_notice(self, client, params):
+        self.handle_privmsg(client, params, command='NOTICE')
+
+    def handle_names(self, client, params):
+        channel = self.channels.get(params.strip())
+        if channel is not None:
+            self.send_names(client, channel)
+
+    def handle_topic(self, client, params):
+        name, _, topic = params.partition(' ')
+        channel = self.channels.get(name)
+        if channel is None:
+            return
+        if topic:
+            channel.topic = topic.lstrip(':')
+            self.broadcast(channel, ':%s TOPIC %s :%s' % (client.mask, name, channel.topic))
+        else:
+            client.send(':%s 332 %s %s :%s' % (self.servername, client.nick, name, channel.topic))
+
+    def handle_mode(self, client, params):
+        parts = params.split()
+        if not parts or not parts[0].startswith('#'):
+            return
+        name = parts[0]
+        if len(parts) == 1:
+            client.send(':%s 324 %s %s +nt' % (self.servername, client.nick, name))
+            return
+        changes, sign, args = [], '+', parts[2:]
+        for flag in parts[1]:
+            if flag in '+-':
+                sign = flag
+            elif flag in PREFIXES and args:
+                changes.append((sign, flag, args.pop(0)))
+        self.mode(client.mask, name, changes)
+
+    def handle_loadgen(self, client, params):
+        try:
+            self.run(params, start=0)
+            client.send(':%s NOTICE %s :scheduled: %s' % (self.servername, client.nick, params))
+        except (ValueError, IndexError) as e:
+            client.send(':%s NOTICE %s :invalid scenario (%s): %s' % (self.servername, client.nick, e, params))
+
+    ####################################################################################################################
+    # scenarios
+
+    def run(self, script, start=0.0):
+        """
+        Schedule the steps of a script (separated by ';'): return the delay at which the script ends.
+        """
+        for step in script.split(';'):
+            words = step.split()
+            if not words:
+                continue
+            name, args = words[0].lower(), [float(x) for x in words[1:]]
+            if name == 'sleep':
+                start += args[0]
+                continue
+            scenario = getattr(self, 'scenario_%s' % name, None)
+            if scenario is None:
+                raise ValueError('unknown scenario %s' % name)
+            start = scenario(start, *args)
+        return start
+
+    def spread(self, start, items, rate, function):
+        """
+        Schedule function(batch) for the items at the given rate (per second, 0 for all at once).
+        """
+        items = list(items)
+        if rate <= 0:
+            self.schedule(start, function, items)
+            return start
+        batch = max(1, int(rate / 20))      # 20 batches per second
+        for index in range(0, len(items), batch):
+            self.schedule(start + index / rate, function, items[index:index + batch])
+        return start + len(items) / rate
+
+    def members(self, virtual_only=True):
+        channel = self.channels.get(self.channel)
+        if channel is None:
+            return []
+        return [nick for nick in channel.members.keys() if not virtual_only or self.nicks.get(nick) is None]
+
+    def scenario_latency(self, start, ms):
+        self.schedule(start, setattr, self, 'latency', ms / 1000.0)
+        return start
+
+    def scenario_slowread(self, start, rate):
+        self.schedule(start, setattr, self, 'slowread', int(rate))
+        return start
+
+    def scenario_massjoin(self, start, count, rate=0):
+        nicks = ['user%05d' % next(self.virtual) for _ in range(int(count))]
+
+        def step(batch):
+            for nick in batch:
+                self.nicks[nick] = None
+                self.join(nick, virtual_mask(nick), self.channel)
+        return self.spread(start, nicks, rate, step)
+
+    def scenario_massquit(self, start, count, rate=0, reason='Quit: leaving'):
+        def step(batch):
+            for nick in batch:
+                if nick in self.nicks:
+                    self.quit(nick, reason)
+
+        def select(batch):
+            # pick the users when the scenario starts
+            self.spread(0, self.members()[:int(count)], rate, step)
+        self.schedule(start, select, [])
+        return start + (count / rate if rate > 0 else 0)
+
+    def scenario_netsplit(self, start, count, delay=10):
+        def split(batch):
+            channel = self.channels.get(self.channel)
+            if channel is None:
+                return
+            gone = [(nick, channel.members[nick]) for nick in self.members()[:int(count)]]
+            for nick, modes in gone:
+                self.quit(nick, 'irc.left.net irc.right.net')
+            self.schedule(delay, rejoin, gone)
+
+        def rejoin(gone):
+            for nick, modes in gone:
+                self.nicks[nick] = None
+                self.join(nick, virtual_mask(nick), self.channel)
+            # the server restores the modes of the rejoining users
+            self.mode('irc.right.net', self.channel, [('+', mode, nick) for nick, modes in gone for mode in modes])
+        self.schedule(start, split, [])
+        return start + delay
+
+    def scenario_nickstorm(self, start, count, rate=0):
+        def step(batch):
+            nicks = self.members()
+            for _ in batch:
+                if not nicks:
+                    return
+                nick = nicks.pop(next(self.virtual) % len(nicks))
+                self.rename(nick, 'user%05d' % next(self.virtual), virtual_mask(nick))
+        return self.spread(start, range(int(count)), rate, step)
+
+    def scenario_modeflood(self, start, count, rate=0):
+        def step(batch):
+            nicks = self.members()
+            if not nicks:
+                return
+            channel = self.channels[self.channel]
+            changes = []
+            for _ in batch:
+                nick = nicks[next(self.virtual) % len(nicks)]
+                mode = 'ov'[len(changes) % 2]
+                changes.append(('-' if mode in channel.members[nick] else '+', mode, nick))
+            self.mode(self.servername, self.channel, changes)
+        return self.spread(start, range(int(count)), rate, step)
+
+    def scenario_chatflood(self, start, count, rate=0):
+        def step(batch):
+            nicks = self.members()
+            channel = self.channels.get(self.channel)
+            if not nicks or channel is None:
+                return
+            for index in batch:
+                nick = nicks[index % len(nicks)]
+                self.broadcast(channel, ':%s PRIVMSG %s :load testing message %s' % (virtual_mask(nick),
+                                                                                   self.channel, index))
+        return self.spread(start, range(int(count)), rate, step)
+
+
+def virtual_mask(nick):
+    return '%s!%s@virtual.loadnet' % (nick, nick)
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--address", dest="listen_address", default='127.0.0.1', help="IP on which to listen")
+    parser.add_argument("-p", "--port", dest="listen_port", default=6667, type=int, help="Port on which to listen")
+    parser.add_argument("-c", "--channel", dest="channel", default='#bench', help="channel used by the scenarios")
+    parser.add_argument("-s", "--script", dest="script", default='', help="scenarios separated by ';'")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="verbose logging")
+    return parser.parse_args()
+
+
+def main():
+    options = get_args()
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    try:
+        server = LoadServer((options.listen_address, options.listen_port), channel=options.channel)
+        server.run(options.script)
+        log.info('[loadserver] listening on %s:%s', options.listen_address, options.listen_port)
+        server.serve_forever()
+    except socket.error as e:
+        log.error('[loadserver] %r', e)
+        raise SystemExit(-2)
+    except ValueError as e:
+        log.error('[loadserver] invalid script: %s', e)
+        raise SystemExit(-2)
+
+
+if __name__ == "__main__":
+    main()
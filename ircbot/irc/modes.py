@@ -29,6 +29,66 @@ def parse_channel_modes(mode_string):
     """
     return _parse_modes(mode_string, "bklvohq")
 
+# RFC1459 channel modes: used when the server doesn't advertise CHANMODES
+DEFAULT_CHANMODES = ['beI', 'k', 'l', 'imnpst']
+
+def parse_feature_modes(mode_string, chanmodes=None, prefixes="ov"):
+    """Parse a channel mode string honoring the server ISUPPORT features.
+
+    `chanmodes` is the CHANMODES feature: a list of four strings. Modes of
+    type A (lists) and type B always take a parameter, modes of type C take
+    a parameter only when set and modes of type D never take a parameter.
+    `prefixes` holds the mode letters of the PREFIX feature (channel member
+    modes): those always take a parameter. Unknown modes take no parameter.
+
+    The function returns a list of lists with three members: sign, mode
+    and argument, just like parse_channel_modes.
+
+    >>> parse_feature_modes('+ooo a b c')
+    [['+', 'o', 'a'], ['+', 'o', 'b'], ['+', 'o', 'c']]
+
+    >>> parse_feature_modes('+ov-b a b mask!*@*')
+    [['+', 'o', 'a'], ['+', 'v', 'b'], ['-', 'b', 'mask!*@*']]
+
+    >>> parse_feature_modes('+l-l+k 10 key')
+    [['+', 'l', '10'], ['-', 'l', None], ['+', 'k', 'key']]
+
+    >>> parse_feature_modes('+qo-h a b c', ['b', 'k', 'l', 'mnt'], 'qaohv')
+    [['+', 'q', 'a'], ['+', 'o', 'b'], ['-', 'h', 'c']]
+
+    Missing arguments are returned as None and unused ones are discarded.
+
+    >>> parse_feature_modes('+mo')
+    [['+', 'm', None], ['+', 'o', None]]
+
+    >>> parse_feature_modes('ab')
+    []
+    """
+    if not mode_string or not mode_string[0] in '+-':
+        return []
+
+    if not chanmodes or len(chanmodes) < 4:
+        chanmodes = DEFAULT_CHANMODES
+
+    always = chanmodes[0] + chanmodes[1] + prefixes
+    onset = chanmodes[2]
+
+    modes = []
+    parts = mode_string.split()
+    mode_part, args = parts[0], parts[1:]
+    args.reverse()
+
+    sign = '+'
+    for ch in mode_part:
+        if ch in "+-":
+            sign = ch
+            continue
+        arg = None
+        if ch in always or (sign == '+' and ch in onset):
+            arg = args.pop() if args else None
+        modes.append([sign, ch, arg])
+    return modes
+
 def _parse_modes(mode_string, unary_modes=""):
     """
     Parse the mode_string and return a list of triples.
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+
+"""
+irc/relay.py
+
+A relay daemon holding a single IRC session on behalf of many clients
+(i.e. many B3 instances running the IRC BOT plugin) which attach to it
+over a Unix socket. The session survives the restart of the clients:
+attaching clients are sent the registration (001/005) and the state of
+the joined channels (JOIN/353/366) as if they just connected.
+
+Frames exchanged over the Unix socket are made of a '!HB' header (the
+length of the payload and the frame type) followed by the payload:
+
+* H (hello) - sent by the client upon connection: the client name
+* L (line) - an IRC line, without the trailing CR LF
+
+Lines received from the IRC server are sent to every attached client.
+Lines sent by clients are forwarded to the IRC server except for:
+
+* NICK, USER, PASS, CAP - the relay owns the registration
+* PING - answered by the relay itself
+* PONG - the relay answers the server PINGs
+* JOIN - channels already joined are replayed to the client only
+* PART - the channel is kept for the other clients
+* QUIT - the client is detached
+
+Usage:
+
+    python -m ircbot.irc.relay -n nickname -s /tmp/ircbot.sock irc.quakenet.org:6667
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import argparse
+import errno
+import logging
+import os
+import socket
+import struct
+
+from ircbot.irc import bot, buffer, client, connection
+from ircbot.irc.dict import IRCDict
+from ircbot.irc.strings import lower
+
+FRAME_HEADER = struct.Struct('!HB')
+FRAME_HELLO = ord('H')
+FRAME_LINE = ord('L')
+
+log = logging.getLogger('output')
+
+
+def pack_frame(kind, payload):
+    """
+    Build a frame of the given type.
+
+    >>> pack_frame(FRAME_LINE, b'PING :x')
+    '\\x00\\x07LPING :x'
+    """
+    return FRAME_HEADER.pack(len(payload), kind) + payload
+
+
+class FrameDecoder(object):
+    """
+    Split the data read from a socket into (type, payload) frames.
+
+    >>> decoder = FrameDecoder()
+    >>> decoder.feed(pack_frame(FRAME_HELLO, b'b3') + b'\\x00\\x04L')
+    >>> list(decoder)
+    [(72, 'b3')]
+    >>> decoder.feed(b'PING')
+    >>> list(decoder)
+    [(76, 'PING')]
+    """
+
+    def __init__(self):
+        self.data = b''
+
+    def feed(self, data):
+        self.data += data
+
+    def __iter__(self):
+        while len(self.data) >= FRAME_HEADER.size:
+            length, kind = FRAME_HEADER.unpack_from(self.data)
+            end = FRAME_HEADER.size + length
+            if len(self.data) < end:
+                break
+            payload, self.data = self.data[FRAME_HEADER.size:end], self.data[end:]
+            yield kind, payload
+
+
+class FramedSocket(object):
+    """
+    Socket-like object speaking the relay protocol: lines written with
+    send are framed and frames read with recv are turned back into CR LF
+    terminated lines, so that ServerConnection doesn't see the difference.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = FrameDecoder()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def hello(self, name):
+        self.sock.sendall(pack_frame(FRAME_HELLO, name.encode('utf-8')))
+
+    def send(self, data):
+        frames = [pack_frame(FRAME_LINE, line) for line in data.split(b'\r\n') if line]
+        self.sock.sendall(b''.join(frames))
+        return len(data)
+
+    def recv(self, bufsize):
+        data = self.sock.recv(bufsize)
+        if not data:
+            return data
+        self.decoder.feed(data)
+        lines = [payload + b'\r\n' for kind, payload in self.decoder if kind == FRAME_LINE]
+        # an empty line is skipped by ServerConnection while an empty string means EOF
+        return b''.join(lines) or b'\r\n'
+
+    def shutdown(self, how):
+        self.sock.shutdown(how)
+
+    def close(self):
+        self.sock.close()
+
+
+class RelayFactory(object):
+    """
+    Connection factory attaching a ServerConnection to a relay: the
+    server address is the path of the relay Unix socket.
+
+        connection.connect('/tmp/ircbot.sock', 0, nickname,
+                           connect_factory=RelayFactory(name='b3-1'))
+    """
+    nonblocking = False
+
+    def __init__(self, name=''):
+        self.name = name
+
+    def connect(self, server_address):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(server_address[0])
+            framed = FramedSocket(sock)
+            framed.hello(self.name)
+        except socket.error:
+            sock.close()
+            raise
+        return framed
+    __call__ = connect
+
+
+class RelayListener(client.Connection):
+    """
+    The Unix socket the relay clients connect to.
+    """
+    socket = None
+
+    def __init__(self, reactor, relay, sock):
+        super(RelayListener, self).__init__(reactor)
+        self.relay = relay
+        self.socket = sock
+
+    def process_data(self):
+        try:
+            sock, _ = self.socket.accept()
+        except socket.error:
+            return
+        self.relay.add_connection(RelayPeer(self.reactor, self.relay, sock))
+
+
+class RelayPeer(client.Connection):
+    """
+    A client attached to the relay.
+    """
+    socket = None
+    name = None
+
+    def __init__(self, reactor, relay, sock):
+        super(RelayPeer, self).__init__(reactor)
+        self.relay = relay
+        self.socket = sock
+        self.decoder = FrameDecoder()
+
+    def process_data(self):
+        try:
+            data = self.socket.recv(2 ** 14)
+        except socket.error:
+            data = b''
+        if not data:
+            self.relay.detach(self, "connection closed")
+            return
+        self.decoder.feed(data)
+        for kind, payload in self.decoder:
+            if kind == FRAME_HELLO:
+                self.name = payload.decode('utf-8', 'replace')
+                self.relay.attach(self)
+            elif kind == FRAME_LINE and self.name is not None:
+                self.relay.on_peer_line(self, payload.decode('utf-8', 'replace'))
+            if self.socket is None:
+                # detached while processing
+                return
+
+    def send_line(self, line):
+        try:
+            self.socket.sendall(pack_frame(FRAME_LINE, line.encode('utf-8')))
+        except socket.error as ex:
+            self.relay.detach(self, "write error: %s" % ex)
+
+    def close(self):
+        try:
+            self.socket.close()
+        except socket.error:
+            pass
+        self.socket = None
+
+
+class Relay(bot.SingleServerIRCBot):
+    """
+    Hold an IRC session and share it with the clients attached to a
+    Unix socket.
+    """
+    # names prefixes replayed to attaching clients (highest first)
+    prefixes = (('~', 'is_owner'), ('@', 'is_oper'), ('%', 'is_halfop'),
+                ('+', 'is_voiced'))
+
+    def __init__(self, server_list, nickname, path, password=None,
+            maxrate=1, timeout=10, reconnection_interval=10):
+        factory = connection.Factory(timeout=timeout, nonblocking=True,
+                                     dualstack=True)
+        server_list = [(host, port, password) for host, port in server_list]
+        super(Relay, self).__init__(server_list, nickname, nickname,
+                                    reconnection_interval=reconnection_interval,
+                                    connect_factory=factory)
+        self.connection.buffer_class = buffer.LenientDecodingLineBuffer
+        if maxrate > 0:
+            self.connection.set_rate_limit(maxrate)
+        self.path = path
+        self.peers = []
+        self.wanted = set()
+        self.welcome = None
+        self.isupport = []
+        self.token = 0
+        self.reactor.add_global_handler("all_raw_messages", self._on_raw, -30)
+        self.listener = RelayListener(self.reactor, self, self._listen(path))
+        self.add_connection(self.listener)
+
+    @staticmethod
+    def _listen(path):
+        """[Internal]"""
+        try:
+            os.unlink(path)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(16)
+        return sock
+
+    def add_connection(self, conn):
+        """Add a pseudo-connection to the reactor select loop."""
+        with self.reactor.mutex:
+            self.reactor.connections.append(conn)
+
+    ##############################
+    ### Clients
+
+    def attach(self, peer):
+        log.info("[relay] client attached: %s", peer.name)
+        self.peers.append(peer)
+        if self.welcome:
+            peer.send_line(self.welcome)
+            for line in self.isupport:
+                peer.send_line(line)
+            for name in self.channels.keys():
+                self.replay_channel(peer, name)
+
+    def detach(self, peer, reason):
+        if peer.socket is None:
+            return
+        log.info("[relay] client detached: %s (%s)", peer.name, reason)
+        if peer in self.peers:
+            self.peers.remove(peer)
+        with self.reactor.mutex:
+            if peer in self.reactor.connections:
+                self.reactor.connections.remove(peer)
+        peer.close()
+
+    def replay_channel(self, peer, name):
+        """Send a channel JOIN and its NAMES list to a single client."""
+        nick = self.connection.get_nickname()
+        server = self.connection.get_server_name() or 'relay'
+        channel = self.channels[name]
+        peer.send_line(":%s!relay@relay JOIN %s" % (nick, name))
+        names = []
+        for user in channel.users():
+            names.append(''.join(prefix for prefix, check in self.prefixes
+                                 if getattr(channel, check)(user)) + user)
+        for i in range(0, len(names), 30):
+            peer.send_line(":%s 353 %s = %s :%s" % (server, nick, name, ' '.join(names[i:i + 30])))
+        peer.send_line(":%s 366 %s %s :End of /NAMES list." % (server, nick, name))
+
+    def on_peer_line(self, peer, line):
+        parts = line.split(' ', 1)
+        command = parts[0].upper()
+        argument = parts[1] if len(parts) > 1 else ''
+        if command in ('NICK', 'USER', 'PASS', 'CAP', 'PONG', 'PART'):
+            return
+        if command == 'QUIT':
+            self.detach(peer, "quit")
+            return
+        if command == 'PING':
+            peer.send_line(":relay PONG relay :%s" % argument.lstrip(':'))
+            return
+        if command == 'JOIN':
+            forward = False
+            for name in argument.split(' ')[0].split(','):
+                self.wanted.add(lower(name))
+                if name in self.channels:
+                    self.replay_channel(peer, name)
+                else:
+                    forward = True
+            if not forward:
+                return
+        if not self.connection.is_connected():
+            return
+        try:
+            self.connection.send_raw(line)
+        except client.ServerConnectionError as ex:
+            log.warning("[relay] could not forward line from %s: %s", peer.name, ex)
+
+    ##############################
+    ### IRC session
+
+    def _on_raw(self, c, e):
+        if c is not self.connection:
+            return
+        line = e.arguments[0]
+        parts = line.split(' ', 2)
+        command = parts[1] if line.startswith(':') and len(parts) > 1 else parts[0]
+        if command == 'PING':
+            return
+        if command == '001':
+            self.welcome = line
+            self.isupport = []
+        elif command == '005':
+            self.isupport.append(line)
+        for peer in list(self.peers):
+            peer.send_line(line)
+
+    def on_welcome(self, c, e):
+        log.info("[relay] registered on %s:%s as %s", c.server, c.port, c.get_nickname())
+        if self.wanted:
+            c.join(','.join(self.wanted))
+
+    def on_nicknameinuse(self, c, e):
+        c.nick(c.get_nickname() + '_')
+
+    def _on_disconnect(self, c, e):
+        log.info("[relay] disconnected: %s", e.arguments[0] if e.arguments else None)
+        self.channels = IRCDict()
+        self.welcome = None
+        # attached clients reconnect and are sent the new session once registered
+        for peer in list(self.peers):
+            self.detach(peer, "IRC connection lost")
+        self.token += 1
+        self.connection.execute_delayed(self.reconnection_interval, self._reconnect, (self.token,))
+
+    def _reconnect(self, token):
+        if token == self.token and not self.connection.is_connected() \
+                and not self.connection.is_connecting():
+            self.jump_server()
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("servers", nargs='+', metavar="host[:port]", help="IRC servers to connect to")
+    parser.add_argument("-n", "--nickname", dest="nickname", required=True, help="nickname of the relay")
+    parser.add_argument("-s", "--socket", dest="path", default='/tmp/ircbot-relay.sock', help="Unix socket path")
+    parser.add_argument("-P", "--password", dest="password", default=None, help="IRC server password")
+    parser.add_argument("-r", "--maxrate", dest="maxrate", default=1, type=float, help="messages per second")
+    parser.add_argument("-t", "--timeout", dest="timeout", default=10, type=int, help="connection timeout")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="verbose logging")
+    return parser.parse_args()
+
+
+def parse_server(entry):
+    """
+    >>> parse_server('irc.quakenet.org')
+    ('irc.quakenet.org', 6667)
+    >>> parse_server('[::1]:6668')
+    ('::1', 6668)
+    """
+    host, port = entry, 6667
+    if entry.startswith('['):
+        host, _, rest = entry[1:].partition(']')
+        if rest.startswith(':'):
+            port = int(rest[1:])
+    elif entry.count(':') == 1:
+        host, port = entry.split(':')
+    return host, int(port)
+
+
+def main():
+    options = get_args()
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    # the library logs through the B3 logger which provides the verbose levels
+    for name in ('verbose', 'verbose2'):
+        if not hasattr(logging.Logger, name):
+            setattr(logging.Logger, name, logging.Logger.debug)
+
+    try:
+        relay = Relay([parse_server(x) for x in options.servers], options.nickname, options.path,
+                      password=options.password, maxrate=options.maxrate, timeout=options.timeout)
+        log.info("[relay] listening on %s", options.path)
+        relay.start()
+    except socket.error as e:
+        log.error('[relay] %r', e)
+        raise SystemExit(-2)
+
+
+if __name__ == "__main__":
+    main()
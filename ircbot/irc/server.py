@@ -52,10 +52,11 @@ import six
 
 from six.moves import socketserver
 from .client import NickMask
+from . import client
 from . import events
 from ircbot.irc import buffer, events
 
-SRV_WELCOME = "Welcome to {__name__} v{irc.client.VERSION}.".format(**locals())
+SRV_WELCOME = "Welcome to {name} v{version}.".format(name=__name__, version=client.VERSION_STRING)
 
 log = logging.getLogger('output')
 
@@ -247,7 +248,9 @@ class IRCClient(socketserver.BaseRequestHandler):
         """
         Handle client PING requests to keep the connection alive.
         """
-        response = ':{self.server.servername} PONG :{self.server.servername}'
+        # echo the token so clients can match the reply with their request
+        token = params.lstrip(':') or self.server.servername
+        response = ':{self.server.servername} PONG {self.server.servername} :{token}'
         return response.format(**locals())
 
     def handle_join(self, params):
@@ -294,16 +297,16 @@ class IRCClient(socketserver.BaseRequestHandler):
             response = ':%s 366 %s %s :End of /NAMES list' % _vals
             self.send_queue.append(response)
 
-    def handle_privmsg(self, params):
+    def handle_privmsg(self, params, command='PRIVMSG'):
         """
         Handle sending a private message to a user or channel.
         """
         target, sep, msg = params.partition(' ')
         if not msg:
             raise IRCError.from_name('needmoreparams',
-                'PRIVMSG :Not enough parameters')
+                '%s :Not enough parameters' % command)
 
-        message = ':%s PRIVMSG %s %s' % (self.client_ident(), target, msg)
+        message = ':%s %s %s %s' % (self.client_ident(), command, target, msg)
         if target.startswith('#') or target.startswith('$'):
             # Message to channel. Check if the channel exists.
             channel = self.server.channels.get(target)
@@ -324,6 +327,12 @@ class IRCClient(socketserver.BaseRequestHandler):
 
             client.send_queue.append(message)
 
+    def handle_notice(self, params):
+        """
+        Handle sending a notice to a user or channel.
+        """
+        return self.handle_privmsg(params, command='NOTICE')
+
     def _send_to_others(self, message, channel):
         """
         Send the message to all clients in the specified channel except for
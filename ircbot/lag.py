@@ -0,0 +1,208 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import deque
+from threading import Lock
+from time import time
+
+LEVEL_OK = 'OK'
+LEVEL_DEGRADED = 'DEGRADED'
+LEVEL_CRITICAL = 'CRITICAL'
+
+# upper bounds (in seconds) of the RTT histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class IRCLagMonitor(object):
+    """
+    Measure the round-trip time to the IRC server using timestamped PINGs and keep track of the
+    age of the messages waiting to be sent: when either of them grows too much the livechat is
+    progressively shed (ban and kick notices are never affected since they don't go through here).
+    """
+    ircbot = None           # IRC BOT object instance
+    connection = None       # server connection instance
+    degraded = 2.0          # lag (in seconds) above which the livechat is throttled
+    critical = 5.0          # lag (in seconds) above which the livechat is suspended
+    interval = 2.0          # minimum amount of seconds between 2 livechat lines when degraded
+    sent = None             # timestamp of the PING waiting for a PONG (if any)
+    token = None            # the token of the PING waiting for a PONG (if any)
+    last = None             # the last RTT measured
+    suppressed = 0          # amount of livechat lines dropped since the last one forwarded
+    forwarded = 0           # timestamp of the last livechat line forwarded
+
+    def __init__(self, ircbot, degraded=2.0, critical=5.0, size=100):
+        """
+        Create a new IRCLagMonitor instance.
+        :param ircbot: The IRC BOT object instance.
+        :param degraded: The lag (in seconds) above which the livechat is throttled.
+        :param critical: The lag (in seconds) above which the livechat is suspended.
+        :param size: The amount of RTT samples to keep.
+        """
+        self.ircbot = ircbot
+        self.connection = ircbot.connection
+        self.degraded = degraded
+        self.critical = critical
+        self.samples = deque(maxlen=size)
+        self.outgoing = {}
+        self.lock = Lock()
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   LAG PROBE                                                                                                      #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def probe(self):
+        """
+        Send a timestamped PING to the server.
+        """
+        self.sent = time()
+        self.token = 'lag-%.3f' % self.sent
+        self.connection.ping(self.token)
+
+    def on_pong(self, event):
+        """
+        Triggered when the server replies to a PING.
+        :param event: The PONG event.
+        """
+        token = event.arguments[0] if event.arguments else ''
+        if not token.startswith('lag-'):
+            return
+
+        try:
+            sent = float(token[4:])
+        except ValueError:
+            return
+
+        self.last = max(0.0, time() - sent)
+        self.samples.append(self.last)
+        if token == self.token:
+            self.sent = self.token = None
+
+    def reset(self):
+        """
+        Forget the PING in flight (i.e: the connection has been lost).
+        """
+        self.sent = self.token = None
+
+    def lag(self):
+        """
+        Return the current lag: if the last PING is still unanswered its age is used.
+        :return: The lag in seconds or None if it has not been measured yet.
+        """
+        sent = self.sent
+        if sent is not None and (self.last is None or time() - sent > self.last):
+            return time() - sent
+        return self.last
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   OUTBOUND QUEUE                                                                                                 #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def begin_send(self):
+        """
+        Mark a message as waiting to be sent.
+        :return: A ticket to be passed to end_send once the message has been written.
+        """
+        ticket = object()
+        with self.lock:
+            self.outgoing[ticket] = time()
+        return ticket
+
+    def end_send(self, ticket):
+        """
+        Mark a message as sent.
+        :param ticket: The ticket returned by begin_send.
+        """
+        with self.lock:
+            self.outgoing.pop(ticket, None)
+
+    def backlog(self):
+        """
+        Return the amount of messages waiting to be sent and the age of the oldest one.
+        :return: A (count, age) tuple.
+        """
+        with self.lock:
+            if not self.outgoing:
+                return 0, 0.0
+            return len(self.outgoing), time() - min(self.outgoing.itervalues())
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   LIVECHAT SHEDDING                                                                                              #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def level(self):
+        """
+        Return the current shedding level according to lag and outbound queue age.
+        """
+        delay = max(self.lag() or 0.0, self.backlog()[1])
+        if delay >= self.critical:
+            return LEVEL_CRITICAL
+        if delay >= self.degraded:
+            return LEVEL_DEGRADED
+        return LEVEL_OK
+
+    def shed(self):
+        """
+        Decide whether a livechat line should be dropped.
+        :return: A (drop, suppressed) tuple: when the line is forwarded, suppressed is the amount of lines
+                 dropped before it (so that a summary can be sent).
+        """
+        level = self.level()
+        with self.lock:
+            now = time()
+            if level == LEVEL_CRITICAL or (level == LEVEL_DEGRADED and now - self.forwarded < self.interval):
+                self.suppressed += 1
+                return True, 0
+            suppressed, self.suppressed = self.suppressed, 0
+            self.forwarded = now
+            return False, suppressed
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   STATISTICS                                                                                                     #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def percentiles(self, *percents):
+        """
+        Compute percentiles over the RTT samples.
+        :param percents: The percentiles to compute (i.e: 50, 90, 99).
+        :return: A list of RTTs (in seconds) or None values if no sample has been collected.
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return [None] * len(percents)
+        return [samples[min(len(samples) - 1, int(len(samples) * p / 100.0))] for p in percents]
+
+    def histogram(self):
+        """
+        Build the RTT histogram.
+        :return: A list of (upper bound, count) tuples.
+        """
+        counts = [0] * len(BUCKETS)
+        for sample in list(self.samples):
+            for i, bound in enumerate(BUCKETS):
+                if sample <= bound:
+                    counts[i] += 1
+                    break
+        return zip(BUCKETS, counts)
@@ -0,0 +1,240 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import gc
+import os
+import sys
+import types
+
+from collections import deque
+from collections import OrderedDict
+from time import time
+from ircbot.channel import IRCChannel
+from ircbot.client import IRCClient
+
+# objects whose content is never accounted
+ATOMIC = (basestring, int, long, float, bool, complex, type(None), type, types.ClassType, types.ModuleType,
+          types.FunctionType, types.MethodType, types.BuiltinFunctionType, types.CodeType, types.FrameType)
+
+# directory of the plugin sources: closures created by the plugin code are accounted
+SOURCES = os.path.dirname(os.path.abspath(__file__))
+
+
+def sizeof(obj, exclude=None):
+    """
+    Return the approximate size (in bytes) of an object and of everything it references.
+    :param obj: The object to measure.
+    :param exclude: A set of object ids which must not be accounted nor traversed.
+    """
+    seen = set(exclude or ())
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item, 0)
+        if isinstance(item, ATOMIC):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(list(item))
+        else:
+            if hasattr(item, '__dict__'):
+                stack.append(item.__dict__)
+            for name in getattr(type(item), '__slots__', ()):
+                if hasattr(item, name):
+                    stack.append(getattr(item, name))
+    return size
+
+
+def format_size(size):
+    """
+    Format an amount of bytes in a human readable form.
+
+    >>> format_size(512), format_size(2048), format_size(3 * 1024 * 1024)
+    ('512B', '2.0KB', '3.0MB')
+    """
+    for unit in ('B', 'KB'):
+        if abs(size) < 1024:
+            return '%d%s' % (size, unit) if unit == 'B' else '%.1f%s' % (size, unit)
+        size /= 1024.0
+    return '%.1fMB' % size
+
+
+class IRCMemorySnapshot(object):
+    """
+    Represent the memory usage of the IRC BOT structures at a given time.
+    """
+    def __init__(self, entries, types_):
+        """
+        :param entries: An OrderedDict of name -> (count, bytes) tuples.
+        :param types_: A dict of type name -> amount of objects tracked by the garbage collector.
+        """
+        self.taken = time()
+        self.entries = entries
+        self.types = types_
+
+    def diff(self, other, top=5):
+        """
+        Compare this snapshot with a previous one.
+        :param other: The previous IRCMemorySnapshot.
+        :param top: The amount of growing types to be returned.
+        :return: A (entries, types) tuple: entries is a list of (name, count delta, bytes delta) tuples for the
+                 structures which changed and types a list of (type name, count delta) tuples of the types which grew
+                 the most.
+        """
+        entries = []
+        for name, (count, size) in self.entries.items():
+            before = other.entries.get(name, (0, 0))
+            if count != before[0] or size != before[1]:
+                entries.append((name, count - before[0], size - before[1]))
+        grown = [(name, count - other.types.get(name, 0)) for name, count in self.types.items()]
+        grown = [x for x in grown if x[1] > 0 and x[0] != self.__class__.__name__]       # skip the baseline itself
+        grown = sorted(grown, key=lambda x: x[1], reverse=True)[:top]
+        return entries, grown
+
+
+class IRCMemory(object):
+    """
+    Memory introspection of the IRC BOT: counts and approximate sizes of the BOT structures and detection of the
+    objects which are still alive while not referenced by the BOT anymore (channels, clients).
+    """
+    ircbot = None       # IRC BOT object instance
+    baseline = None     # the snapshot saved with !memory snapshot
+
+    def __init__(self, ircbot):
+        """
+        Create a new IRCMemory instance.
+        :param ircbot: The IRC BOT object instance.
+        """
+        self.ircbot = ircbot
+
+    def exclude(self):
+        """
+        Return the ids of the objects which must not be traversed when measuring the BOT structures.
+        """
+        ircbot = self.ircbot
+        objects = [ircbot, ircbot.connection, ircbot.reactor, ircbot.plugin, getattr(ircbot.plugin, 'console', None)]
+        if ircbot.senders:
+            objects.extend(ircbot.senders.senders)
+        return set(id(x) for x in objects if x is not None)
+
+    def snapshot(self):
+        """
+        Measure the BOT structures.
+        :return: An IRCMemorySnapshot instance.
+        """
+        ircbot = self.ircbot
+        exclude = self.exclude()
+        entries = OrderedDict()
+
+        channels = ircbot.channels.values()
+        entries['channels'] = (len(channels), sizeof(ircbot.channels, exclude))
+
+        # channel members and the mode dicts (entries of the mode dicts must be in the users dict as well)
+        members, size, stale = 0, 0, 0
+        for channel in channels:
+            members += len(channel.userdict)
+            size += sizeof(channel.userdict, exclude | set(id(x) for x in channels))
+            for modedict in channel.modedict.values():
+                stale += len([nick for nick in modedict.keys() if nick not in channel.userdict])
+        entries['members'] = (members, size)
+        entries['stale modes'] = (stale, 0)
+
+        # objects alive but not referenced by the BOT anymore
+        alive = set(id(x) for x in channels)
+        referenced = set(id(client) for channel in channels for client in channel.userdict.values())
+        orphans = {'channels': [], 'clients': []}
+        closures = []
+        counts = {}
+        for obj in gc.get_objects():
+            kind = type(obj)
+            name = getattr(kind, '__name__', str(kind))
+            counts[name] = counts.get(name, 0) + 1
+            if isinstance(obj, IRCChannel):
+                if id(obj) not in alive:
+                    orphans['channels'].append(obj)
+            elif isinstance(obj, IRCClient):
+                if id(obj) not in referenced:
+                    orphans['clients'].append(obj)
+            elif kind is types.FunctionType and obj.func_closure and obj.func_code.co_filename.startswith(SOURCES):
+                closures.append(obj)
+        entries['orphan channels'] = (len(orphans['channels']), sum(sizeof(x, exclude) for x in orphans['channels']))
+        entries['orphan clients'] = (len(orphans['clients']), sum(sizeof(x, exclude) for x in orphans['clients']))
+        entries['closures'] = (len(closures), sum(sys.getsizeof(x, 0) for x in closures))
+
+        # reactor
+        reactor = ircbot.reactor
+        entries['handlers'] = (sum(len(x) for x in reactor.handlers.values()), sizeof(reactor.handlers, exclude))
+        entries['delayed commands'] = (len(reactor.delayed_commands), sizeof(reactor.delayed_commands, exclude))
+        entries['connections'] = (len(reactor.connections), 0)
+
+        # queues and buffers
+        entries['send queue'] = (int(ircbot.metrics.queue.get()), 0)
+        entries['outage buffer'] = (len(ircbot.outage), sizeof((ircbot.outage.ring, ircbot.outage.summary), exclude))
+        entries['traces'] = (len(ircbot.tracer.traces) + len(ircbot.tracer.collected or ()),
+                             sizeof((ircbot.tracer.traces, ircbot.tracer.collected), exclude))
+        entries['lag samples'] = (len(ircbot.lag.samples), sizeof((ircbot.lag.samples, ircbot.lag.outgoing), exclude))
+        if ircbot.coordinator:
+            coordinator = ircbot.coordinator
+            entries['coordinator'] = (len(coordinator.replies) + len(coordinator.chunks),
+                                      sizeof((coordinator.peers, coordinator.replies, coordinator.chunks,
+                                              coordinator.sequence), exclude))
+        entries['commands'] = (len(ircbot.commands), sizeof(ircbot.commands, exclude))
+        entries['metrics'] = (sum(len(list(x.series())) for x in ircbot.metrics), sizeof(ircbot.metrics, exclude))
+
+        return IRCMemorySnapshot(entries, counts)
+
+    def save(self):
+        """
+        Take a snapshot and keep it as baseline for the following diffs.
+        :return: The IRCMemorySnapshot taken.
+        """
+        self.baseline = self.snapshot()
+        return self.baseline
+
+    def diff(self):
+        """
+        Compare the current memory usage with the baseline.
+        :return: A (baseline, current, entries, types) tuple (see IRCMemorySnapshot.diff) or None if no baseline.
+        """
+        if self.baseline is None:
+            return None
+        current = self.snapshot()
+        entries, grown = current.diff(self.baseline)
+        return self.baseline, current, entries, grown
+
+    @staticmethod
+    def report(snapshot):
+        """
+        Return the entries of a snapshot as a list of strings.
+        """
+        return ['%s: %s (%s)' % (name, count, format_size(size)) if size else '%s: %s' % (name, count)
+                for name, (count, size) in snapshot.entries.items()]
+
+    @staticmethod
+    def changes(entries):
+        """
+        Return the entries of a diff as a list of strings.
+        """
+        return ['%s: %+d (%s%s)' % (name, count, '+' if size >= 0 else '-', format_size(abs(size)))
+                for name, count, size in entries]
@@ -0,0 +1,321 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from bisect import bisect_left
+from collections import OrderedDict
+from time import time
+
+# upper bounds (in seconds) of the default histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class IRCMetric(object):
+    """
+    Base class for a named metric, optionally split by the value of a single label.
+    Recording is lock free: values are updated by plain attribute increments so
+    concurrent updates from different threads may (rarely) be lost.
+    """
+    kind = 'untyped'    # metric type (as reported in the Prometheus text format)
+    name = None         # metric name
+    help = None         # metric description
+    label = None        # name of the label splitting the metric (if any)
+    value = 0           # current value
+    function = None     # callable computing the value when the metric is read (if any)
+
+    def __init__(self, name, help='', label=None, function=None):
+        """
+        Create a new metric.
+        :param name: The metric name.
+        :param help: The metric description.
+        :param label: The name of the label splitting the metric (if any).
+        :param function: A callable computing the value when the metric is read.
+        """
+        self.name = name
+        self.help = help
+        self.label = label
+        self.function = function
+        self.children = {}
+
+    def get(self):
+        """
+        Return the metric value.
+        """
+        if self.function:
+            try:
+                return self.function()
+            except Exception:
+                return None
+        return self.value
+
+    def create(self):
+        """
+        Create a child metric (holding the values of a single label value).
+        """
+        return self.__class__(self.name, self.help)
+
+    def labels(self, value):
+        """
+        Return the child metric for the given label value.
+        :param value: The label value.
+        """
+        try:
+            return self.children[value]
+        except KeyError:
+            return self.children.setdefault(value, self.create())
+
+    def series(self):
+        """
+        Return a list of (label value, metric) tuples: label value is None for metrics without label.
+        """
+        if self.label:
+            return sorted(self.children.items())
+        return [(None, self)]
+
+
+class IRCCounter(IRCMetric):
+    """
+    A monotonically increasing value.
+    """
+    kind = 'counter'
+    rate = 0.0          # increments per second over the last tick
+    last = 0            # value seen on the last tick
+
+    def inc(self, amount=1):
+        """
+        Increment the counter.
+        :param amount: The amount to add.
+        """
+        self.value += amount
+
+    def update(self, elapsed):
+        """
+        Compute the rate over the given amount of seconds.
+        :param elapsed: The amount of seconds elapsed since the last update.
+        """
+        value = self.get() or 0
+        self.rate = (value - self.last) / elapsed if elapsed > 0 else 0.0
+        self.last = value
+
+
+class IRCGauge(IRCMetric):
+    """
+    A value which can go up and down or which is computed when read.
+    """
+    kind = 'gauge'
+
+    def set(self, value):
+        """
+        Set the gauge value.
+        """
+        self.value = value
+
+    def inc(self, amount=1):
+        """
+        Increment the gauge value.
+        """
+        self.value += amount
+
+    def dec(self, amount=1):
+        """
+        Decrement the gauge value.
+        """
+        self.value -= amount
+
+
+class IRCHistogram(IRCMetric):
+    """
+    Count observations in fixed buckets.
+    """
+    kind = 'histogram'
+    buckets = DEFAULT_BUCKETS   # upper bounds of the buckets (the last one must be +inf)
+    count = 0                   # amount of observations
+    sum = 0.0                   # sum of the observations
+
+    def __init__(self, name, help='', label=None, buckets=DEFAULT_BUCKETS):
+        """
+        Create a new histogram.
+        :param name: The metric name.
+        :param help: The metric description.
+        :param label: The name of the label splitting the metric (if any).
+        :param buckets: The upper bounds of the buckets (the last one must be +inf).
+        """
+        IRCMetric.__init__(self, name, help, label)
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+
+    def create(self):
+        """
+        Create a child histogram using the same buckets.
+        """
+        return self.__class__(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value):
+        """
+        Record an observation.
+        :param value: The observed value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimate a quantile: the upper bound of the bucket the quantile falls in is returned.
+        :param q: The quantile (0-1).
+        :return: The upper bound of the bucket or None if nothing has been observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def cumulative(self):
+        """
+        Return a list of (upper bound, cumulative count) tuples.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class IRCMetrics(object):
+    """
+    Registry of the metrics collected by the IRC BOT.
+    """
+    started = 0         # time the registry has been created
+    ticked = 0          # time of the last rate computation
+
+    def __init__(self):
+        """
+        Create a new IRCMetrics instance registering the metrics used by the IRC BOT.
+        """
+        self.metrics = OrderedDict()
+        self.started = self.ticked = time()
+        self.lines_in = self.counter('irc_lines_received_total', 'Lines received from the IRC server')
+        self.events = self.counter('irc_events_total', 'Events dispatched by type', 'type')
+        self.lines_out = self.counter('irc_lines_sent_total', 'Lines sent to the IRC server')
+        self.bytes_out = self.counter('irc_bytes_sent_total', 'Bytes sent to the IRC server')
+        self.queue = self.gauge('irc_send_queue_depth', 'Messages waiting for the rate limit')
+        self.queue_wait = self.histogram('irc_send_queue_wait_seconds', 'Time spent waiting for the rate limit')
+        self.commands = self.histogram('irc_command_duration_seconds', 'Execution time of IRC commands', 'command')
+        self.command_errors = self.counter('irc_command_errors_total', 'IRC commands which raised an exception', 'command')
+        self.slow_commands = self.counter('irc_slow_commands_total', 'IRC commands slower than settings::slow_command',
+                                          'command')
+        self.delivery = self.histogram('irc_delivery_seconds', 'Time between a B3 event and the delivery of the '
+                                       'resulting message on IRC', 'flag')
+
+    def __iter__(self):
+        """
+        Iterate over the registered metrics.
+        """
+        return iter(self.metrics.values())
+
+    def register(self, metric):
+        """
+        Register a metric.
+        :param metric: The IRCMetric instance to register.
+        :return: The registered metric.
+        """
+        self.metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        """
+        Return the metric matching the given name (if any).
+        """
+        return self.metrics.get(name)
+
+    def counter(self, name, help, label=None, function=None):
+        """
+        Register a new counter.
+        """
+        return self.register(IRCCounter(name, help, label, function))
+
+    def gauge(self, name, help, label=None, function=None):
+        """
+        Register a new gauge.
+        """
+        return self.register(IRCGauge(name, help, label, function))
+
+    def histogram(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        """
+        Register a new histogram.
+        """
+        return self.register(IRCHistogram(name, help, label, buckets))
+
+    def tick(self):
+        """
+        Periodically compute the rate of the counters.
+        """
+        now = time()
+        elapsed, self.ticked = now - self.ticked, now
+        for metric in self:
+            if metric.kind == 'counter':
+                for value, counter in metric.series():
+                    counter.update(elapsed)
+
+    def report(self, match=None, top=10):
+        """
+        Return a human readable summary of the metrics.
+        :param match: Only metrics whose name contains this string are reported.
+        :param top: Maximum amount of label values reported for counters.
+        :return: A list of (name, text) tuples.
+        """
+        def ms(value):
+            if value is None:
+                return 'n/a'
+            if value == float('inf'):
+                return 'inf'
+            return '%.1fms' % (value * 1000)
+
+        lines = []
+        for metric in self:
+            if match and match not in metric.name:
+                continue
+
+            if metric.kind == 'counter':
+                series = metric.series()
+                if metric.label:
+                    series = sorted(series, key=lambda x: x[1].get(), reverse=True)[:top]
+                text = ', '.join('%s%s (%.1f/s)' % ('%s=' % value if value is not None else '', counter.get(),
+                                                    counter.rate) for value, counter in series)
+                lines.append((metric.name, text or 'n/a'))
+            elif metric.kind == 'gauge':
+                text = ', '.join('%s%s' % ('%s=' % value if value is not None else '', gauge.get())
+                                 for value, gauge in metric.series())
+                lines.append((metric.name, text or 'n/a'))
+            elif metric.kind == 'histogram':
+                for value, histogram in metric.series():
+                    name = '%s{%s}' % (metric.name, value) if value is not None else metric.name
+                    if not histogram.count:
+                        lines.append((name, 'n/a'))
+                        continue
+                    lines.append((name, 'count: %s - avg: %s - p50: <%s - p95: <%s - p99: <%s' % (
+                                  histogram.count, ms(histogram.sum / histogram.count), ms(histogram.quantile(0.5)),
+                                  ms(histogram.quantile(0.95)), ms(histogram.quantile(0.99)))))
+                if not metric.series():
+                    lines.append((metric.name, 'n/a'))
+        return lines
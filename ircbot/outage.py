@@ -0,0 +1,271 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import json
+import os
+
+from collections import deque
+from threading import Lock
+from time import localtime
+from time import strftime
+from time import time
+from irc.client import ServerNotConnectedError
+from irc.strings import lower
+
+# notices summarized rather than replayed one by one (flag -> description used in the summary)
+SUMMARIZED = {'showgame': 'map changes'}
+
+
+class IRCOutageBuffer(object):
+    """
+    Keep the notices generated while the BOT is not in the channel (the connection is down or
+    being established) and deliver them once the channel has been joined again.
+    The buffer is a bounded ring: when it's full the oldest notices are either spilled to a local
+    file (if configured) or discarded. Notices which only make sense when recent (i.e: map changes)
+    are collapsed into a single summary line.
+    """
+    ircbot = None           # IRC BOT object instance
+    size = 100              # maximum amount of notices kept in memory
+    path = None             # path of the file where notices are spilled when the ring is full (if any)
+    limit = 1000            # maximum amount of notices spilled to the file
+    spilled = 0             # amount of notices currently stored in the spill file
+    dropped = 0             # amount of notices discarded since the last flush
+    summary = None          # dict (flag -> [count, first notice, last notice]) of the summarized notices
+
+    def __init__(self, ircbot, size=100, path=None, limit=1000):
+        """
+        Create a new IRCOutageBuffer instance.
+        :param ircbot: The IRC BOT object instance.
+        :param size: The maximum amount of notices kept in memory.
+        :param path: The path of the file where notices are spilled when the ring is full.
+        :param limit: The maximum amount of notices spilled to the file.
+        """
+        self.ircbot = ircbot
+        self.size = size
+        self.path = path or None
+        self.limit = limit
+        self.ring = deque()
+        self.summary = {}
+        self.lock = Lock()
+        if self.path and os.path.isfile(self.path):
+            # notices left there by a previous run (B3 was restarted during an outage)
+            self.spilled = len(self.load())
+
+    def __len__(self):
+        """
+        Return the amount of pending notices.
+        """
+        return len(self.ring) + self.spilled + sum(x[0] for x in self.summary.itervalues())
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   DELIVERY                                                                                                       #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def ready(self):
+        """
+        Tell whether notices can be delivered right away.
+        """
+        return self.ircbot.connection.is_connected() and len(self.ircbot.channels) > 0
+
+    def notify(self, message, flag, origin=None):
+        """
+        Deliver a notice to the channels having the given flag enabled or keep it for later.
+        Can be called from any thread.
+        :param message: The notice to be sent.
+        :param flag: The name of the channel attribute enabling this kind of notices (i.e: showbans).
+        :param origin: The time of the B3 event originating the notice (now if not given).
+        """
+        origin = origin if origin is not None else time()
+        if self.size > 0 and (len(self) or not self.ready()):
+            # keep the ordering: if notices are still pending this one is queued after them
+            self.add(message, flag, origin=origin)
+            return
+
+        try:
+            self.send(message, flag)
+            # the rate limit is waited for in this thread: the lines have left the throttler by now
+            self.ircbot.metrics.delivery.labels(flag).observe(max(0.0, time() - origin))
+        except ServerNotConnectedError, e:
+            if self.size > 0:
+                # only the channels which have not been reached get the notice once connected again
+                self.add(message, flag, e.pending, origin)
+
+    def send(self, message, flag=None, channels=None):
+        """
+        Send a notice to the channels having the given flag enabled.
+        :param message: The notice to be sent.
+        :param flag: The name of the channel attribute enabling this kind of notices (None for all the channels).
+        :param channels: The names of the channels the notice is restricted to (None for all the channels).
+        :raise ServerNotConnectedError: If the connection is lost: the names of the channels which have
+                                        not been reached yet are stored in the pending attribute of the exception.
+        """
+        allowed = set(lower(x) for x in channels) if channels is not None else None
+        targets = [name for name, channel in self.ircbot.channels.items()
+                   if (not flag or getattr(channel, flag)) and (allowed is None or lower(name) in allowed)]
+        for index, name in enumerate(targets):
+            try:
+                self.ircbot.channels[name].message(message)
+            except ServerNotConnectedError, e:
+                e.pending = targets[index:]
+                raise
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   BUFFERING                                                                                                      #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def add(self, message, flag, channels=None, origin=None):
+        """
+        Store a notice.
+        :param message: The notice to be stored.
+        :param flag: The name of the channel attribute enabling this kind of notices.
+        :param channels: The names of the channels the notice is restricted to (None for all the channels).
+        :param origin: The time of the B3 event originating the notice (now if not given).
+        """
+        entry = (origin if origin is not None else time(), flag, message, channels)
+        self.ircbot.tracer.mark('queued')
+        with self.lock:
+            if flag in SUMMARIZED:
+                if flag in self.summary:
+                    self.summary[flag][0] += 1
+                    self.summary[flag][2] = entry
+                else:
+                    self.summary[flag] = [1, entry, entry]
+                return
+
+            self.ring.append(entry)
+            if len(self.ring) > self.size:
+                self.spill(self.ring.popleft())
+
+    def spill(self, entry):
+        """
+        Move a notice out of the ring: it's written to the spill file if any, discarded otherwise.
+        :param entry: A (timestamp, flag, message, channels) tuple.
+        """
+        if not self.path or self.spilled >= self.limit:
+            self.dropped += 1
+            return
+
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.spilled += 1
+        except (IOError, OSError, UnicodeDecodeError), e:
+            self.ircbot.warning('could not spill notice to %s: %s', self.path, e)
+            self.dropped += 1
+
+    def load(self):
+        """
+        Read the notices spilled to the file.
+        :return: A list of (timestamp, flag, message, channels) tuples.
+        """
+        entries = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        # files written by previous versions do not store the channels
+                        timestamp, flag, message, channels = (json.loads(line) + [None])[:4]
+                        if channels is not None:
+                            channels = [x.encode('utf-8') for x in channels]
+                        entries.append((timestamp, str(flag), message.encode('utf-8'), channels))
+                    except (ValueError, TypeError, AttributeError):
+                        # partially written line
+                        continue
+        except (IOError, OSError), e:
+            self.ircbot.warning('could not read spilled notices from %s: %s', self.path, e)
+        return entries
+
+    def take(self):
+        """
+        Empty the buffer.
+        :return: A tuple (entries, summary, dropped) with the entries sorted chronologically.
+        """
+        with self.lock:
+            entries = []
+            if self.spilled:
+                entries = self.load()
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+                self.spilled = 0
+            entries.extend(self.ring)
+            self.ring.clear()
+            summary, self.summary = self.summary, {}
+            dropped, self.dropped = self.dropped, 0
+        return entries, summary, dropped
+
+    ####################################################################################################################
+    #                                                                                                                  #
+    #   REPLAY                                                                                                         #
+    #                                                                                                                  #
+    ####################################################################################################################
+
+    def flush(self):
+        """
+        Deliver the pending notices: executed by the reactor thread once the channel has been joined.
+        """
+        if not len(self) and not self.dropped:
+            return
+
+        entries, summary, dropped = self.take()
+        self.ircbot.debug('replaying %s notices queued while disconnected (%s discarded)', len(entries), dropped)
+
+        stamp = lambda timestamp: strftime('%H:%M', localtime(timestamp))
+        index = 0
+        try:
+            if dropped:
+                self.send('%s older notices were discarded while disconnected' % dropped)
+            while index < len(entries):
+                timestamp, flag, message, channels = entries[index]
+                self.ircbot.tracer.begin(flag, timestamp, sample=False)
+                try:
+                    self.send('(%s) %s' % (stamp(timestamp), message), flag, channels)
+                except ServerNotConnectedError, e:
+                    entries[index] = (timestamp, flag, message, e.pending)
+                    raise
+                finally:
+                    self.ircbot.tracer.end()
+                self.ircbot.metrics.delivery.labels(flag).observe(max(0.0, time() - timestamp))
+                index += 1
+            for flag, (count, first, last) in summary.items():
+                if count > 1:
+                    self.send('(%s-%s) %s %s while disconnected, latest: %s' % (stamp(first[0]), stamp(last[0]),
+                                                                                  count, SUMMARIZED[flag], last[2]), flag)
+                else:
+                    try:
+                        self.send('(%s) %s' % (stamp(last[0]), last[2]), flag, last[3])
+                    except ServerNotConnectedError, e:
+                        summary[flag][2] = last[:3] + (e.pending,)
+                        raise
+                del summary[flag]
+        except ServerNotConnectedError:
+            # lost the connection again: keep what hasn't been sent for the next flush
+            self.ircbot.warning('connection lost while replaying notices queued while disconnected')
+            with self.lock:
+                self.ring.extendleft(reversed(entries[index:]))
+                for flag, (count, first, last) in summary.iteritems():
+                    if flag in self.summary:
+                        self.summary[flag][0] += count
+                        self.summary[flag][1] = first
+                    else:
+                        self.summary[flag] = [count, first, last]
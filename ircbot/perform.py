@@ -0,0 +1,184 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from irc.client import ServerConnectionError
+from irc.events import numeric
+from irc.strings import lower
+
+
+class IRCPerformCommand(object):
+    """
+    Represent a single auto perform command.
+    """
+    command = None      # the raw command to be sent
+    wait = None         # the event type to wait for before moving to the next command
+    source = None       # the nickname the awaited event must come from (if any)
+    timeout = 10        # amount of seconds to wait for the awaited event
+    delay = 0           # amount of seconds to wait before sending the command
+
+    def __init__(self, command, wait=None, source=None, timeout=10, delay=0):
+        """
+        Create a new IRCPerformCommand instance.
+        :param command: The raw command to be sent.
+        :param wait: The event type or numeric reply to wait for (i.e: 900 or privnotice).
+        :param source: The nickname the awaited event must come from (i.e: NickServ).
+        :param timeout: Amount of seconds to wait for the awaited event.
+        :param delay: Amount of seconds to wait before sending the command.
+        """
+        self.command = command
+        self.wait = numeric.get(wait, wait.lower()) if wait else None
+        self.source = lower(source) if source else None
+        self.timeout = timeout
+        self.delay = delay
+
+    def __repr__(self):
+        """
+        String object representation.
+        :return: A string representing this object.
+        """
+        return '%s<%s> : wait<%s> : source<%s> : timeout<%s> : delay<%s>' % (self.__class__.__name__, self.command,
+                                                                             self.wait, self.source, self.timeout,
+                                                                             self.delay)
+
+
+class IRCPerform(object):
+    """
+    Send the auto perform commands as a timed pipeline on the reactor timer queue.
+    Every step is executed by the reactor thread so the BOT never stops processing
+    incoming data (PINGs included) while the pipeline is running.
+    """
+    ircbot = None       # IRC BOT object instance
+    connection = None   # server connection instance
+    commands = []       # list of IRCPerformCommand objects
+    callback = None     # function to be executed when the pipeline is done
+    index = 0           # index of the current step
+    waiting = None      # the event type we are currently waiting for
+    active = False      # whether the pipeline is running
+
+    def __init__(self, ircbot, commands, callback):
+        """
+        Create a new IRCPerform instance.
+        :param ircbot: The IRC BOT object instance.
+        :param commands: A list of IRCPerformCommand objects.
+        :param callback: The function to execute once all the commands have been processed.
+        """
+        self.ircbot = ircbot
+        self.connection = ircbot.connection
+        self.commands = list(commands)
+        self.callback = callback
+
+    def start(self):
+        """
+        Start the pipeline.
+        """
+        self.active = True
+        self.index = 0
+        self.schedule()
+
+    def cancel(self):
+        """
+        Stop the pipeline: pending timers will be ignored.
+        """
+        self.active = False
+        self.stop_waiting()
+
+    def schedule(self):
+        """
+        Schedule the execution of the current step.
+        """
+        delay = self.commands[self.index].delay if self.index < len(self.commands) else 0
+        self.connection.execute_delayed(delay, self.step, (self.index,))
+
+    def advance(self):
+        """
+        Move to the next step.
+        """
+        self.index += 1
+        self.schedule()
+
+    def step(self, index):
+        """
+        Execute a step of the pipeline.
+        :param index: The index of the step scheduled: stale timers are ignored.
+        """
+        if not self.active or index != self.index:
+            return
+
+        if self.index >= len(self.commands):
+            # we are done: let the BOT move on
+            self.active = False
+            self.callback()
+            return
+
+        command = self.commands[self.index]
+        self.ircbot.debug('sending auto perform command: %s', command.command)
+
+        try:
+            self.connection.send_raw(command.command)
+        except ServerConnectionError, e:
+            self.ircbot.warning('could not send auto perform command (%s): %s', command.command, e)
+            self.cancel()
+            return
+
+        if not command.wait:
+            self.advance()
+            return
+
+        # wait for the server reply before moving on
+        self.waiting = command.wait
+        self.connection.add_global_handler(self.waiting, self.on_reply, -15)
+        self.connection.execute_delayed(command.timeout, self.on_timeout, (self.index,))
+
+    def stop_waiting(self):
+        """
+        Remove the handler of the awaited event (if any).
+        """
+        if self.waiting:
+            self.connection.remove_global_handler(self.waiting, self.on_reply)
+            self.waiting = None
+
+    def on_reply(self, connection, event):
+        """
+        Triggered when the awaited event is received.
+        :param connection: The current server connection object instance.
+        :param event: The event to be handled.
+        """
+        if not self.active or connection is not self.connection:
+            return
+
+        command = self.commands[self.index]
+        if command.source and (not event.source or lower(event.source.nick) != command.source):
+            return
+
+        self.ircbot.debug('received %s reply for auto perform command: %s', event.type, command.command)
+        self.stop_waiting()
+        self.advance()
+
+    def on_timeout(self, index):
+        """
+        Triggered when the awaited event doesn't show up in time.
+        :param index: The index of the step which scheduled the timeout.
+        """
+        if not self.active or index != self.index or not self.waiting:
+            return
+
+        command = self.commands[self.index]
+        self.ircbot.warning('no %s reply received for auto perform command (%s) after %s seconds: moving on',
+                            command.wait, command.command, command.timeout)
+        self.stop_waiting()
+        self.advance()
@@ -0,0 +1,249 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import cProfile
+import os
+import pstats
+import sys
+import thread
+
+from StringIO import StringIO
+from threading import Event
+from threading import Thread
+from time import localtime
+from time import sleep
+from time import strftime
+from time import time
+
+MODES = ('cprofile', 'sampling')
+MAX_WINDOW = 600            # maximum amount of seconds a profiling session can last
+SAMPLE_INTERVAL = 0.005     # amount of seconds between two samples of the reactor thread stack
+
+# functions reported in the handlers section: event handlers and commands
+HANDLERS = ('on_', '_on_', 'cmd_')
+
+
+class IRCProfilerSession(object):
+    """
+    Represent a running profiling session.
+    """
+    def __init__(self, mode, seconds, owner=None):
+        self.mode = mode
+        self.seconds = seconds
+        self.owner = owner
+        self.started = time()
+        self.profile = None     # cProfile.Profile instance (cprofile mode)
+        self.samples = 0        # amount of samples taken (sampling mode)
+        self.leaf = {}          # function -> amount of samples in which it was executing (sampling mode)
+        self.stack = {}         # function -> amount of samples in which it was on the stack (sampling mode)
+        self.done = Event()
+
+    def remaining(self):
+        return max(0, self.seconds - (time() - self.started))
+
+
+class IRCProfiler(object):
+    """
+    Profile the reactor thread on demand for a bounded window of time: either deterministically (cProfile enabled in
+    the reactor thread: every event handler and command executed in it gets accounted) or statistically (a separate
+    thread samples the reactor thread stack). Nothing is installed while no session is running.
+    """
+    ircbot = None       # IRC BOT object instance
+    path = None         # directory where the profiles are written
+    top = 30            # amount of functions written in the profiles
+    session = None      # the running IRCProfilerSession (if any)
+    last = None         # path of the last profile written
+    hot = []            # hottest functions of the last session
+    ident = None        # identifier of the reactor thread
+
+    def __init__(self, ircbot, path, top=30):
+        """
+        Create a new IRCProfiler instance.
+        :param ircbot: The IRC BOT object instance.
+        :param path: The directory where the profiles are written.
+        :param top: The amount of functions written in the profiles.
+        """
+        self.ircbot = ircbot
+        self.path = path
+        self.top = top
+
+    def active(self):
+        return self.session is not None
+
+    @staticmethod
+    def parse(data):
+        """
+        Parse the arguments of the profile commands: [start [<seconds>] [cprofile|sampling]|stop].
+        :return: An (action, seconds, mode) tuple: action is None when no argument is given.
+        :raise ValueError: If the arguments are not valid.
+        """
+        args = (data or '').lower().split()
+        if not args:
+            return None, None, None
+
+        action = args.pop(0)
+        if action == 'stop' and not args:
+            return action, None, None
+        if action != 'start':
+            raise ValueError('invalid action: %s' % action)
+
+        seconds, mode = 60, MODES[0]
+        for arg in args:
+            if arg.isdigit():
+                seconds = int(arg)
+            elif arg in MODES:
+                mode = arg
+            else:
+                raise ValueError('invalid argument: %s' % arg)
+        return action, seconds, mode
+
+    def start(self, seconds=60, mode='cprofile', owner=None):
+        """
+        Start a profiling session.
+        :param seconds: The duration of the session (clamped to MAX_WINDOW).
+        :param mode: The profiling mode (cprofile or sampling).
+        :param owner: The name of who started the session.
+        :raise ValueError: If the mode is not valid or a session is already running.
+        """
+        if mode not in MODES:
+            raise ValueError('invalid profiling mode: %s' % mode)
+        if self.session is not None:
+            raise ValueError('a profiling session is already running')
+
+        self.session = session = IRCProfilerSession(mode, max(1, min(MAX_WINDOW, seconds)), owner)
+        self.ircbot.debug('starting %s profiling session for %s seconds', mode, session.seconds)
+        # the profiler hooks are per thread: install them from within the reactor thread
+        self.ircbot.connection.execute_delayed(0, self.install, (session,))
+        self.ircbot.connection.execute_delayed(session.seconds, self.stop, (session,))
+        return session
+
+    def install(self, session):
+        """
+        Install the profiler (executed in the reactor thread).
+        """
+        if session is not self.session:
+            return
+        self.ident = thread.get_ident()
+        if session.mode == 'cprofile':
+            session.profile = cProfile.Profile()
+            session.profile.enable()
+        else:
+            sampler = Thread(target=self.sample, args=(session,), name='ircbot-profiler')
+            sampler.setDaemon(True)
+            sampler.start()
+
+    def sample(self, session):
+        """
+        Sample the reactor thread stack until the session is over (executed in a separate thread).
+        """
+        ident = self.ident
+        while session is self.session and not session.done.is_set():
+            frame = sys._current_frames().get(ident)
+            if frame is not None:
+                session.samples += 1
+                key = (frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+                session.leaf[key] = session.leaf.get(key, 0) + 1
+                seen = set()
+                while frame is not None:
+                    key = (frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+                    if key not in seen:
+                        seen.add(key)
+                        session.stack[key] = session.stack.get(key, 0) + 1
+                    frame = frame.f_back
+            sleep(SAMPLE_INTERVAL)
+
+    def stop(self, session=None, wait=0):
+        """
+        Stop the running profiling session and write the profile.
+        :param session: The session to stop (stale timers are ignored): the running one if None.
+        :param wait: Amount of seconds to wait for the profile to be written when not called from the reactor thread.
+        :return: The path of the profile written (None if not written yet).
+        """
+        session = session or self.session
+        if session is None or session is not self.session:
+            return None
+
+        if thread.get_ident() != self.ident:
+            # the cProfile hook can only be removed by the reactor thread
+            self.ircbot.connection.execute_delayed(0, self.stop, (session,))
+            session.done.wait(wait)
+            return self.last if session.done.is_set() else None
+
+        if session.profile:
+            session.profile.disable()
+        self.session = None
+        session.done.set()
+
+        self.hot = self.hottest(session)
+        try:
+            self.last = self.write(session)
+            self.ircbot.info('profile written in %s', self.last)
+        except (IOError, OSError), e:
+            self.ircbot.error('could not write profile: %s', e)
+        return self.last
+
+    def write(self, session):
+        """
+        Write the profile of a session in the profiles directory.
+        :return: The path of the file written.
+        """
+        name = 'ircbot-profile-%s-%s.txt' % (strftime('%Y%m%d-%H%M%S', localtime(session.started)), session.mode)
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as f:
+            f.write('IRC BOT %s profile: %s - %.1f seconds%s\n\n' % (session.mode,
+                    strftime('%Y-%m-%d %H:%M:%S', localtime(session.started)), time() - session.started,
+                    ' - started by %s' % session.owner if session.owner else ''))
+            f.write(self.render(session))
+        return path
+
+    def render(self, session):
+        """
+        Render the profile of a session as text.
+        """
+        out = StringIO()
+        if session.profile:
+            stats = pstats.Stats(session.profile, stream=out)
+            out.write('handlers:\n')
+            handlers = [(key, value) for key, value in stats.stats.items() if key[2].startswith(HANDLERS)]
+            handlers.sort(key=lambda x: x[1][3], reverse=True)
+            for (filename, line, name), (cc, nc, tt, ct, callers) in handlers[:self.top]:
+                out.write('  %-40s %8d calls %10.3f ms %10.3f ms/call\n' % (name, nc, ct * 1000, ct * 1000 / nc))
+            out.write('\n')
+            stats.sort_stats('cumulative').print_stats(self.top)
+            stats.sort_stats('time').print_stats(self.top)
+        else:
+            out.write('%d samples taken every %.1f ms\n\n' % (session.samples, SAMPLE_INTERVAL * 1000))
+            for title, counts in (('self', session.leaf), ('total', session.stack)):
+                out.write('top functions (%s):\n' % title)
+                for key, count in sorted(counts.items(), key=lambda x: x[1], reverse=True)[:self.top]:
+                    out.write('  %6.2f%% %6d  %s (%s:%s)\n' % (count * 100.0 / max(1, session.samples), count,
+                                                              key[2], key[0], key[1]))
+                out.write('\n')
+        return out.getvalue()
+
+    @staticmethod
+    def hottest(session, count=3):
+        """
+        Return the hottest functions of a session as a list of strings.
+        """
+        if session.profile:
+            stats = pstats.Stats(session.profile).stats
+            items = sorted(stats.items(), key=lambda x: x[1][2], reverse=True)[:count]
+            return ['%s %.1fms' % (key[2], value[2] * 1000) for key, value in items]
+        items = sorted(session.leaf.items(), key=lambda x: x[1], reverse=True)[:count]
+        return ['%s %.1f%%' % (key[2], value * 100.0 / max(1, session.samples)) for key, value in items]
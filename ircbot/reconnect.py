@@ -0,0 +1,175 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import random
+
+from time import time
+
+STATE_DISCONNECTED = 'disconnected'
+STATE_CONNECTING = 'connecting'
+STATE_CONNECTED = 'connected'
+STATE_WAITING = 'waiting'
+STATE_STOPPED = 'stopped'
+
+
+class IRCReconnector(object):
+    """
+    Single state machine driving the connection to the IRC network.
+    Every failure (connection attempt failed or timed out, EOF on read, error on send, keepalive
+    timeout) is reported by the library as a disconnect event: the reconnection is then scheduled
+    on the reactor timer queue using exponential backoff with jitter.
+    """
+    ircbot = None           # IRC BOT object instance
+    connection = None       # server connection instance
+    state = STATE_DISCONNECTED
+    base = 1                # backoff delay after the first failure (in seconds)
+    cap = 300               # maximum backoff delay (in seconds)
+    keepalive = 15          # amount of seconds between two consecutive keepalive PINGs
+    delay = 0               # the delay used to schedule the pending reconnection
+    attempts = 0            # consecutive failures since the last successful connection
+    connects = 0            # total amount of connection attempts
+    reconnects = 0          # amount of successful connections after the first one
+    failures = 0            # total amount of failed connection attempts and lost connections
+    last_reason = None      # the reason of the last failure
+    token = 0               # identify the pending reconnection: stale timers are ignored
+    probe = None            # function sending the keepalive PING
+
+    def __init__(self, ircbot, base=1, cap=300, keepalive=15, probe=None):
+        """
+        Create a new IRCReconnector instance.
+        :param ircbot: The IRC BOT object instance.
+        :param base: The backoff delay after the first failure (in seconds).
+        :param cap: The maximum backoff delay (in seconds).
+        :param keepalive: Amount of seconds between two consecutive keepalive PINGs.
+        :param probe: A function sending the keepalive PING (i.e: a lag probe).
+        """
+        self.ircbot = ircbot
+        self.connection = ircbot.connection
+        self.base = base
+        self.cap = cap
+        self.keepalive = keepalive
+        self.probe = probe
+        if keepalive > 0:
+            # the connection is considered dead if nothing is read for 2 keepalive periods
+            self.connection.set_keepalive(keepalive, self.on_keepalive)
+
+    def __repr__(self):
+        """
+        String object representation.
+        :return: A string representing this object.
+        """
+        return '%s<%s> : attempts<%s> : connects<%s> : reconnects<%s> : failures<%s>' % (self.__class__.__name__,
+                                                                                          self.state, self.attempts,
+                                                                                          self.connects,
+                                                                                          self.reconnects,
+                                                                                          self.failures)
+
+    def on_connecting(self):
+        """
+        Triggered when a connection attempt is started.
+        """
+        self.token += 1
+        self.state = STATE_CONNECTING
+        self.connects += 1
+
+    def on_connected(self):
+        """
+        Triggered when the server welcomes the BOT: reset the backoff.
+        """
+        if self.connects > 1:
+            self.reconnects += 1
+        self.state = STATE_CONNECTED
+        self.attempts = 0
+        self.delay = 0
+
+    def on_disconnect(self, reason):
+        """
+        Triggered when a connection attempt fails or the connection is lost.
+        :param reason: The reason of the disconnection.
+        """
+        if self.state == STATE_STOPPED:
+            return
+
+        self.failures += 1
+        self.last_reason = reason
+        self.schedule(self.backoff())
+        self.attempts += 1
+
+    def on_keepalive(self):
+        """
+        Executed every keepalive period while the connection is up.
+        """
+        if time() - self.connection.last_read > 2 * self.keepalive:
+            self.ircbot.warning('no data received from the server in %s seconds: dropping the connection',
+                                2 * self.keepalive)
+            self.connection.disconnect('ping timeout')
+            return
+
+        if self.probe:
+            self.probe()
+        else:
+            self.connection.ping('keep-alive')
+
+    def backoff(self):
+        """
+        Compute the delay before the next connection attempt ("equal jitter": half of the exponential
+        delay is fixed, the other half is random so that many BOTs don't reconnect all at once).
+        :return: The delay in seconds.
+        """
+        delay = min(self.cap, self.base * 2 ** min(self.attempts, 31))
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def schedule(self, delay):
+        """
+        Schedule a connection attempt.
+        :param delay: Amount of seconds to wait before connecting.
+        """
+        self.token += 1
+        self.state = STATE_WAITING
+        self.delay = delay
+        self.ircbot.debug('reconnecting in %.2f seconds (attempt %s): %s', delay, self.attempts + 1, self.last_reason)
+        self.connection.execute_delayed(delay, self.fire, (self.token,))
+
+    def fire(self, token):
+        """
+        Start the scheduled connection attempt.
+        :param token: The token of the scheduled attempt: stale timers are ignored.
+        """
+        if token != self.token or self.state != STATE_WAITING:
+            return
+
+        self.ircbot.jump_server()
+
+    def stop(self):
+        """
+        Stop reconnecting (i.e: the BOT is shutting down).
+        """
+        self.token += 1
+        self.state = STATE_STOPPED
+
+    def restart(self, message, delay=2):
+        """
+        Drop the current connection and connect again after the given delay.
+        :param message: The quit message.
+        :param delay: Amount of seconds to wait before connecting: gives the network the time to free our nickname.
+        """
+        self.stop()
+        self.ircbot.connection.disconnect(message)
+        self.attempts = 0
+        self.last_reason = message
+        self.schedule(delay)
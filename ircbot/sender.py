@@ -0,0 +1,180 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import random
+
+from irc.client import ServerConnection
+from irc.strings import lower
+from ircbot.throttle import IRCThrottler
+
+MODE_CHANNEL = 'channel'
+MODE_ROUNDROBIN = 'roundrobin'
+
+
+class IRCSenderConnection(ServerConnection):
+    """
+    Secondary connection used only to send channel messages: its events are never
+    dispatched to the BOT so commands are processed on the primary connection only.
+    """
+    pool = None             # the IRCSenderPool this connection belongs to
+    throttler = None        # per connection rate limit
+    failures = 0            # consecutive failed connection attempts
+    token = 0               # identify the pending reconnection: stale timers are ignored
+
+    def __init__(self, reactor):
+        """
+        Create a new IRCSenderConnection instance.
+        :param reactor: The Reactor instance.
+        """
+        super(IRCSenderConnection, self).__init__(reactor)
+        self.joined = set()
+
+    def _handle_event(self, event):
+        """
+        Handle an event received on this connection: it only reaches the pool.
+        :param event: The event to be handled.
+        """
+        if event.type == 'ping':
+            self.pong(event.target)
+        self.pool.on_event(self, event)
+
+
+class IRCSenderPool(object):
+    """
+    Spread outbound channel traffic across the primary connection and a pool of
+    secondary connections using derived nicknames, in the same reactor.
+    """
+    ircbot = None           # IRC BOT object instance
+    mode = MODE_CHANNEL     # how messages are distributed among connections
+    active = False          # whether the senders should be connected
+    index = 0               # next connection to be used in round-robin mode
+
+    def __init__(self, ircbot, count, mode=MODE_CHANNEL):
+        """
+        Create a new IRCSenderPool instance.
+        :param ircbot: The IRC BOT object instance.
+        :param count: The amount of secondary connections.
+        :param mode: 'channel' to always use the same connection for a given channel, 'roundrobin' to rotate.
+        """
+        self.ircbot = ircbot
+        self.mode = mode
+        self.senders = []
+        for i in xrange(count):
+            sender = ircbot.reactor.server(IRCSenderConnection)
+            sender.pool = self
+            sender.nickname = '%s_%s' % (ircbot.settings['nickname'], i + 1)
+            if ircbot.settings['maxrate'] > 0:
+                sender.throttler = IRCThrottler(ircbot=ircbot, func=sender.send_raw, rate=ircbot.settings['maxrate'],
+                                                burst=ircbot.settings['burst'])
+                sender.send_raw = sender.throttler
+            self.senders.append(sender)
+
+    def start(self):
+        """
+        Connect all the senders which are not connected yet.
+        """
+        self.active = True
+        for sender in self.senders:
+            if not sender.is_connected() and not sender.is_connecting():
+                self.connect(sender)
+
+    def stop(self, message):
+        """
+        Disconnect all the senders.
+        :param message: The quit message.
+        """
+        self.active = False
+        for sender in self.senders:
+            sender.token += 1
+            sender.disconnect(message)
+
+    def connect(self, sender, token=None):
+        """
+        Connect a sender to the server the primary connection is using.
+        :param sender: The IRCSenderConnection to connect.
+        :param token: The token of the scheduled reconnection (if any): stale timers are ignored.
+        """
+        if not self.active or (token is not None and token != sender.token):
+            return
+
+        primary = self.ircbot.connection
+        self.ircbot.debug('connecting sender %s to %s:%s...', sender.nickname, primary.server, primary.port)
+        sender.connect(primary.server, primary.port, sender.nickname, password=primary.password,
+                       ircname=primary.ircname, connect_factory=primary.connect_factory)
+
+    def owns(self, nick):
+        """
+        Return True if the given nickname is used by one of the senders.
+        :param nick: The nickname to check.
+        """
+        nick = lower(nick or '')
+        for sender in self.senders:
+            if nick in (lower(sender.nickname), lower(getattr(sender, 'real_nickname', None) or '')):
+                return True
+        return False
+
+    def pick(self, channel):
+        """
+        Return the connection to be used to send a message in the given channel.
+        :param channel: The channel name.
+        :return: A ServerConnection instance (the primary one if no sender is available).
+        """
+        channel = lower(channel)
+        primary = self.ircbot.connection
+        if self.mode == MODE_ROUNDROBIN:
+            connections = [primary] + [x for x in self.senders if x.is_connected() and channel in x.joined]
+            self.index = (self.index + 1) % len(connections)
+            return connections[self.index]
+
+        connections = [primary] + self.senders
+        connection = connections[hash(channel) % len(connections)]
+        if connection is not primary and not (connection.is_connected() and channel in connection.joined):
+            return primary
+        return connection
+
+    def on_event(self, sender, event):
+        """
+        Handle an event received on a sender connection.
+        :param sender: The IRCSenderConnection which received the event.
+        :param event: The event to be handled.
+        """
+        if event.type == 'welcome':
+            sender.failures = 0
+            sender.join(self.ircbot.settings['channel'])
+        elif event.type == 'nicknameinuse':
+            sender.nick(event.arguments[0] + '_')
+        elif event.type == 'join' and event.source.nick == sender.get_nickname():
+            sender.joined.add(lower(event.target))
+        elif event.type == 'part' and event.source.nick == sender.get_nickname():
+            sender.joined.discard(lower(event.target))
+        elif event.type == 'kick' and event.arguments[0] == sender.get_nickname():
+            sender.joined.discard(lower(event.target))
+        elif event.type == 'tryagain' and sender.throttler:
+            sender.throttler.decrease('server asked %s to try again' % sender.nickname)
+        elif event.type == 'error' and sender.throttler and 'excess flood' in (event.target or '').lower():
+            sender.throttler.decrease('%s: %s' % (sender.nickname, event.target))
+        elif event.type == 'disconnect':
+            sender.joined.clear()
+            if self.active:
+                delay = min(300, 2 ** min(sender.failures, 31))
+                delay = delay / 2.0 + random.uniform(0, delay / 2.0)
+                sender.failures += 1
+                sender.token += 1
+                self.ircbot.debug('sender %s disconnected (%s): reconnecting in %.2f seconds', sender.nickname,
+                                  event.arguments[0] if event.arguments else None, delay)
+                sender.execute_delayed(delay, self.connect, (sender, sender.token))
@@ -0,0 +1,139 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from threading import Lock
+from time import sleep
+from time import time
+
+# commands which never wait for a token: they still consume one so the following messages are delayed
+URGENT = ('PING', 'PONG', 'QUIT')
+
+
+class IRCThrottler(object):
+    """
+    Token bucket limiting the rate of the messages sent to the IRC server. The rate is adjusted
+    AIMD-style: it's halved when the server complains about flooding (RPL_TRYAGAIN, Excess Flood)
+    or when the lag keeps growing, and it's increased additively while everything is fine.
+    """
+    ircbot = None           # IRC BOT object instance
+    func = None             # the function actually sending the data
+    rate = 1.0              # current amount of messages per second
+    maxrate = 1.0           # the rate is never increased above this value
+    minrate = 0.2           # the rate is never decreased below this value
+    step = 0.1              # amount of messages per second added on every increase
+    burst = 5               # capacity of the bucket
+    tokens = 5              # tokens currently available (negative when messages are waiting)
+    stamp = 0               # last time the bucket has been refilled
+    cooldown = 10           # amount of seconds after a decrease during which the rate is not changed
+    decreased = 0           # last time the rate has been decreased
+    lastlag = None          # the lag seen on the previous tick
+
+    def __init__(self, ircbot, func, rate=1.0, burst=5, minrate=0.2, step=0.1, interval=10):
+        """
+        Create a new IRCThrottler instance.
+        :param ircbot: The IRC BOT object instance.
+        :param func: The function actually sending the data.
+        :param rate: The amount of messages per second: this is also the maximum rate.
+        :param burst: The amount of messages which can be sent at once.
+        :param minrate: The minimum amount of messages per second.
+        :param step: The amount of messages per second added on every increase.
+        :param interval: Amount of seconds between two consecutive rate adjustments.
+        """
+        self.ircbot = ircbot
+        self.func = func
+        self.rate = self.maxrate = float(rate)
+        self.minrate = min(minrate, self.rate)
+        self.step = step
+        self.burst = self.tokens = burst
+        self.stamp = time()
+        self.lock = Lock()
+        ircbot.connection.execute_every(interval, self.tick)
+
+    def __call__(self, data):
+        """
+        Send data to the server as soon as a token is available.
+        :param data: The string to be sent.
+        """
+        tracer = self.ircbot.tracer
+        tracer.mark('enqueue')
+        with self.lock:
+            now = time()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        metrics = self.ircbot.metrics
+        if wait > 0 and data.split(' ', 1)[0].upper() not in URGENT:
+            metrics.queue.inc()
+            try:
+                sleep(wait)
+            finally:
+                metrics.queue.dec()
+            metrics.queue_wait.observe(wait)
+        else:
+            metrics.queue_wait.observe(0)
+
+        tracer.mark('dequeue')
+
+        return self.func(data)
+
+    def backlog(self):
+        """
+        Return the amount of seconds needed to send the messages currently waiting for a token.
+        """
+        with self.lock:
+            return max(0.0, -self.tokens / self.rate)
+
+    def decrease(self, reason):
+        """
+        Multiplicative decrease of the rate.
+        :param reason: The reason of the decrease.
+        """
+        with self.lock:
+            now = time()
+            if now - self.decreased < self.cooldown:
+                return
+            self.decreased = now
+            rate, self.rate = self.rate, max(self.minrate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+        self.ircbot.warning('send rate decreased from %.2f to %.2f messages/second: %s', rate, self.rate, reason)
+
+    def increase(self):
+        """
+        Additive increase of the rate.
+        """
+        with self.lock:
+            if self.rate >= self.maxrate:
+                return
+            rate, self.rate = self.rate, min(self.maxrate, self.rate + self.step)
+
+        self.ircbot.debug('send rate increased from %.2f to %.2f messages/second', rate, self.rate)
+
+    def tick(self):
+        """
+        Periodically adjust the rate according to the lag with the IRC server.
+        """
+        lag = self.ircbot.lag.lag()
+        growing = lag is not None and self.lastlag is not None and lag > self.lastlag
+        self.lastlag = lag
+        if growing and lag >= self.ircbot.lag.degraded:
+            self.decrease('lag growing (%.2f seconds)' % lag)
+        elif time() - self.decreased >= self.cooldown:
+            self.increase()
@@ -0,0 +1,188 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import inspect
+import threading
+
+from functools import wraps
+from time import time
+
+# the console methods performing RCON round trips (everything else in the parsers ends up calling these)
+RCON_METHODS = ('write', 'writelines')
+
+
+class IRCCallRecord(object):
+    """
+    Account the B3 calls made and the replies sent while executing a command.
+    """
+    __slots__ = ('parent', 'depth', 'storage_calls', 'storage_time', 'rcon_calls', 'rcon_time', 'replies',
+                 'reply_bytes')
+
+    def __init__(self, parent=None):
+        """
+        Create a new IRCCallRecord instance.
+        :param parent: The record of the command being executed by the same thread (for nested executions).
+        """
+        self.parent = parent
+        self.depth = 0
+        self.storage_calls = 0
+        self.storage_time = 0.0
+        self.rcon_calls = 0
+        self.rcon_time = 0.0
+        self.replies = 0
+        self.reply_bytes = 0
+
+    def add(self, kind, elapsed):
+        """
+        Account a B3 call.
+        :param kind: The kind of call ('storage' or 'rcon').
+        :param elapsed: The amount of seconds spent in the call.
+        """
+        if kind == 'storage':
+            self.storage_calls += 1
+            self.storage_time += elapsed
+        else:
+            self.rcon_calls += 1
+            self.rcon_time += elapsed
+
+
+class IRCCommandTimer(object):
+    """
+    Time the B3 storage and RCON calls made by the IRC commands and log the commands slower than a threshold.
+    The B3 storage methods and the console RCON methods are wrapped while the BOT is running: the wrappers only
+    account the calls made by a thread which is executing an IRC command and are a plain pass-through for
+    everything else. The original methods are put back by uninstall.
+    """
+    ircbot = None       # IRC BOT object instance
+    threshold = 1.0     # amount of seconds above which a command execution is logged (0 to disable)
+
+    def __init__(self, ircbot, threshold=1.0):
+        """
+        Create a new IRCCommandTimer instance.
+        :param ircbot: The IRC BOT object instance.
+        :param threshold: The amount of seconds above which a command execution is logged (0 to disable).
+        """
+        self.ircbot = ircbot
+        self.threshold = threshold
+        self.local = threading.local()
+        self.wrapped = []       # list of (object, method name, wrapper, original, whether set on the instance)
+
+    def install(self, console):
+        """
+        Wrap the storage and RCON methods of the given console.
+        :param console: The B3 console (parser) instance.
+        """
+        storage = getattr(console, 'storage', None)
+        if storage is not None:
+            for name, method in inspect.getmembers(storage, inspect.ismethod):
+                if not name.startswith('_'):
+                    self.wrap(storage, name, 'storage')
+        for name in RCON_METHODS:
+            if hasattr(console, name):
+                self.wrap(console, name, 'rcon')
+
+    def uninstall(self):
+        """
+        Put back the original storage and RCON methods.
+        """
+        while self.wrapped:
+            target, name, wrapper, original, own = self.wrapped.pop()
+            if target.__dict__.get(name) is not wrapper:
+                # replaced in the meantime (i.e: by the timer of a newer IRC BOT instance)
+                continue
+            if own:
+                setattr(target, name, original)
+            else:
+                delattr(target, name)
+
+    def wrap(self, target, name, kind):
+        """
+        Replace a method of the given object with a timed one.
+        """
+        method = getattr(target, name)
+        own = name in target.__dict__
+        if getattr(method, 'timed', False):
+            # left there by a previous IRC BOT instance which was not stopped: wrap the original method
+            method, own = method.original, method.own
+
+        local = self.local
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            record = getattr(local, 'record', None)
+            if record is None or record.depth:
+                # not executing a command or nested call (i.e: a storage method calling another one)
+                return method(*args, **kwargs)
+            record.depth += 1
+            start = time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record.depth -= 1
+                record.add(kind, time() - start)
+
+        wrapper.timed = True
+        wrapper.original = method
+        wrapper.own = own
+        setattr(target, name, wrapper)
+        self.wrapped.append((target, name, wrapper, method, own))
+
+    def begin(self):
+        """
+        Start accounting the calls made by the current thread.
+        :return: The IRCCallRecord instance or None if the timer is disabled.
+        """
+        if self.threshold <= 0:
+            return None
+        record = self.local.record = IRCCallRecord(getattr(self.local, 'record', None))
+        return record
+
+    def end(self, record):
+        """
+        Stop accounting the calls made by the current thread.
+        """
+        if record is not None:
+            self.local.record = record.parent
+
+    def reply(self, message):
+        """
+        Account a reply sent by the command being executed in the current thread (if any).
+        """
+        record = getattr(self.local, 'record', None)
+        if record is not None:
+            record.replies += 1
+            record.reply_bytes += len(message)
+
+    def check(self, command, data, elapsed, record, error=None):
+        """
+        Log the command execution if slower than the threshold.
+        :param command: The IRCCommand executed.
+        :param data: The arguments of the command.
+        :param elapsed: The execution time.
+        :param record: The IRCCallRecord of the execution.
+        :param error: The exception raised by the command (if any).
+        :return: True if the command was slow, False otherwise.
+        """
+        if record is None or elapsed < self.threshold:
+            return False
+
+        self.ircbot.warning('slow command %s%s (%.3fs): data<%s> - storage: %.3fs in %d calls - rcon: %.3fs in %d calls '
+                            '- reply: %d bytes in %d lines%s', command.prefix, command.name, elapsed, data,
+                            record.storage_time, record.storage_calls, record.rcon_time, record.rcon_calls,
+                            record.reply_bytes, record.replies, ' - failed: %r' % error if error else '')
+        return True
@@ -0,0 +1,374 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import re
+import resource
+import socket
+import sys
+
+from threading import Event as Flag
+from threading import Lock
+from threading import Thread
+from time import sleep
+from time import time
+from ircbot import __version__ as p_version
+from ircbot.bot import IRCBot
+from ircbot.fakes.console import FakeClient
+from ircbot.fakes.console import FakeEvent
+from ircbot.fakes.plugin import FakePlugin
+from ircbot.irc.server import IRCClient
+from ircbot.irc.server import IRCServer
+from ircbot.tracing import percentile
+
+log = logging.getLogger('ircbot.benchmark')
+
+SCENARIOS = ('say', 'ban', 'kick', 'mapchange', 'commands')
+COMMANDS = ('status', 'lag', 'version')
+CHANNEL = '#bench'
+NICKNAME = 'B3Bot'
+OBSERVER = 'observer'
+
+# every synthetic message carries an identifier so its delivery can be matched
+MARKER = re.compile(r'bench-(\d+)')
+
+
+########################################################################################################################
+##                                                                                                                    ##
+##   IRC SERVER                                                                                                       ##
+##                                                                                                                    ##
+########################################################################################################################
+
+def serve(pipe):
+    """
+    Run the vendored IRC server on a random local port (executed in a separate process
+    so that its CPU usage doesn't pollute the measurements).
+    :param pipe: The pipe where the listening port is written.
+    """
+    for name in ('verbose', 'verbose2'):
+        if not hasattr(logging.Logger, name):
+            setattr(logging.Logger, name, logging.Logger.debug)
+    server = IRCServer(('127.0.0.1', 0), IRCClient)
+    pipe.send(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server():
+    """
+    Start the IRC server process.
+    :return: A (process, port) tuple.
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child,))
+    process.daemon = True
+    process.start()
+    if not parent.poll(10):
+        process.terminate()
+        raise RuntimeError('IRC server did not start')
+    return process, parent.recv()
+
+
+########################################################################################################################
+##                                                                                                                    ##
+##   B3 STAND-INS                                                                                                     ##
+##                                                                                                                    ##
+########################################################################################################################
+
+def create_plugin(port, maxrate=0, burst=5):
+    """
+    Create the IRC BOT plugin stand-in: the benchmarked IRC commands can be used by everyone.
+    :param port: The port of the local IRC server.
+    :param maxrate: The maximum amount of messages per second sent by the BOT (0 to disable the rate limit).
+    :param burst: The amount of messages which can be sent in a burst.
+    :return: A FakePlugin instance.
+    """
+    return FakePlugin(commands=dict((name, 0) for name in COMMANDS), log=log, nickname=NICKNAME, channel=CHANNEL,
+                      servers=[('127.0.0.1', port)], maxrate=maxrate, burst=burst)
+
+
+########################################################################################################################
+##                                                                                                                    ##
+##   OBSERVER                                                                                                         ##
+##                                                                                                                    ##
+########################################################################################################################
+
+class Observer(object):
+    """
+    IRC client sitting in the channel: records when every marked message is delivered.
+    """
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.lock = Lock()
+        self.joined = Flag()
+        self.received = {}      # marker -> delivery time
+        self.replies = []       # delivery times of the notices sent by the BOT
+        self.send('NICK %s' % OBSERVER)
+        self.send('USER %s 0 * :%s' % (OBSERVER, OBSERVER))
+        self.send('JOIN %s' % CHANNEL)
+        thread = Thread(target=self.loop, name='observer')
+        thread.setDaemon(True)
+        thread.start()
+
+    def send(self, line):
+        self.sock.sendall(line + '\r\n')
+
+    def reset(self):
+        with self.lock:
+            self.received = {}
+            self.replies = []
+
+    def loop(self):
+        data = ''
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return
+            now = time()
+            data += chunk
+            lines = data.split('\r\n')
+            data = lines.pop()
+            with self.lock:
+                for line in lines:
+                    self.process(line, now)
+
+    def process(self, line, now):
+        parts = line.split(' ', 3)
+        if len(parts) < 3 or not parts[0].startswith(':%s!' % NICKNAME):
+            return
+        if parts[1] == 'JOIN':
+            self.joined.set()
+        elif parts[1] == 'NOTICE' and parts[2] == OBSERVER:
+            self.replies.append(now)
+        elif parts[1] == 'PRIVMSG':
+            match = MARKER.search(line)
+            if match:
+                self.received.setdefault(int(match.group(1)), now)
+
+    def delivered(self):
+        with self.lock:
+            return len(self.received), len(self.replies)
+
+
+########################################################################################################################
+##                                                                                                                    ##
+##   SCENARIOS                                                                                                        ##
+##                                                                                                                    ##
+########################################################################################################################
+
+def generate(name, plugin, observer, index):
+    """
+    Generate a synthetic message.
+    :param name: The scenario name.
+    :param plugin: The FakePlugin instance.
+    :param observer: The Observer instance.
+    :param index: The marker of the message.
+    """
+    marker = 'bench-%s' % index
+    admin = FakeClient(plugin.console, name='admin')
+    player = FakeClient(plugin.console, name='player')
+    if name == 'say':
+        plugin.onSay(FakeEvent('EVT_CLIENT_SAY', marker, player))
+    elif name == 'ban':
+        plugin.onBan(FakeEvent('EVT_CLIENT_BAN_TEMP', {'admin': admin, 'reason': marker, 'duration': 60}, player))
+    elif name == 'kick':
+        plugin.onKick(FakeEvent('EVT_CLIENT_KICK', {'admin': admin, 'reason': marker}, player))
+    elif name == 'mapchange':
+        plugin.onMapChange(FakeEvent('EVT_GAME_MAP_CHANGE', {'new': marker, 'old': 'ut4_casa'}))
+    elif name == 'commands':
+        observer.send('PRIVMSG %s :!status %s' % (CHANNEL, NICKNAME))
+
+
+def run(name, plugin, observer, count, rate, timeout):
+    """
+    Run a scenario.
+    :param name: The scenario name.
+    :param plugin: The FakePlugin instance.
+    :param observer: The Observer instance.
+    :param count: The amount of messages to generate.
+    :param rate: The amount of messages generated per second (0 for as fast as possible).
+    :param timeout: Amount of seconds to wait for the messages to be delivered once no progress is made.
+    :return: A dict with the results.
+    """
+    observer.reset()
+    sent = []
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time()
+    for index in range(count):
+        if rate > 0:
+            delay = start + index / float(rate) - time()
+            if delay > 0:
+                sleep(delay)
+        sent.append(time())
+        generate(name, plugin, observer, index)
+    generated = time() - start
+
+    # wait for the messages to be delivered
+    last, progress = None, time()
+    while time() - progress < timeout:
+        received, replies = observer.delivered()
+        delivered = replies if name == 'commands' else received
+        if delivered >= count:
+            break
+        if delivered != last:
+            last, progress = delivered, time()
+        sleep(0.01)
+    end = time()
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    with observer.lock:
+        if name == 'commands':
+            # commands are processed in order by the reactor thread and answered with a single notice
+            latencies = [received - sent[index] for index, received in enumerate(observer.replies[:count])]
+            stamps = observer.replies[:count]
+        else:
+            latencies = [received - sent[index] for index, received in observer.received.items() if index < count]
+            stamps = observer.received.values()
+
+    latencies.sort()
+    delivered = len(latencies)
+    elapsed = (max(stamps) if stamps else end) - start
+    cpu = (after.ru_utime + after.ru_stime) - (usage.ru_utime + usage.ru_stime)
+    return {
+        'generated': count,
+        'delivered': delivered,
+        'dropped': count - delivered,
+        'generate_seconds': generated,
+        'seconds': elapsed,
+        'messages_per_second': delivered / elapsed if elapsed > 0 else None,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': latencies[-1] if latencies else None,
+        'cpu_seconds': cpu,
+        'cpu_percent': 100.0 * cpu / (end - start) if end > start else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the results with a baseline.
+    :param results: The results of the current run.
+    :param baseline: The results of a previous run.
+    :param tolerance: The accepted relative degradation (i.e: 0.2 for 20%).
+    :return: A list of regressions (strings).
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        checks = (
+            ('messages_per_second', lambda old, new: new < old * (1 - tolerance)),
+            ('latency_p99', lambda old, new: new > old * (1 + tolerance)),
+            ('dropped', lambda old, new: new > old),
+        )
+        for key, worse in checks:
+            old, new = previous.get(key), current.get(key)
+            if old is not None and new is not None and worse(old, new):
+                regressions.append('%s: %s went from %s to %s' % (name, key, old, new))
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="benchmark the IRC BOT against a local IRC server")
+    parser.add_argument("-s", "--scenario", dest="scenarios", action="append", choices=SCENARIOS,
+                        help="scenario to run (can be repeated) [default = all]")
+    parser.add_argument("-n", "--count", dest="count", default=500, type=int, help="messages per scenario")
+    parser.add_argument("-r", "--rate", dest="rate", default=0, type=float,
+                        help="messages generated per second (0 for as fast as possible)")
+    parser.add_argument("-m", "--maxrate", dest="maxrate", default=0, type=float,
+                        help="connection::maxrate of the BOT (0 to disable the rate limit)")
+    parser.add_argument("-b", "--burst", dest="burst", default=5, type=int, help="connection::burst of the BOT")
+    parser.add_argument("-t", "--timeout", dest="timeout", default=10, type=float,
+                        help="seconds to wait for deliveries once no progress is made")
+    parser.add_argument("-o", "--output", dest="output", default=None, help="write the JSON results to this file")
+    parser.add_argument("--baseline", dest="baseline", default=None, help="JSON results of a previous run")
+    parser.add_argument("--tolerance", dest="tolerance", default=0.2, type=float,
+                        help="accepted relative degradation compared to the baseline")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="verbose logging")
+    return parser.parse_args()
+
+
+def main():
+    options = get_args()
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    for name in ('verbose', 'verbose2'):
+        if not hasattr(logging.Logger, name):
+            setattr(logging.Logger, name, logging.Logger.debug)
+
+    process, port = start_server()
+    try:
+        plugin = create_plugin(port, maxrate=options.maxrate, burst=options.burst)
+        plugin.ircbot = ircbot = IRCBot(plugin=plugin)
+        thread = Thread(target=ircbot.start, name='ircbot')
+        thread.setDaemon(True)
+        thread.start()
+
+        # wait for the BOT to be in the channel before the observer joins
+        deadline = time() + 10
+        while CHANNEL not in ircbot.channels:
+            if time() > deadline:
+                raise RuntimeError('the BOT could not join %s' % CHANNEL)
+            sleep(0.05)
+        for channel in ircbot.channels.values():
+            channel.livechat = True
+
+        observer = Observer(port)
+        while not ircbot.channels[CHANNEL].has_user(OBSERVER):
+            if time() > deadline:
+                raise RuntimeError('the observer could not join %s' % CHANNEL)
+            sleep(0.05)
+
+        results = {
+            'version': p_version,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'count': options.count,
+            'rate': options.rate,
+            'maxrate': options.maxrate,
+            'scenarios': {},
+        }
+        for name in options.scenarios or SCENARIOS:
+            results['scenarios'][name] = run(name, plugin, observer, options.count, options.rate, options.timeout)
+
+        ircbot.disconnect('benchmark done')
+    finally:
+        process.terminate()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    sys.stdout.write(output + '\n')
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.tolerance)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION %s\n' % regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
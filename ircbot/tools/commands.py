@@ -0,0 +1,219 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import argparse
+import cProfile
+import json
+import logging
+import pstats
+import sys
+
+from time import time
+from ircbot.bot import IRCBot
+from ircbot.fakes.console import FakeClient
+from ircbot.fakes.console import FakeConsole
+from ircbot.fakes.console import FakeEvent
+from ircbot.fakes.latency import FakeLatency
+from ircbot.fakes.network import FakeSocket
+from ircbot.fakes.plugin import FakePlugin
+from ircbot.fakes.storage import FakeStorage
+from ircbot.tracing import percentile
+
+log = logging.getLogger('ircbot.commands')
+
+NICKNAME = 'B3Bot'
+CHANNEL = '#bench'
+ADMIN = 'admin'
+
+# IRC commands registered on the BOT
+COMMANDS = ('exec', 'list', 'listbans', 'lookup', 'status')
+
+
+def cases(console):
+    """
+    Build the benchmarked cases: IRC commands are (name, raw line) tuples, B3 events are (name, handler, event) tuples.
+    :param console: The populated FakeConsole instance.
+    """
+    online = console.clients.getList()
+    offline = [client for client in console.storage.clients.values() if client.cid is None and client.name != ADMIN]
+    banned = set(penalty.clientId for penalty in console.storage.penalties)
+    banned = [client for client in offline if client.id in banned] or offline or online
+    player = online[0] if online else FakeClient(console, name='player')
+    admin = FakeClient(console, name=ADMIN)
+
+    result = []
+    for name, command, data in (('lookup slot', 'lookup', player.cid),
+                                ('lookup name', 'lookup', player.name),
+                                ('lookup offline', 'lookup', '@%s' % (offline[0].id if offline else player.id)),
+                                ('listbans', 'listbans', '@%s' % banned[0].id),
+                                ('list', 'list', ''),
+                                ('status', 'status', ''),
+                                ('exec list', 'exec', 'list'),
+                                ('exec leveltest', 'exec', 'leveltest %s' % player.name)):
+        # commands are addressed to the BOT by name
+        result.append((name, ':%s!%s@bench.local PRIVMSG %s :!%s %s %s\r\n' % (ADMIN, ADMIN, CHANNEL, command,
+                                                                               NICKNAME, data)))
+
+    result.extend([
+        ('onSay', 'onSay', FakeEvent('EVT_CLIENT_SAY', 'hello world', player)),
+        ('onBan', 'onBan', FakeEvent('EVT_CLIENT_BAN_TEMP', {'admin': admin, 'reason': '^1camping', 'duration': 60},
+                                     player)),
+        ('onKick', 'onKick', FakeEvent('EVT_CLIENT_KICK', {'admin': admin, 'reason': '^1spam'}, player)),
+        ('onMapChange', 'onMapChange', FakeEvent('EVT_GAME_MAP_CHANGE', {'new': 'ut4_casa', 'old': 'ut4_abbey'})),
+    ])
+    return result
+
+
+def setup(console):
+    """
+    Create an IRC BOT connected to a fake socket, in the channel together with an operator.
+    :param console: The FakeConsole instance.
+    :return: A (plugin, socket) tuple.
+    """
+    plugin = FakePlugin(console=console, commands=dict((name, 0) for name in COMMANDS), log=log, nickname=NICKNAME,
+                        channel=CHANNEL, servers=[('bench', 6667)], maxrate=0, keepalive=0)
+    plugin.ircbot = ircbot = IRCBot(plugin=plugin)
+    sock = FakeSocket()
+    ircbot.connection.connect('bench', 6667, NICKNAME, connect_factory=lambda address: sock)
+    sock.feed(':bench.local 001 %s :Welcome\r\n'
+              ':%s!%s@bench.local JOIN %s\r\n'
+              ':bench.local 353 %s = %s :%s @%s\r\n'
+              ':bench.local 366 %s %s :End of /NAMES list.\r\n' % (NICKNAME, NICKNAME, NICKNAME, CHANNEL, NICKNAME,
+                                                                    CHANNEL, NICKNAME, ADMIN, NICKNAME, CHANNEL))
+    while sock.pending():
+        ircbot.connection.process_data()
+    for channel in ircbot.channels.values():
+        channel.livechat = True
+    return plugin, sock
+
+
+def run(plugin, sock, case, iterations):
+    """
+    Execute a case.
+    :param plugin: The FakePlugin instance.
+    :param sock: The FakeSocket instance of the BOT connection.
+    :param case: The case to execute (see cases()).
+    :param iterations: The amount of executions.
+    :return: A dict with the results.
+    """
+    console = plugin.console
+    rcon, database = console.latency, console.storage.latency
+    rcon.reset()
+    database.reset()
+    sent, sent_bytes = sock.sent, sock.sent_bytes
+    samples = []
+    for _ in range(iterations):
+        start = time()
+        if len(case) == 2:
+            sock.feed(case[1])
+            while sock.pending():
+                plugin.ircbot.connection.process_data()
+        else:
+            getattr(plugin, case[1])(case[2])
+        samples.append(time() - start)
+
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'seconds': sum(samples),
+        'avg_ms': sum(samples) * 1000 / iterations,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': samples[-1] * 1000,
+        'rcon_calls': rcon.calls / float(iterations),
+        'rcon_ms': rcon.slept * 1000 / iterations,
+        'storage_calls': database.calls / float(iterations),
+        'storage_ms': database.slept * 1000 / iterations,
+        'reply_lines': (sock.sent - sent) / float(iterations),
+        'reply_bytes': (sock.sent_bytes - sent_bytes) / float(iterations),
+    }
+
+
+def report(results, out=sys.stdout):
+    """
+    Print the results in a human readable form.
+    """
+    out.write('%-16s %9s %9s %9s %9s %7s %9s %7s %9s %7s\n' % ('case', 'avg ms', 'p50 ms', 'p99 ms', 'max ms', 'rcon',
+                                                              'rcon ms', 'db', 'db ms', 'bytes'))
+    for name, entry in results:
+        out.write('%-16s %9.3f %9.3f %9.3f %9.3f %7.1f %9.2f %7.1f %9.2f %7d\n' % (
+                  name, entry['avg_ms'], entry['p50_ms'], entry['p99_ms'], entry['max_ms'], entry['rcon_calls'],
+                  entry['rcon_ms'], entry['storage_calls'], entry['storage_ms'], entry['reply_bytes']))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="benchmark the IRC BOT commands and B3 event handlers in process "
+                                                 "against a fake B3 console and storage")
+    parser.add_argument("-n", "--iterations", dest="iterations", default=200, type=int, help="executions per case")
+    parser.add_argument("-c", "--case", dest="cases", action="append", help="run only the given case (repeatable)")
+    parser.add_argument("--rcon-latency", dest="rcon", default='0', help="RCON latency in ms (i.e: 30 or 30+-10)")
+    parser.add_argument("--db-latency", dest="database", default='0', help="storage latency in ms (i.e: 5 or 5+-2)")
+    parser.add_argument("--players", dest="players", default=12, type=int, help="online players")
+    parser.add_argument("--stored", dest="stored", default=1000, type=int, help="offline clients in the storage")
+    parser.add_argument("--bans", dest="bans", default=200, type=int, help="bans in the storage")
+    parser.add_argument("--seed", dest="seed", default=0, type=int, help="random seed")
+    parser.add_argument("-p", "--profile", dest="profile", default=None, help="write cProfile stats to this file")
+    parser.add_argument("-j", "--json", dest="json", action="store_true", help="print the results as JSON")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="verbose logging")
+    return parser.parse_args()
+
+
+def main():
+    options = get_args()
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    for name in ('verbose', 'verbose2'):
+        if not hasattr(logging.Logger, name):
+            setattr(logging.Logger, name, logging.Logger.debug)
+
+    try:
+        rcon = FakeLatency.parse(options.rcon, options.seed)
+        database = FakeLatency.parse(options.database, options.seed)
+    except ValueError, e:
+        sys.stderr.write('%s\n' % e)
+        raise SystemExit(2)
+
+    console = FakeConsole(rcon=rcon, storage=FakeStorage(latency=database))
+    console.populate(players=options.players, stored=options.stored, bans=options.bans, seed=options.seed)
+    plugin, sock = setup(console)
+
+    selected = [case for case in cases(console) if not options.cases or case[0] in options.cases]
+    if not selected:
+        sys.stderr.write('no case matching %s\n' % ', '.join(options.cases))
+        raise SystemExit(2)
+
+    profiler = cProfile.Profile() if options.profile else None
+    if profiler:
+        profiler.enable()
+    results = [(case[0], run(plugin, sock, case, options.iterations)) for case in selected]
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(options.profile)
+
+    if options.json:
+        json.dump(dict(results), sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(results)
+        if profiler:
+            sys.stdout.write('\n')
+            pstats.Stats(options.profile, stream=sys.stdout).sort_stats('cumulative').print_stats(20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+import argparse
+import json
+import logging
+import resource
+import sys
+
+from time import time
+from ircbot.bot import IRCBot
+from ircbot.capture import MAGIC
+from ircbot.capture import IRCCaptureReader
+from ircbot.fakes.network import FakeSocket
+from ircbot.fakes.plugin import FakePlugin
+
+log = logging.getLogger('ircbot.replay')
+
+
+def load(path):
+    """
+    Load the lines to be replayed.
+    :param path: A capture file (see capture.py) or a B3 log file written with settings::dev enabled.
+    :return: A (nickname, lines) tuple: nickname is None when not known.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+
+    if header.startswith(MAGIC):
+        reader = IRCCaptureReader(path)
+        return reader.nickname, [line for offset, line in reader]
+
+    # B3 log: the patched _process_line logs every received line as [DEV] <line>
+    lines = []
+    with open(path, 'rb') as f:
+        for line in f:
+            index = line.find('[DEV] ')
+            if index >= 0:
+                lines.append(line[index + 6:].rstrip('\r\n'))
+    return None, lines
+
+
+def instrument(ircbot, stats):
+    """
+    Wrap every global handler registered on the reactor to measure the time spent in it.
+    :param ircbot: The IRCBot instance.
+    :param stats: A dict which will be filled with name -> [calls, seconds] entries.
+    """
+    def timed(callback):
+        name = getattr(callback, '__name__', repr(callback))
+
+        def wrapper(connection, event):
+            start = time()
+            try:
+                return callback(connection, event)
+            finally:
+                key = name
+                if name == '_dispatcher' and hasattr(ircbot, 'on_%s' % event.type):
+                    # account the time spent in the on_<event> methods separately
+                    key = 'on_%s' % event.type
+                entry = stats.setdefault(key, [0, 0.0])
+                entry[0] += 1
+                entry[1] += time() - start
+        return wrapper
+
+    handlers = ircbot.reactor.handlers
+    for event_type in handlers:
+        handlers[event_type] = [handler._replace(callback=timed(handler.callback)) for handler in handlers[event_type]]
+
+
+def replay(lines, nickname, channel, repeat=1, chunk=16384):
+    """
+    Feed the given lines through ServerConnection and the IRCBot handlers.
+    :param lines: The raw lines to replay.
+    :param nickname: The nickname of the BOT.
+    :param channel: The channel the BOT is supposed to join.
+    :param repeat: How many times the lines are replayed.
+    :param chunk: The size of the chunks read from the fake socket.
+    :return: A dict with the results.
+    """
+    # no rate limit: replay at full speed
+    plugin = FakePlugin(log=log, nickname=nickname, channel=channel, servers=[('replay', 6667)], maxrate=0, keepalive=0)
+    ircbot = IRCBot(plugin=plugin)
+    stats = {}
+    instrument(ircbot, stats)
+
+    data = ''.join(line + '\r\n' for line in lines) * repeat
+    sock = FakeSocket(data, chunk)
+    connection = ircbot.connection
+    connection.connect('replay', 6667, nickname, connect_factory=lambda address: sock)
+    sent, sent_bytes = sock.sent, sock.sent_bytes
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time()
+    while sock.pending():
+        connection.process_data()
+    elapsed = time() - start
+
+    total = len(lines) * repeat
+    return {
+        'lines': total,
+        'bytes': len(data),
+        'seconds': elapsed,
+        'lines_per_second': total / elapsed if elapsed else None,
+        'events': sum(counter.value for value, counter in ircbot.metrics.events.series()),
+        'sent_lines': sock.sent - sent,
+        'sent_bytes': sock.sent_bytes - sent_bytes,
+        'maxrss_kb_before': maxrss,
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'channels': dict((name, len(channel_.userdict)) for name, channel_ in ircbot.channels.items()),
+        'handlers': dict((name, {'calls': calls, 'seconds': seconds}) for name, (calls, seconds) in stats.items()),
+    }
+
+
+def report(results, out=sys.stdout):
+    """
+    Print the replay results in a human readable form.
+    """
+    out.write('replayed %(lines)s lines (%(bytes)s bytes) in %(seconds).3f seconds: %(lines_per_second).0f lines/sec\n'
+              % results)
+    out.write('events dispatched: %(events)s - lines sent: %(sent_lines)s (%(sent_bytes)s bytes)\n' % results)
+    out.write('peak memory: %(maxrss_kb)s KB (%(maxrss_kb_before)s KB before replaying)\n' % results)
+    for name, users in sorted(results['channels'].items()):
+        out.write('channel %s: %s users\n' % (name, users))
+    out.write('\n%-32s %10s %12s %10s\n' % ('handler', 'calls', 'total ms', 'avg us'))
+    for name, entry in sorted(results['handlers'].items(), key=lambda x: x[1]['seconds'], reverse=True):
+        out.write('%-32s %10s %12.2f %10.2f\n' % (name, entry['calls'], entry['seconds'] * 1000,
+                                                  entry['seconds'] * 1000000 / entry['calls']))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="replay recorded IRC traffic through the IRC BOT handlers")
+    parser.add_argument("path", help="capture file (settings::capture_file) or B3 log written in dev mode")
+    parser.add_argument("-n", "--nickname", dest="nickname", default=None, help="nickname of the BOT")
+    parser.add_argument("-c", "--channel", dest="channel", default='#replay', help="channel of the BOT")
+    parser.add_argument("-r", "--repeat", dest="repeat", default=1, type=int, help="replay the traffic N times")
+    parser.add_argument("-k", "--chunk", dest="chunk", default=16384, type=int, help="socket read size")
+    parser.add_argument("-j", "--json", dest="json", action="store_true", help="print the results as JSON")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="verbose logging")
+    return parser.parse_args()
+
+
+def main():
+    options = get_args()
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    for name in ('verbose', 'verbose2'):
+        if not hasattr(logging.Logger, name):
+            setattr(logging.Logger, name, logging.Logger.debug)
+
+    nickname, lines = load(options.path)
+    if not lines:
+        sys.stderr.write('no line found in %s\n' % options.path)
+        raise SystemExit(1)
+
+    results = replay(lines, options.nickname or nickname or 'ircbot', options.channel, options.repeat,
+                     options.chunk)
+    if options.json:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(results)
+
+
+if __name__ == "__main__":
+    main()
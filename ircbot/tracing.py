@@ -0,0 +1,208 @@
+#
+# IRC BOT Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2014 Daniele Pantaleone <fenix@bigbrotherbot.net>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import deque
+from random import random
+from threading import Lock
+from threading import local
+from time import localtime
+from time import strftime
+from time import time
+
+# stages a message goes through in chronological order
+STAGES = ('event', 'handler', 'format', 'enqueue', 'dequeue', 'write')
+
+# (name, start stage, end stage) of the intervals reported
+INTERVALS = (
+    ('b3', 'event', 'handler'),             # B3 event queue (B3 event times have a 1 second resolution)
+    ('format', 'handler', 'format'),        # message formatting
+    ('notify', 'format', 'enqueue'),        # channel selection and line wrapping
+    ('throttle', 'enqueue', 'dequeue'),     # rate limit
+    ('send', 'dequeue', 'write'),           # until the last line is written (includes rate limit of following lines)
+    ('total', 'event', 'write'),
+)
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile of a sorted list of values.
+    :param values: A sorted list of values.
+    :param p: The percentile (0-100).
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+class IRCTrace(object):
+    """
+    Timestamps of the stages an outbound message went through.
+    """
+    __slots__ = ('kind', 'stamps', 'lines')
+
+    def __init__(self, kind, origin=None):
+        """
+        Create a new IRCTrace instance.
+        :param kind: The kind of message being traced (i.e: showbans).
+        :param origin: The time of the event originating the message.
+        """
+        now = time()
+        self.kind = kind
+        self.stamps = {'event': origin if origin is not None else now, 'handler': now}
+        self.lines = 0
+
+    def mark(self, stage):
+        """
+        Record the time a stage has been reached: only the first time is kept for every stage but
+        the socket write (a message may be split in multiple lines: the last write is kept).
+        :param stage: The stage name.
+        """
+        if stage == 'write':
+            self.stamps[stage] = time()
+            self.lines += 1
+        elif stage not in self.stamps:
+            self.stamps[stage] = time()
+
+    def interval(self, start, end):
+        """
+        Return the amount of seconds between two stages or None if any of them has not been reached.
+        """
+        if start in self.stamps and end in self.stamps:
+            return max(0.0, self.stamps[end] - self.stamps[start])
+        return None
+
+    def __repr__(self):
+        """
+        String object representation.
+        :return: A string representing this object.
+        """
+        return '%s<%s> : %s' % (self.__class__.__name__, self.kind, ' : '.join(
+                                '%s<%s>' % (stage, self.stamps[stage]) for stage in STAGES if stage in self.stamps))
+
+
+class IRCTracer(object):
+    """
+    Follow outbound messages from the B3 event originating them to the socket write.
+    The trace is bound to the thread handling the event (the same thread formats the message,
+    waits for the rate limit and writes it to the socket). Completed traces are kept in a ring.
+    """
+    ircbot = None           # IRC BOT object instance
+    rate = 0.1              # fraction of the messages being traced when sampled
+    collected = None        # traces completed since the last summary (None if summaries are disabled)
+    backlog = 10000         # maximum amount of traces collected between two summaries
+
+    def __init__(self, ircbot, rate=0.1, size=100, collect=True):
+        """
+        Create a new IRCTracer instance.
+        :param ircbot: The IRC BOT object instance.
+        :param rate: The fraction of the messages being traced when sampled (0-1).
+        :param size: The amount of completed traces to keep.
+        :param collect: Whether to collect the completed traces for the periodic summary.
+        """
+        self.ircbot = ircbot
+        self.rate = rate
+        self.traces = deque(maxlen=size)
+        self.collected = deque(maxlen=self.backlog) if collect else None
+        self.local = local()
+        self.lock = Lock()
+
+    def begin(self, kind, origin=None, sample=True):
+        """
+        Start tracing the message being generated by the current thread.
+        :param kind: The kind of message being traced (i.e: showbans).
+        :param origin: The time of the event originating the message.
+        :param sample: Whether to trace only a fraction of the messages (False to always trace it).
+        """
+        if sample and (self.rate <= 0 or random() >= self.rate):
+            self.local.trace = None
+            return
+        self.local.trace = IRCTrace(kind, origin)
+
+    def mark(self, stage):
+        """
+        Record the time the message being traced by the current thread reached a stage.
+        :param stage: The stage name.
+        """
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace.mark(stage)
+
+    def end(self):
+        """
+        Complete the trace of the current thread.
+        """
+        trace = getattr(self.local, 'trace', None)
+        if trace is None:
+            return
+
+        self.local.trace = None
+        with self.lock:
+            self.traces.append(trace)
+            if self.collected is not None:
+                self.collected.append(trace)
+
+    def recent(self, count):
+        """
+        Return the most recent completed traces.
+        :param count: The maximum amount of traces to return.
+        """
+        with self.lock:
+            return list(self.traces)[-count:]
+
+    def percentiles(self, traces):
+        """
+        Compute the percentiles of every interval.
+        :param traces: A list of IRCTrace objects.
+        :return: A list of (name, p50, p95, max) tuples for the intervals having samples.
+        """
+        result = []
+        for name, start, end in INTERVALS:
+            values = sorted(x for x in (trace.interval(start, end) for trace in traces) if x is not None)
+            if values:
+                result.append((name, percentile(values, 50), percentile(values, 95), values[-1]))
+        return result
+
+    def summary(self):
+        """
+        Log the percentiles of the traces completed since the last summary.
+        """
+        with self.lock:
+            if not self.collected:
+                return
+            traces, self.collected = list(self.collected), deque(maxlen=self.backlog)
+
+        self.ircbot.info('latency of %s traced messages: %s', len(traces), ' : '.join(
+                         '%s<p50 %.3fs p95 %.3fs max %.3fs>' % x for x in self.percentiles(traces)))
+
+    @staticmethod
+    def format(trace):
+        """
+        Return a human readable description of a trace.
+        :param trace: The IRCTrace object.
+        """
+        parts = []
+        for name, start, end in INTERVALS:
+            value = trace.interval(start, end)
+            if value is not None:
+                parts.append('%s: %.1fms' % (name, value * 1000))
+        if 'queued' in trace.stamps:
+            parts.append('queued while disconnected')
+        elif 'write' not in trace.stamps:
+            parts.append('not sent')
+        return '%s %s (%s lines) - %s' % (strftime('%H:%M:%S', localtime(trace.stamps['handler'])), trace.kind,
+                                          trace.lines, ' - '.join(parts))